@@ -1,6 +1,8 @@
 import org.apache.lucene.document.Document;
 import org.apache.lucene.index.DirectoryReader;
 import org.apache.lucene.index.IndexReader;
+import org.apache.lucene.index.LeafReader;
+import org.apache.lucene.index.LeafReaderContext;
 import org.apache.lucene.index.MultiDocValues;
 import org.apache.lucene.index.SortedSetDocValues;
 import org.apache.lucene.search.BooleanClause;
@@ -11,6 +13,7 @@ import org.apache.lucene.search.ScoreDoc;
 import org.apache.lucene.search.TopDocs;
 import org.apache.lucene.store.Directory;
 import org.apache.lucene.store.FSDirectory;
+import org.apache.lucene.util.Bits;
 import org.apache.lucene.util.BytesRef;
 
 import com.google.gson.Gson;
@@ -21,8 +24,12 @@ import java.io.IOException;
 import java.nio.file.Files;
 import java.nio.file.Path;
 import java.util.ArrayList;
+import java.util.HashMap;
 import java.util.HashSet;
+import java.util.LinkedHashMap;
 import java.util.List;
+import java.util.Map;
+import java.util.PriorityQueue;
 import java.util.Set;
 import java.util.TreeSet;
 
@@ -121,7 +128,7 @@ public class CodeSearcher {
         this.top_k = top_k;
     }
     
-    private class QueryFormat {
+    public static class QueryFormat {
         String sig;
         String[] function;
         String[] field;
@@ -132,14 +139,13 @@ public class CodeSearcher {
         }
     }
 
-    @SuppressWarnings("unused")
-    private class ResultFormat {
+    public static class ResultFormat {
         public String class_fqn;
         public String signature;
         public Set<String> related_func;
-        private String file;
-        private int start;
-        private int end;
+        public String file;
+        public int start;
+        public int end;
         public float score;
         public ResultFormat(String fqn, String sig, String relf, String file, int start, int end, float score) {
             this.class_fqn = fqn;
@@ -301,13 +307,199 @@ public class CodeSearcher {
     public JsonArray getResultList() {
         // transform the result set to JsonArray and only keep the top k results
         System.out.println(this.results.size()+" results found.");
+        JsonArray result_list = new Gson().toJsonTree(getTopResults()).getAsJsonArray();
+        return result_list;
+    }
+
+    /**
+     * keep the top k results in the result set, results with score 1 are the query itself
+     */
+    private List<ResultFormat> getTopResults() {
         List<ResultFormat> topResults = new ArrayList<>(this.results);
         topResults.removeIf(result -> result.score == 1);
-        topResults = topResults.subList(0, Math.min(topResults.size(), this.top_k));
-        JsonArray result_list = new Gson().toJsonTree(topResults).getAsJsonArray();
-        return result_list;
+        return new ArrayList<>(topResults.subList(0, Math.min(topResults.size(), this.top_k)));
     }
-    
+
+    /**
+     * Search with an opened searcher, used by long-lived sessions (e.g. from python through JPype).
+     * The result set is reset before searching, so one searcher can serve many focal methods.
+     * @param queries queries of one focal method
+     * @return top k results of the queries
+     */
+    public List<ResultFormat> searchSimilar(QueryFormat[] queries) throws IOException {
+        setResultSet();
+        for (QueryFormat query : queries) {
+            search(query);
+        }
+        return getTopResults();
+    }
+
+    /**
+     * Search queries of several focal methods in a single pass over the index.
+     * The DocValues and stored fields of each document are read once and shared by all queries,
+     * scores are the same as {@link #search(QueryFormat)}: w_c * J(calls) + w_f * J(fields).
+     * @param ids ids of focal methods
+     * @param query_lists queries of each focal method, in the same order as ids
+     * @return top k results of each focal method, keyed by id
+     */
+    public Map<String, List<ResultFormat>> searchBatch(String[] ids, QueryFormat[][] query_lists) throws IOException {
+        if (ids.length != query_lists.length) {
+            throw new IllegalArgumentException("ids and query lists should have the same length!");
+        }
+        // flatten the queries, owner[q] is the index of the focal method of query q
+        List<QueryFormat> queries = new ArrayList<>();
+        List<Integer> owners = new ArrayList<>();
+        for (int i = 0; i < query_lists.length; i++) {
+            for (QueryFormat query : query_lists[i]) {
+                queries.add(query);
+                owners.add(i);
+            }
+        }
+        int query_num = queries.size();
+        List<PriorityQueue<ScoreDoc>> hits = new ArrayList<>(query_num);
+        for (int q = 0; q < query_num; q++) {
+            hits.add(new PriorityQueue<>(top_k + 1, CodeSearcher::compareHit));
+        }
+        // the first matched documents fill up the results of queries with less than k scored documents
+        List<Integer> first_docs = new ArrayList<>(top_k);
+        int[] call_inter = new int[query_num];
+        int[] field_inter = new int[query_num];
+        int[] touched = new int[query_num];
+
+        for (LeafReaderContext leaf : index_reader.leaves()) {
+            LeafReader reader = leaf.reader();
+            SortedSetDocValues leaf_func = reader.getSortedSetDocValues("cfunc_dv");
+            SortedSetDocValues leaf_field = reader.getSortedSetDocValues("cfield_dv");
+            if (leaf_func == null && leaf_field == null) continue;
+            Map<Long, int[]> func_postings = invertQueries(leaf_func, queries, true);
+            Map<Long, int[]> field_postings = invertQueries(leaf_field, queries, false);
+            Bits live_docs = reader.getLiveDocs();
+            for (int doc = 0; doc < reader.maxDoc(); doc++) {
+                if (live_docs != null && !live_docs.get(doc)) continue;
+                boolean has_func = leaf_func != null && leaf_func.advanceExact(doc);
+                boolean has_field = leaf_field != null && leaf_field.advanceExact(doc);
+                if (!has_func && !has_field) continue;
+                int global_doc = leaf.docBase + doc;
+                if (first_docs.size() < top_k) first_docs.add(global_doc);
+                int touched_num = 0;
+                int func_count = has_func ? leaf_func.docValueCount() : 0;
+                for (int i = 0; i < func_count; i++) {
+                    int[] postings = func_postings.get(leaf_func.nextOrd());
+                    if (postings == null) continue;
+                    for (int q : postings) {
+                        if (call_inter[q] == 0 && field_inter[q] == 0) touched[touched_num++] = q;
+                        call_inter[q]++;
+                    }
+                }
+                int field_count = has_field ? leaf_field.docValueCount() : 0;
+                for (int i = 0; i < field_count; i++) {
+                    int[] postings = field_postings.get(leaf_field.nextOrd());
+                    if (postings == null) continue;
+                    for (int q : postings) {
+                        if (call_inter[q] == 0 && field_inter[q] == 0) touched[touched_num++] = q;
+                        field_inter[q]++;
+                    }
+                }
+                for (int t = 0; t < touched_num; t++) {
+                    int q = touched[t];
+                    QueryFormat query = queries.get(q);
+                    double score = 0;
+                    if (call_inter[q] > 0) score += jaccard(call_inter[q], query.function.length, func_count, w_c);
+                    if (field_inter[q] > 0) score += jaccard(field_inter[q], query.field.length, field_count, w_f);
+                    PriorityQueue<ScoreDoc> query_hits = hits.get(q);
+                    query_hits.add(new ScoreDoc(global_doc, (float) score));
+                    if (query_hits.size() > top_k) query_hits.poll();
+                    call_inter[q] = 0;
+                    field_inter[q] = 0;
+                }
+            }
+        }
+
+        // collect results of each focal method
+        Map<Integer, Document> doc_cache = new HashMap<>();
+        List<List<ResultFormat>> method_results = new ArrayList<>(ids.length);
+        for (int i = 0; i < ids.length; i++) method_results.add(new ArrayList<>());
+        for (int q = 0; q < query_num; q++) {
+            List<ScoreDoc> top_docs = new ArrayList<>(hits.get(q));
+            Set<Integer> scored = new HashSet<>();
+            for (ScoreDoc sd : top_docs) scored.add(sd.doc);
+            for (int doc : first_docs) {
+                if (top_docs.size() >= top_k) break;
+                if (!scored.contains(doc)) top_docs.add(new ScoreDoc(doc, 0f));
+            }
+            top_docs.sort(CodeSearcher::compareHit);
+            java.util.Collections.reverse(top_docs);
+            for (ScoreDoc sd : top_docs) {
+                Document doc = doc_cache.get(sd.doc);
+                if (doc == null) {
+                    doc = index_searcher.storedFields().document(sd.doc);
+                    doc_cache.put(sd.doc, doc);
+                }
+                method_results.get(owners.get(q)).add(new ResultFormat(doc.get("class_fqn"),
+                        doc.get("signature"),
+                        queries.get(q).sig,
+                        doc.get("file"),
+                        Integer.parseInt(doc.get("start")),
+                        Integer.parseInt(doc.get("end")),
+                        sd.score));
+            }
+        }
+        Map<String, List<ResultFormat>> group_results = new LinkedHashMap<>();
+        for (int i = 0; i < ids.length; i++) {
+            setResultSet();
+            this.results.addAll(method_results.get(i));
+            group_results.put(ids[i], getTopResults());
+        }
+        setResultSet();
+        return group_results;
+    }
+
+    /**
+     * order of hits in the min-heap: lower score first, for the same score, later document first
+     */
+    private static int compareHit(ScoreDoc a, ScoreDoc b) {
+        int cmp = Float.compare(a.score, b.score);
+        return cmp != 0 ? cmp : Integer.compare(b.doc, a.doc);
+    }
+
+    /**
+     * J = |I| / (|Q| + |D| - |I|), weighted as in JaccardScorer
+     */
+    private static float jaccard(int intersection, int query_size, int doc_size, float weight) {
+        int union = query_size + doc_size - intersection;
+        double jaccard = (union == 0 ? 0.0 : (double) intersection / union);
+        return (float) (jaccard * weight);
+    }
+
+    /**
+     * map the ordinals of query terms in a segment to the queries containing them
+     */
+    private Map<Long, int[]> invertQueries(SortedSetDocValues dv, List<QueryFormat> queries, boolean is_func) throws IOException {
+        Map<Long, int[]> postings = new HashMap<>();
+        if (dv == null) return postings;
+        Map<String, Long> term_ords = new HashMap<>();
+        Map<Long, List<Integer>> ord_queries = new HashMap<>();
+        for (int q = 0; q < queries.size(); q++) {
+            String[] terms = is_func ? queries.get(q).function : queries.get(q).field;
+            Set<Long> query_ords = new HashSet<>();
+            for (String term : terms) {
+                Long ord = term_ords.get(term);
+                if (ord == null) {
+                    ord = dv.lookupTerm(new BytesRef(term));
+                    term_ords.put(term, ord);
+                }
+                if (ord >= 0) query_ords.add(ord);
+            }
+            for (Long ord : query_ords) {
+                ord_queries.computeIfAbsent(ord, k -> new ArrayList<>()).add(q);
+            }
+        }
+        for (Map.Entry<Long, List<Integer>> entry : ord_queries.entrySet()) {
+            postings.put(entry.getKey(), entry.getValue().stream().mapToInt(Integer::intValue).toArray());
+        }
+        return postings;
+    }
+
     /**
      * Close the index reader and directory
      * @throws IOException If an error occurs during closing
@@ -5,9 +5,12 @@ import org.apache.lucene.document.Field;
 import org.apache.lucene.document.SortedSetDocValuesField;
 import org.apache.lucene.document.StoredField;
 import org.apache.lucene.document.StringField;
+import org.apache.lucene.index.DirectoryReader;
 import org.apache.lucene.index.IndexWriter;
 import org.apache.lucene.index.IndexWriterConfig;
 import org.apache.lucene.index.IndexWriterConfig.OpenMode;
+import org.apache.lucene.index.LeafReaderContext;
+import org.apache.lucene.index.Term;
 import org.apache.lucene.store.Directory;
 import org.apache.lucene.store.FSDirectory;
 import org.apache.lucene.util.BytesRef;
@@ -24,7 +27,10 @@ import java.io.InputStreamReader;
 import java.nio.file.Files;
 import java.nio.file.Path;
 import java.nio.file.Paths;
+import java.util.Arrays;
+import java.util.HashSet;
 import java.util.Map;
+import java.util.Set;
 
 /**
  * Index Builder class - used to add documents and build Lucene index
@@ -39,7 +45,7 @@ public class IndexBuilder {
     public static void main(String[] args) {
         int arg_len = args.length;
         if (arg_len < 3) {
-            throw new IllegalArgumentException("Arguments for IndexBuilder:<mode> <project path> <index path>");
+            throw new IllegalArgumentException("Arguments for IndexBuilder:<mode> <project path> <index path> [<class> ...]");
         }
         String mode = args[0];
         Path code_path = Paths.get(args[1]);
@@ -54,8 +60,13 @@ public class IndexBuilder {
             }
             IndexBuilder builder = new IndexBuilder(code_path, index_path);
             builder.startGroup();
+        } else if (mode.equals("update")) {
+            // update the documents of the given classes of a project index
+            IndexBuilder builder = new IndexBuilder(code_path, index_path);
+            Set<String> classes = new HashSet<>(Arrays.asList(args).subList(3, arg_len));
+            builder.startUpdate(code_path, index_path, classes);
         } else {
-            throw new IllegalArgumentException("Usage for mode: single or group" + mode);
+            throw new IllegalArgumentException("Usage for mode: single, group or update" + mode);
         }
     }
 
@@ -72,6 +83,13 @@ public class IndexBuilder {
      * Parse the source code info from json file
      */
     protected void ParseSourceCodeInfo(Path file_path){
+        ParseSourceCodeInfo(file_path, null);
+    }
+
+    /**
+     * Parse the source code info of some classes from json file, all classes if classes is null
+     */
+    protected void ParseSourceCodeInfo(Path file_path, Set<String> classes){
         JsonObject code_info;
         try{
             code_info = loadJson(file_path).getAsJsonObject();
@@ -83,6 +101,7 @@ public class IndexBuilder {
         JsonObject source_info = code_info.getAsJsonObject("source");
         for (Map.Entry<String, JsonElement> class_entry : source_info.entrySet()) {
             String class_fqn = class_entry.getKey();
+            if (classes != null && !classes.contains(class_fqn)) continue;
             JsonObject class_info = class_entry.getValue().getAsJsonObject();
             String file = class_info.get("file").getAsString();
             JsonObject methods = class_info.get("methods").getAsJsonObject();
@@ -126,6 +145,8 @@ public class IndexBuilder {
         
         // Add non-tokenized field (for exact match)
         document.add(new StoredField("class_fqn", class_fqn));
+        // indexed class name, documents of a class are replaced when the class is updated
+        document.add(new StringField("class_key", class_fqn, Field.Store.NO));
         document.add(new StoredField("signature", func_sig));
         document.add(new StoredField("file", file));
         document.add(new StoredField("start", start));
@@ -179,6 +200,45 @@ public class IndexBuilder {
         return;
     }
 
+    /**
+     * replace the documents of the given classes in an existing index,
+     * the whole project is indexed again if the index is empty or was built without class keys
+     */
+    public void startUpdate(Path code, Path index, Set<String> classes) {
+        this.analyzer = new StandardAnalyzer();
+        IndexWriterConfig config = new IndexWriterConfig(analyzer);
+        config.setOpenMode(OpenMode.CREATE_OR_APPEND);
+        try {
+            if (!Files.exists(index)) Files.createDirectories(index);
+            this.directory = FSDirectory.open(index);
+            this.index_writer = new IndexWriter(directory, config);
+            if (hasClassKeys()) {
+                for (String class_fqn : classes) {
+                    index_writer.deleteDocuments(new Term("class_key", class_fqn));
+                }
+                ParseSourceCodeInfo(code, classes);
+            } else {
+                index_writer.deleteAll();
+                ParseSourceCodeInfo(code);
+            }
+            close();
+        } catch (IOException e) {
+            System.out.println("Failed while update index: " + index);
+            System.out.println(e.getMessage());
+        }
+        return;
+    }
+
+    private boolean hasClassKeys() throws IOException {
+        try (DirectoryReader reader = DirectoryReader.open(index_writer)) {
+            if (reader.numDocs() == 0) return false;
+            for (LeafReaderContext leaf : reader.leaves()) {
+                if (leaf.reader().terms("class_key") != null) return true;
+            }
+        }
+        return false;
+    }
+
     public void startGroup() {
         try {
             Files.list(code_info_path).forEach(file_path -> {
@@ -1,6 +1,9 @@
 import com.google.gson.Gson;
 import com.google.gson.GsonBuilder;
+import com.google.gson.JsonArray;
+import com.google.gson.JsonElement;
 import com.google.gson.JsonObject;
+import com.google.gson.JsonParser;
 
 import codegraph.ControlFlowGraphBuilder;
 import extractor.CodeInfoExtractor;
@@ -9,6 +12,13 @@ import java.io.IOException;
 import java.nio.file.Files;
 import java.nio.file.Path;
 import java.nio.file.Paths;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Map;
+import java.util.Set;
+import java.util.TreeSet;
 
 public class PreProcessor {
     public static void main(String[] args) {
@@ -54,16 +64,84 @@ public class PreProcessor {
             Path projectDir = project_dir;
             if (project_name.equals("gson")) 
                 projectDir = project_dir.resolve("gson");
-            Path json_path = output_dir.resolve("json/" + project_name + ".json");
-            Path cfg_path = output_dir.resolve("codegraph/" + project_name + "_controlflow.json");
-            System.out.println("process project: " + project_name);
-            extractProjectStructure(project_name, projectDir, json_path);
-            buildControlflowFlowGraph(projectDir, cfg_path);
+            processSingleProject(project_name, projectDir);
         });
         long end = System.currentTimeMillis();
         System.out.println("Time Cost:" + (end - start) + "ms");
     }
 
+    public void processSingleProject(String project_name, Path project_dir) {
+        Path json_path = output_dir.resolve("json/" + project_name + ".json");
+        Path cfg_path = output_dir.resolve("codegraph/" + project_name + "_controlflow.json");
+        System.out.println("process project: " + project_name);
+        extractProjectStructure(project_name, project_dir, json_path);
+        buildControlflowFlowGraph(project_dir, cfg_path);
+    }
+
+    /**
+     * re-extract code info & control flow graphs of changed source files of a project,
+     * classes of changed & removed files are replaced in {project}.json and {project}_controlflow.json
+     * @param changed_files changed or added files, relative to src/main/java
+     * @param removed_files removed files, relative to src/main/java
+     * @return class names whose info was removed or re-extracted
+     */
+    public String[] updateProject(String project_name, Path project_dir, String[] changed_files, String[] removed_files) throws IOException {
+        long start = System.currentTimeMillis();
+        Path json_path = output_dir.resolve("json/" + project_name + ".json");
+        Path cfg_path = output_dir.resolve("codegraph/" + project_name + "_controlflow.json");
+        Path source_folder = project_dir.resolve("src/main/java");
+        JsonObject project_json = JsonParser.parseString(Files.readString(json_path)).getAsJsonObject();
+        JsonObject cfg_json = Files.exists(cfg_path)
+                ? JsonParser.parseString(Files.readString(cfg_path)).getAsJsonObject()
+                : new JsonObject();
+
+        Set<String> stale_files = new HashSet<>(Arrays.asList(changed_files));
+        stale_files.addAll(Arrays.asList(removed_files));
+        Set<String> affected_classes = new TreeSet<>();
+        JsonObject source_json = project_json.getAsJsonObject("source");
+        for (String class_fqn : new ArrayList<>(source_json.keySet())) {
+            String file = source_json.getAsJsonObject(class_fqn).get("file").getAsString().replace('\\', '/');
+            if (!stale_files.contains(file)) continue;
+            source_json.remove(class_fqn);
+            cfg_json.remove(class_fqn);
+            affected_classes.add(class_fqn);
+        }
+
+        if (changed_files.length > 0) {
+            List<Path> files = new ArrayList<>();
+            List<String> file_names = new ArrayList<>();
+            for (String file : changed_files) {
+                files.add(source_folder.resolve(file));
+                file_names.add(source_folder.resolve(file).toString());
+            }
+            CodeInfoExtractor codeInfoExtractor = new CodeInfoExtractor();
+            JsonObject[] codeInfo = codeInfoExtractor.processFiles(source_folder, project_dir.resolve("libs"), files);
+            for (Map.Entry<String, JsonElement> entry : codeInfo[0].entrySet()) {
+                source_json.add(entry.getKey(), entry.getValue());
+                affected_classes.add(entry.getKey());
+            }
+            // import statements of unchanged files are kept
+            JsonObject import_dict = project_json.getAsJsonObject("import_dict");
+            for (Map.Entry<String, JsonElement> entry : codeInfo[1].entrySet()) {
+                JsonArray imports = import_dict.has(entry.getKey()) ? import_dict.getAsJsonArray(entry.getKey()) : new JsonArray();
+                for (JsonElement import_stmt : entry.getValue().getAsJsonArray()) {
+                    if (!imports.contains(import_stmt)) imports.add(import_stmt);
+                }
+                import_dict.add(entry.getKey(), imports);
+            }
+            ControlFlowGraphBuilder cfgBuilder = new ControlFlowGraphBuilder(file_names);
+            for (Map.Entry<String, JsonElement> entry : cfgBuilder.buildGraph4Project().entrySet()) {
+                cfg_json.add(entry.getKey(), entry.getValue());
+            }
+        }
+        Files.writeString(json_path, gson.toJson(project_json));
+        Files.writeString(cfg_path, gson.toJson(cfg_json));
+        long end = System.currentTimeMillis();
+        System.out.println("update project: " + project_name + ", " + changed_files.length + " changed, "
+                + removed_files.length + " removed files, Time Cost:" + (end - start) + "ms");
+        return affected_classes.toArray(new String[0]);
+    }
+
     private void extractProjectStructure(String projectName, Path projectDir, Path json_path){
         JsonObject projectJson = new JsonObject();
         projectJson.addProperty("project", projectName);
@@ -34,6 +34,19 @@ public class ControlFlowGraphBuilder {
         this.gson = new Gson();
     }
 
+    /**
+     * build the model of some source files of a project, types declared in other files are not resolved
+     */
+    public ControlFlowGraphBuilder(List<String> source_files) {
+        Launcher launcher = new Launcher();
+        launcher.getEnvironment().setNoClasspath(true);
+        for (String source_file : source_files) {
+            launcher.addInputResource(source_file);
+        }
+        model = launcher.buildModel();
+        this.gson = new Gson();
+    }
+
     class Edge {
         int source;
         int target;
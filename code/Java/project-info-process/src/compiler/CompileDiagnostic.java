@@ -0,0 +1,29 @@
+package compiler;
+
+/**
+ * A diagnostic of javac, line and column are 1-based (-1 if unknown).
+ */
+public class CompileDiagnostic {
+    public final String kind;
+    public final String file;
+    public final long line;
+    public final long column;
+    public final String code;
+    public final String message;
+    public final String source_line;
+
+    public CompileDiagnostic(String kind, String file, long line, long column, String code, String message, String source_line) {
+        this.kind = kind;
+        this.file = file;
+        this.line = line;
+        this.column = column;
+        this.code = code;
+        this.message = message;
+        this.source_line = source_line;
+    }
+
+    @Override
+    public String toString() {
+        return file + ":" + line + ": " + kind + ": " + code + ": " + message;
+    }
+}
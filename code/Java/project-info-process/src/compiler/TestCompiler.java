@@ -0,0 +1,129 @@
+package compiler;
+
+import javax.tools.Diagnostic;
+import javax.tools.DiagnosticCollector;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileObject;
+import javax.tools.SimpleJavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.StandardLocation;
+import javax.tools.ToolProvider;
+
+import java.io.File;
+import java.io.IOException;
+import java.net.URI;
+import java.net.URISyntaxException;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.Locale;
+import java.util.Map;
+import java.util.concurrent.ConcurrentHashMap;
+
+/**
+ * Resident javac for the test classes of a project, same as
+ * `javac -cp @dependencies.txt -d target/test-classes <source>` in the project root.
+ * The classpath is parsed once and the file manager (with its opened jars) is reused.
+ */
+public class TestCompiler {
+    private static final Map<String, TestCompiler> compilers = new ConcurrentHashMap<>();
+
+    public static boolean isAvailable() {
+        return ToolProvider.getSystemJavaCompiler() != null;
+    }
+
+    public static TestCompiler forProject(String project_root) throws IOException {
+        Path root = Paths.get(project_root).toAbsolutePath().normalize();
+        TestCompiler compiler = compilers.get(root.toString());
+        if (compiler == null) {
+            compiler = new TestCompiler(root);
+            TestCompiler existing = compilers.putIfAbsent(root.toString(), compiler);
+            if (existing != null) compiler = existing;
+        }
+        return compiler;
+    }
+
+    Path project_root;
+    JavaCompiler compiler;
+    StandardJavaFileManager file_manager;
+    List<File> classpath;
+
+    public TestCompiler(Path project_root) throws IOException {
+        this.project_root = project_root;
+        this.compiler = ToolProvider.getSystemJavaCompiler();
+        if (compiler == null) {
+            throw new IllegalStateException("no system java compiler, a JDK is required");
+        }
+        this.file_manager = compiler.getStandardFileManager(null, Locale.ENGLISH, StandardCharsets.UTF_8);
+        reloadClasspath();
+    }
+
+    public synchronized void reloadClasspath() throws IOException {
+        String dependencies = Files.readString(project_root.resolve("dependencies.txt")).trim();
+        classpath = new ArrayList<>();
+        for (String entry : dependencies.split("[;" + File.pathSeparator + "]")) {
+            if (entry.isBlank()) continue;
+            classpath.add(project_root.resolve(entry.trim()).toFile());
+        }
+        file_manager.setLocation(StandardLocation.CLASS_PATH, classpath);
+    }
+
+    public CompileDiagnostic[] compileFile(String source_path) throws IOException {
+        String code = Files.readString(project_root.resolve(source_path));
+        return compileSource(source_path, code);
+    }
+
+    /**
+     * compile a source string, class files are written to target/test-classes
+     * @param source_path path of the source relative to the project root, used in the diagnostics
+     */
+    public synchronized CompileDiagnostic[] compileSource(String source_path, String code) throws IOException {
+        Path output = project_root.resolve("target/test-classes");
+        Files.createDirectories(output);
+        file_manager.setLocation(StandardLocation.CLASS_OUTPUT, List.of(output.toFile()));
+        DiagnosticCollector<JavaFileObject> collector = new DiagnosticCollector<>();
+        JavaFileObject source = new SourceObject(source_path, code);
+        compiler.getTask(null, file_manager, collector, null, null, List.of(source)).call();
+
+        String[] lines = code.split("\r?\n", -1);
+        List<CompileDiagnostic> diagnostics = new ArrayList<>();
+        for (Diagnostic<? extends JavaFileObject> diagnostic : collector.getDiagnostics()) {
+            long line = diagnostic.getLineNumber();
+            String source_line = (line >= 1 && line <= lines.length) ? lines[(int) line - 1] : "";
+            diagnostics.add(new CompileDiagnostic(
+                diagnostic.getKind().name(),
+                source_path,
+                line,
+                diagnostic.getColumnNumber(),
+                diagnostic.getCode(),
+                diagnostic.getMessage(Locale.ENGLISH),
+                source_line));
+        }
+        return diagnostics.toArray(new CompileDiagnostic[0]);
+    }
+
+    static class SourceObject extends SimpleJavaFileObject {
+        final String code;
+
+        SourceObject(String source_path, String code) {
+            super(sourceUri(source_path), Kind.SOURCE);
+            this.code = code;
+        }
+
+        static URI sourceUri(String source_path) {
+            try {
+                return new URI("string", null, "/" + source_path.replace('\\', '/'), null);
+            } catch (URISyntaxException e) {
+                throw new IllegalArgumentException(e);
+            }
+        }
+
+        @Override
+        public CharSequence getCharContent(boolean ignore_encoding_errors) {
+            return code;
+        }
+    }
+}
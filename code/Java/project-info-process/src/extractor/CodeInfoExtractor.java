@@ -324,8 +324,7 @@ public class CodeInfoExtractor extends JavaParserExtractor implements BaseImport
         return codeInfo;
     }
 
-    public JsonObject[] processProject(Path source_dir, Path test_dir, Path jar_folder) throws IOException {
-        // set type solver
+    private void addProjectSolvers(Path source_dir, Path jar_folder) throws IOException {
         JavaParserTypeSolver source_solver = new JavaParserTypeSolver(source_dir);
         addTypeSolver(source_solver);
         Files.walk(jar_folder)
@@ -338,6 +337,29 @@ public class CodeInfoExtractor extends JavaParserExtractor implements BaseImport
                         System.out.println("Error: " + e.getMessage());
                     }
                 });
+    }
+
+    /**
+     * extract code info of the given source files only, types are still resolved against the whole project
+     * @return {source info of the classes in the files, import dictionary}
+     */
+    public JsonObject[] processFiles(Path source_dir, Path jar_folder, List<Path> files) throws IOException {
+        addProjectSolvers(source_dir, jar_folder);
+        JsonObject source_json = new JsonObject();
+        for (Path file : files) {
+            if (!Files.isRegularFile(file) || !JavaParserExtractor.isJavaFile(file)) continue;
+            JsonObject classInfo = extractCodeInfo(file, source_dir);
+            if (classInfo != null) {
+                classInfo.entrySet().forEach(entry -> source_json.add(entry.getKey(), entry.getValue()));
+            }
+        }
+        JsonObject import_dict_json = constructImportDict();
+        return new JsonObject[] { source_json, import_dict_json };
+    }
+
+    public JsonObject[] processProject(Path source_dir, Path test_dir, Path jar_folder) throws IOException {
+        // set type solver
+        addProjectSolvers(source_dir, jar_folder);
         // get information from source files
         JsonObject source_json = new JsonObject();
         Files.walk(source_dir)
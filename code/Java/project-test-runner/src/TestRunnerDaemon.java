@@ -0,0 +1,483 @@
+import com.google.gson.Gson;
+import com.google.gson.JsonArray;
+import com.google.gson.JsonElement;
+import com.google.gson.JsonObject;
+
+import org.jacoco.cli.internal.core.analysis.Analyzer;
+import org.jacoco.cli.internal.core.analysis.CoverageBuilder;
+import org.jacoco.cli.internal.core.analysis.IClassCoverage;
+import org.jacoco.cli.internal.core.analysis.IMethodCoverage;
+import org.jacoco.cli.internal.core.data.ExecutionDataReader;
+import org.jacoco.cli.internal.core.data.ExecutionDataStore;
+import org.jacoco.cli.internal.core.data.SessionInfoStore;
+
+import org.junit.platform.engine.DiscoverySelector;
+import org.junit.platform.engine.TestExecutionResult;
+import org.junit.platform.engine.discovery.DiscoverySelectors;
+import org.junit.platform.engine.support.descriptor.ClassSource;
+import org.junit.platform.engine.support.descriptor.MethodSource;
+import org.junit.platform.launcher.Launcher;
+import org.junit.platform.launcher.LauncherDiscoveryRequest;
+import org.junit.platform.launcher.TestExecutionListener;
+import org.junit.platform.launcher.TestIdentifier;
+import org.junit.platform.launcher.core.LauncherDiscoveryRequestBuilder;
+import org.junit.platform.launcher.core.LauncherFactory;
+import org.junit.platform.launcher.listeners.SummaryGeneratingListener;
+import org.junit.platform.launcher.listeners.TestExecutionSummary;
+
+import java.io.BufferedReader;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.File;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.io.PrintWriter;
+import java.io.StringWriter;
+import java.lang.reflect.Constructor;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Set;
+
+/**
+ * Long-lived test runner of a project, started in the project root:
+ * java -javaagent:jacocoagent.jar=output=none -cp project-test-runner.jar;junit-platform-console-standalone.jar;jacococli.jar;junit.jar;hamcrest-core.jar
+ *      TestRunnerDaemon <shared classpath entry>...
+ * junit 4 has to be on the application classpath with the vintage engine, it is not found in the shared loader.
+ * Shared classpath entries (e.g. "libs/*") are loaded once, target/test-classes and target/classes
+ * are loaded by a fresh class loader for each run.
+ * Requests & responses are json lines over stdin/stdout:
+ *  {"id": 1, "cmd": "run", "classes": ["a.BTest"], "methods": ["a.BTest#test1"], "coverage": true, "exec": "target/jacoco.exec"}
+ *  {"id": 2, "cmd": "report", "args": ["report", "target/jacoco.exec", "--classfiles", ...]}
+ *  {"id": 3, "cmd": "matrix", "classes": ["a.BTest"], "targets": ["a.B"]}
+ *  {"id": 4, "cmd": "batch", "classes": ["a.BTest", "a.CTest"], "methods": [...], "exec_dir": "target/jacoco-batch"}
+ *  {"id": 5, "cmd": "reset"} / {"id": 6, "cmd": "shutdown"}
+ *  -> {"id": 1, "code": 0, "output": "..."}
+ * return code of run is the same as ConsoleLauncher: 0 all tests passed, 1 failures, 2 no tests
+ * matrix runs the tests like run, the execution data is dumped & reset after each test and analyzed
+ * against the target classes in target/classes; the response has the methods covered by each test:
+ *  "matrix": {"a.BTest#test1": {"a.B": [{"name": "foo", "desc": "(I)V", "inst": [missed, covered], "branch": [missed, covered]}]}}
+ * batch runs all selected test classes in one launch, the execution data of each class is written to
+ * <exec_dir>/<class>.exec and the response has the results of each class:
+ *  "classes": {"a.BTest": {"started": 3, "succeeded": 2, "failed": 1, "passed": ["test1", "test2"], "output": "..."}}
+ */
+public class TestRunnerDaemon {
+    public static void main(String[] args) throws IOException {
+        PrintStream protocol_out = System.out;
+        TestRunnerDaemon daemon = new TestRunnerDaemon(Paths.get("").toAbsolutePath(), args);
+        // output of tests must not be mixed with the responses
+        System.setOut(new PrintStream(daemon.test_output, true, StandardCharsets.UTF_8));
+        System.setErr(new PrintStream(daemon.test_output, true, StandardCharsets.UTF_8));
+        BufferedReader reader = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        String line;
+        while ((line = reader.readLine()) != null) {
+            if (line.isBlank()) continue;
+            JsonObject request = daemon.gson.fromJson(line, JsonObject.class);
+            JsonObject response = daemon.handle(request);
+            protocol_out.println(daemon.gson.toJson(response));
+            protocol_out.flush();
+            if (request.get("cmd").getAsString().equals("shutdown")) break;
+        }
+    }
+
+    Gson gson;
+    Path project_root;
+    URLClassLoader shared_loader;
+    Launcher launcher;
+    ByteArrayOutputStream test_output;
+
+    public TestRunnerDaemon(Path project_root, String[] shared_classpath) throws IOException {
+        this.gson = new Gson();
+        this.project_root = project_root;
+        List<URL> urls = new ArrayList<>();
+        for (String entry : shared_classpath) {
+            urls.addAll(expandClasspath(entry));
+        }
+        this.shared_loader = new URLClassLoader(urls.toArray(new URL[0]), TestRunnerDaemon.class.getClassLoader());
+        this.launcher = LauncherFactory.create();
+        this.test_output = new ByteArrayOutputStream();
+    }
+
+    private List<URL> expandClasspath(String entry) throws IOException {
+        List<URL> urls = new ArrayList<>();
+        if (entry.endsWith("*")) {
+            File folder = project_root.resolve(entry.substring(0, entry.length() - 1)).toFile();
+            File[] jars = folder.listFiles((dir, name) -> name.endsWith(".jar"));
+            if (jars == null) return urls;
+            for (File jar : jars) {
+                urls.add(jar.toURI().toURL());
+            }
+        } else {
+            urls.add(project_root.resolve(entry).toUri().toURL());
+        }
+        return urls;
+    }
+
+    public JsonObject handle(JsonObject request) {
+        JsonObject response = new JsonObject();
+        response.add("id", request.get("id"));
+        test_output.reset();
+        try {
+            String cmd = request.get("cmd").getAsString();
+            switch (cmd) {
+                case "run":
+                    runTests(request, response);
+                    break;
+                case "report":
+                    generateReport(request, response);
+                    break;
+                case "matrix":
+                    runCoverageMatrix(request, response);
+                    break;
+                case "batch":
+                    runBatch(request, response);
+                    break;
+                case "reset":
+                    getAgentData(true);
+                    response.addProperty("code", 0);
+                    break;
+                case "shutdown":
+                    response.addProperty("code", 0);
+                    break;
+                default:
+                    throw new IllegalArgumentException("unknown command: " + cmd);
+            }
+        } catch (Throwable e) {
+            StringWriter trace = new StringWriter();
+            e.printStackTrace(new PrintWriter(trace));
+            response.addProperty("code", -1);
+            response.addProperty("output", test_output.toString(StandardCharsets.UTF_8) + trace);
+        }
+        return response;
+    }
+
+    private void runTests(JsonObject request, JsonObject response) throws Exception {
+        boolean coverage = request.has("coverage") && request.get("coverage").getAsBoolean();
+        if (coverage) getAgentData(true);
+        TestExecutionSummary summary = executeTests(request, response);
+        if (coverage) {
+            String exec_file = request.has("exec") ? request.get("exec").getAsString() : "target/jacoco.exec";
+            // append as the jacoco agent does by default
+            try (OutputStream out = new FileOutputStream(project_root.resolve(exec_file).toFile(), true)) {
+                out.write(getAgentData(true));
+            }
+        }
+        response.addProperty("code", resultCode(summary));
+    }
+
+    private void runCoverageMatrix(JsonObject request, JsonObject response) throws Exception {
+        CoverageMatrixListener matrix_listener = new CoverageMatrixListener(getStrings(request, "targets"));
+        getAgentData(true);
+        TestExecutionSummary summary = executeTests(request, response, matrix_listener);
+        if (matrix_listener.error != null) throw matrix_listener.error;
+        response.addProperty("code", resultCode(summary));
+        response.add("matrix", matrix_listener.matrix);
+    }
+
+    private void runBatch(JsonObject request, JsonObject response) throws Exception {
+        String exec_dir = request.has("exec_dir") ? request.get("exec_dir").getAsString() : "target/jacoco-batch";
+        Set<String> test_classes = new HashSet<>(getStrings(request, "classes"));
+        for (String test_method : getStrings(request, "methods")) {
+            test_classes.add(test_method.split("#")[0]);
+        }
+        Files.createDirectories(project_root.resolve(exec_dir));
+        BatchListener batch_listener = new BatchListener(test_classes, project_root.resolve(exec_dir));
+        getAgentData(true);
+        TestExecutionSummary summary = executeTests(request, response, batch_listener);
+        if (batch_listener.error != null) throw batch_listener.error;
+        response.addProperty("code", resultCode(summary));
+        response.add("classes", batch_listener.results);
+    }
+
+    private int resultCode(TestExecutionSummary summary) {
+        if (summary.getTestsFoundCount() == 0) return 2;
+        if (summary.getTotalFailureCount() > 0) return 1;
+        return 0;
+    }
+
+    /**
+     * run the selected classes & methods of the request, the output is added to the response
+     */
+    private TestExecutionSummary executeTests(JsonObject request, JsonObject response, TestExecutionListener... listeners) throws Exception {
+        List<DiscoverySelector> selectors = new ArrayList<>();
+        for (String test_class : getStrings(request, "classes")) {
+            selectors.add(DiscoverySelectors.selectClass(test_class));
+        }
+        for (String test_method : getStrings(request, "methods")) {
+            selectors.add(DiscoverySelectors.selectMethod(test_method));
+        }
+        URL[] run_classpath = new URL[] {
+            project_root.resolve("target/test-classes").toUri().toURL(),
+            project_root.resolve("target/classes").toUri().toURL(),
+        };
+        Thread current = Thread.currentThread();
+        ClassLoader context_loader = current.getContextClassLoader();
+        StringWriter tree = new StringWriter();
+        SummaryGeneratingListener summary_listener = new SummaryGeneratingListener();
+        List<TestExecutionListener> all_listeners = new ArrayList<>(Arrays.asList(listeners));
+        all_listeners.add(summary_listener);
+        all_listeners.add(new TreeListener(new PrintWriter(tree)));
+        // fresh class loader per run, recompiled test classes & static state are not reused
+        try (URLClassLoader run_loader = new URLClassLoader(run_classpath, shared_loader)) {
+            current.setContextClassLoader(run_loader);
+            LauncherDiscoveryRequest discovery = LauncherDiscoveryRequestBuilder.request().selectors(selectors).build();
+            launcher.execute(discovery, all_listeners.toArray(new TestExecutionListener[0]));
+        } finally {
+            current.setContextClassLoader(context_loader);
+        }
+        TestExecutionSummary summary = summary_listener.getSummary();
+        StringWriter summary_text = new StringWriter();
+        PrintWriter summary_writer = new PrintWriter(summary_text);
+        summary.printFailuresTo(summary_writer, 25);
+        summary.printTo(summary_writer);
+        summary_writer.flush();
+        response.addProperty("output", test_output.toString(StandardCharsets.UTF_8) + tree + summary_text);
+        return summary;
+    }
+
+    private void generateReport(JsonObject request, JsonObject response) throws Exception {
+        String[] cli_args = getStrings(request, "args").toArray(new String[0]);
+        // same as `java -jar jacococli.jar <args>`, without starting a new JVM
+        Class<?> cli_main = Class.forName("org.jacoco.cli.internal.Main");
+        Constructor<?> constructor = cli_main.getDeclaredConstructor(String[].class);
+        constructor.setAccessible(true);
+        Object command = constructor.newInstance((Object) cli_args);
+        Method execute = cli_main.getMethod("execute", PrintWriter.class, PrintWriter.class);
+        StringWriter out = new StringWriter();
+        StringWriter err = new StringWriter();
+        int code = (int) execute.invoke(command, new PrintWriter(out, true), new PrintWriter(err, true));
+        response.addProperty("code", code);
+        response.addProperty("output", out.toString() + err);
+    }
+
+    private byte[] getAgentData(boolean reset) throws Exception {
+        // org.jacoco.agent.rt.RT is provided by the -javaagent jar
+        ClassLoader system_loader = ClassLoader.getSystemClassLoader();
+        Class<?> rt = Class.forName("org.jacoco.agent.rt.RT", true, system_loader);
+        Class<?> agent_api = Class.forName("org.jacoco.agent.rt.IAgent", true, system_loader);
+        Object agent = rt.getMethod("getAgent").invoke(null);
+        return (byte[]) agent_api.getMethod("getExecutionData", boolean.class).invoke(agent, reset);
+    }
+
+    private List<String> getStrings(JsonObject request, String key) {
+        List<String> values = new ArrayList<>();
+        if (!request.has(key)) return values;
+        JsonArray array = request.getAsJsonArray(key);
+        for (JsonElement element : array) {
+            values.add(element.getAsString());
+        }
+        return values;
+    }
+
+    /**
+     * methods of the target classes covered by the execution data of one test
+     */
+    private JsonObject analyzeCoverage(byte[] exec_data, List<String> targets) throws IOException {
+        ExecutionDataStore execution_store = new ExecutionDataStore();
+        ExecutionDataReader reader = new ExecutionDataReader(new ByteArrayInputStream(exec_data));
+        reader.setExecutionDataVisitor(execution_store);
+        reader.setSessionInfoVisitor(new SessionInfoStore());
+        reader.read();
+        CoverageBuilder builder = new CoverageBuilder();
+        Analyzer analyzer = new Analyzer(execution_store, builder);
+        for (String target : targets) {
+            Path class_file = project_root.resolve("target/classes/" + target.replace('.', '/') + ".class");
+            if (!Files.exists(class_file)) continue;
+            try (InputStream input = Files.newInputStream(class_file)) {
+                analyzer.analyzeClass(input, class_file.toString());
+            }
+        }
+        JsonObject covered = new JsonObject();
+        for (IClassCoverage class_coverage : builder.getClasses()) {
+            JsonArray methods = new JsonArray();
+            for (IMethodCoverage method : class_coverage.getMethods()) {
+                if (method.getInstructionCounter().getCoveredCount() == 0) continue;
+                JsonObject method_info = new JsonObject();
+                method_info.addProperty("name", method.getName());
+                method_info.addProperty("desc", method.getDesc());
+                method_info.add("inst", counterOf(method.getInstructionCounter().getMissedCount(), method.getInstructionCounter().getCoveredCount()));
+                method_info.add("branch", counterOf(method.getBranchCounter().getMissedCount(), method.getBranchCounter().getCoveredCount()));
+                methods.add(method_info);
+            }
+            if (methods.size() > 0) covered.add(class_coverage.getName().replace('/', '.'), methods);
+        }
+        return covered;
+    }
+
+    private JsonArray counterOf(int missed, int covered) {
+        JsonArray counter = new JsonArray();
+        counter.add(missed);
+        counter.add(covered);
+        return counter;
+    }
+
+    /**
+     * dumps & resets the execution data at the end of each test, setup code between two tests
+     * is counted for the following test
+     */
+    class CoverageMatrixListener implements TestExecutionListener {
+        List<String> targets;
+        JsonObject matrix;
+        Exception error;
+
+        CoverageMatrixListener(List<String> targets) {
+            this.targets = targets;
+            this.matrix = new JsonObject();
+        }
+
+        @Override
+        public void executionFinished(TestIdentifier identifier, TestExecutionResult result) {
+            if (!identifier.isTest() || error != null) return;
+            String test_id = identifier.getSource()
+                    .filter(source -> source instanceof MethodSource)
+                    .map(source -> ((MethodSource) source).getClassName() + "#" + ((MethodSource) source).getMethodName())
+                    .orElse(identifier.getUniqueId());
+            try {
+                matrix.add(test_id, analyzeCoverage(getAgentData(true), targets));
+            } catch (Exception e) {
+                error = e;
+            }
+        }
+    }
+
+    /**
+     * results of each selected test class of a batch run; the execution data is reset when a class starts
+     * and dumped to <exec_dir>/<class>.exec when it finishes, the test output is split between the classes
+     */
+    class BatchListener implements TestExecutionListener {
+        Set<String> test_classes;
+        Path exec_dir;
+        JsonObject results;
+        Exception error;
+        String current_class;
+        JsonObject current_result;
+        StringWriter current_tree;
+        TreeListener tree_listener;
+        int output_start;
+
+        BatchListener(Set<String> test_classes, Path exec_dir) {
+            this.test_classes = test_classes;
+            this.exec_dir = exec_dir;
+            this.results = new JsonObject();
+        }
+
+        private String testClassOf(TestIdentifier identifier) {
+            return identifier.getSource()
+                    .filter(source -> source instanceof ClassSource)
+                    .map(source -> ((ClassSource) source).getClassName())
+                    .filter(test_classes::contains)
+                    .orElse(null);
+        }
+
+        @Override
+        public void executionStarted(TestIdentifier identifier) {
+            String test_class = testClassOf(identifier);
+            if (test_class != null && current_class == null) {
+                current_class = test_class;
+                current_result = new JsonObject();
+                current_result.addProperty("started", 0);
+                current_result.addProperty("succeeded", 0);
+                current_result.addProperty("failed", 0);
+                current_result.add("passed", new JsonArray());
+                current_tree = new StringWriter();
+                tree_listener = new TreeListener(new PrintWriter(current_tree));
+                output_start = test_output.size();
+                try {
+                    getAgentData(true);
+                } catch (Exception e) {
+                    error = e;
+                }
+            } else if (identifier.isTest() && current_class != null) {
+                increment("started");
+            }
+        }
+
+        @Override
+        public void executionSkipped(TestIdentifier identifier, String reason) {
+            if (current_class != null) tree_listener.executionSkipped(identifier, reason);
+        }
+
+        @Override
+        public void executionFinished(TestIdentifier identifier, TestExecutionResult result) {
+            if (current_class == null) return;
+            if (identifier.isTest()) {
+                tree_listener.executionFinished(identifier, result);
+                if (result.getStatus() == TestExecutionResult.Status.SUCCESSFUL) {
+                    increment("succeeded");
+                    identifier.getSource()
+                            .filter(source -> source instanceof MethodSource)
+                            .ifPresent(source -> current_result.getAsJsonArray("passed").add(((MethodSource) source).getMethodName()));
+                } else if (result.getStatus() == TestExecutionResult.Status.FAILED) {
+                    increment("failed");
+                }
+                return;
+            }
+            if (!current_class.equals(testClassOf(identifier))) return;
+            byte[] output = Arrays.copyOfRange(test_output.toByteArray(), output_start, test_output.size());
+            String container_error = result.getStatus() == TestExecutionResult.Status.SUCCESSFUL ? ""
+                    : result.getThrowable().map(Throwable::toString).orElse("") + "\n";
+            current_result.addProperty("output", new String(output, StandardCharsets.UTF_8) + current_tree + container_error);
+            try (OutputStream out = new FileOutputStream(exec_dir.resolve(current_class + ".exec").toFile())) {
+                out.write(getAgentData(true));
+            } catch (Exception e) {
+                error = e;
+            }
+            results.add(current_class, current_result);
+            current_class = null;
+        }
+
+        private void increment(String counter) {
+            current_result.addProperty(counter, current_result.get(counter).getAsInt() + 1);
+        }
+    }
+
+    /**
+     * prints results of tests like the tree of ConsoleLauncher, e.g. "├─ testName() ✔"
+     */
+    static class TreeListener implements TestExecutionListener {
+        PrintWriter writer;
+
+        TreeListener(PrintWriter writer) {
+            this.writer = writer;
+        }
+
+        @Override
+        public void executionSkipped(TestIdentifier identifier, String reason) {
+            if (!identifier.isTest()) return;
+            writer.println("├─ " + identifier.getDisplayName() + " ↷ " + reason);
+            writer.flush();
+        }
+
+        @Override
+        public void executionFinished(TestIdentifier identifier, TestExecutionResult result) {
+            if (!identifier.isTest()) return;
+            switch (result.getStatus()) {
+                case SUCCESSFUL:
+                    writer.println("├─ " + identifier.getDisplayName() + " ✔");
+                    break;
+                case ABORTED:
+                    writer.println("├─ " + identifier.getDisplayName() + " ■ " + throwableMessage(result));
+                    break;
+                default:
+                    writer.println("├─ " + identifier.getDisplayName() + " ✘ " + throwableMessage(result));
+            }
+            writer.flush();
+        }
+
+        private String throwableMessage(TestExecutionResult result) {
+            return result.getThrowable().map(Throwable::toString).orElse("");
+        }
+    }
+}
@@ -4,7 +4,7 @@ import argparse
 
 
 import tools.io_utils as utils
-from evaluations.coverage_test import test_coverage
+from evaluations.coverage_test import test_coverage, render_html_reports
 from evaluations.extracrt_baseline_result import exract_baseline_coverage
 from evaluations.baseline_scripts import running_baselines
 from settings import FileStructure as FS, LLMSettings as MS, TaskSettings as TS, BaseLine as BL
@@ -13,7 +13,7 @@ def get_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-L','--log_level', type=str, default='info', help='log level: info, debug, warning, error, critical')
     parser.add_argument('-F','--log_file', help="storage file of output info", default=None)
-    parser.add_argument('-O','--operation',type=str, default='', help='evaluation operation: coverage, baseline, basegen')
+    parser.add_argument('-O','--operation',type=str, default='', help='evaluation operation: coverage, html, baseline, basegen')
 
     args = parser.parse_args()
     log_level = {
@@ -39,6 +39,8 @@ def run(operation):
     if operation == 'coverage':
         TS.MODEL = MS.MODEL
         test_coverage(FS, TS, dataset_info)
+    if operation == 'html':
+        render_html_reports(FS, TS, dataset_info)
     if operation == 'baseline':
         exract_baseline_coverage(FS, TS, BL, dataset_info)
     if operation == 'basegen':
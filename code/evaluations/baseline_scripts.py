@@ -10,6 +10,7 @@ import tools.io_utils as io_utils
 from tools.code_analysis import JavaCodeEditor
 from procedure.post_process import check_class_name
 from tools.execute_test import JavaRunner, CoverageExtractor
+from tools.diagnostics import errors_in_file, parse_javac_output
 
 
 class ChatUniTestRunner():
@@ -178,16 +179,17 @@ class UTGenRunner():
         return
 
     def set_java_runner(self, project_url):
-        java_runner = JavaRunner(project_url, self.dependency_fd)
-        test_dependencies = f"libs/*;target/test-classes;target/classes;{self.dependency_fd}/*"
-        java_runner.test_base_cmd = [
-            'java', 
+        jvm_args = [
             "--add-opens", "java.base/java.lang=ALL-UNNAMED",
             "--add-opens", "java.base/java.net=ALL-UNNAMED",
             "--add-opens", "java.desktop/java.awt=ALL-UNNAMED",
             # "--add-opens", "java.base/java.util=ALL-UNNAMED",
             # "--add-opens", "java.base/sun.reflect.annotation=ALL-UNNAMED",
             # "--add-opens", "java.base/java.text=ALL-UNNAMED",
+        ]
+        java_runner = JavaRunner(project_url, self.dependency_fd, jvm_args=jvm_args)
+        test_dependencies = f"libs/*;target/test-classes;target/classes;{self.dependency_fd}/*"
+        java_runner.test_base_cmd = ['java'] + jvm_args + [
             '-cp', test_dependencies, 
             'org.junit.platform.console.ConsoleLauncher', 
             '--disable-banner', 
@@ -200,18 +202,8 @@ class UTGenRunner():
         '''
         Parse the compilation feedback to get the error line number and error message.
         '''
-        error_lines = []
-        split_str = class_path.replace("/", "\\")
-        errors = feedback.split(f"{split_str}:")
-        for error in errors:
-            if str(error).find(": error: ")==-1: continue
-            splits = error.split(": error: ")
-            try:
-                line = int(splits[0]) - 1
-                error_lines.append(line)
-            except:
-                continue
-        return error_lines
+        diagnostics = errors_in_file(parse_javac_output(feedback), class_path)
+        return [diagnostic.line - 1 for diagnostic in diagnostics]
 
     def _extend_removing_lines(self, error_lines: list, case_positions):
         starts = case_positions[0]
@@ -286,6 +278,9 @@ class UTGenRunner():
                 cflag, feedback = java_runner.compile_test(running_path)
                 while not cflag:
                     error_lines = self._parse_error_line(feedback, running_path)
+                    if len(error_lines) == 0:
+                        self.logger.error(f"no error line found in compilation feedback of {running_path}")
+                        break
                     case_positions = code_editor.get_test_case_position()
                     error_lines = self._extend_removing_lines(error_lines, case_positions)
                     code_editor.remove_lines(error_lines)
@@ -299,18 +294,27 @@ class UTGenRunner():
                 # 5. check which test methods cover the target method
                 task_method_position = {}
                 for id in tinfo["ids"]: task_method_position[id] = []
-                for i in range(len(mnames)):
-                    mname = f"{class_fqn}#{mnames[i]}"
-                    eflag = java_runner.run_selected_mehods([mname])
-                    if not eflag: continue
-                    html_report = "target/jacoco-report/"
-                    java_runner.generate_report_single(html_report)
-                    for id, tmname in tinfo["ids"].items():
-                        html_path = f"{project_url}/{html_report}{pkgname}/{test_class.removesuffix('_ESTest')}.html"
-                        coverage = coverage_extractor.extract_single_coverage(html_path, tmname)
-                        if coverage and coverage[0] > 0:
-                            task_method_position[id].append([starts[i], ends[i]])
-                    java_runner.delete_jacoco_exec()
+                focal_class = f"{pkgname}.{test_class.removesuffix('_ESTest')}"
+                matrix = java_runner.run_coverage_matrix(class_fqn, [focal_class])
+                if matrix is not None and matrix.has_tests(class_fqn):
+                    for i in range(len(mnames)):
+                        for id, tmname in tinfo["ids"].items():
+                            if matrix.covers(f"{class_fqn}#{mnames[i]}", focal_class, tmname):
+                                task_method_position[id].append([starts[i], ends[i]])
+                else:
+                    # without the test runner daemon (or no test of the class was run by it), each test method is run & reported on its own
+                    for i in range(len(mnames)):
+                        mname = f"{class_fqn}#{mnames[i]}"
+                        eflag = java_runner.run_selected_mehods([mname])
+                        if not eflag: continue
+                        html_report = "target/jacoco-report/"
+                        java_runner.generate_report_single(html_report)
+                        for id, tmname in tinfo["ids"].items():
+                            html_path = f"{project_url}/{html_report}{pkgname}/{test_class.removesuffix('_ESTest')}.html"
+                            coverage = coverage_extractor.extract_single_coverage(html_path, tmname)
+                            if coverage and coverage[0] > 0:
+                                task_method_position[id].append([starts[i], ends[i]])
+                        java_runner.delete_jacoco_exec()
                 # 6. assemble test methods into a new test class
                 for id, tmname in tinfo["ids"].items():
                     position = task_method_position[id]
@@ -320,6 +324,7 @@ class UTGenRunner():
                     file_name = f"{project_target}/{id}_Test.java"
                     self.logger.info(f"Writing new test class to {file_name}")
                     io_utils.write_text(file_name, new_code)
+            java_runner.close()
 
 
 def running_chatunitest(dataset_info, task_setting, phase_type, workspace, tmp_folder, result_folder):
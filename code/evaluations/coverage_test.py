@@ -1,80 +1,209 @@
 import os
 import re
 import logging
+import functools
+import concurrent.futures
 
 import tools.io_utils as utils
+from tools.sandbox import SandboxManager
 from tools.execute_test import JavaRunner, CoverageExtractor
 from tools.code_analysis import JavaASTParser
 
 
+BATCH_EXEC_DIR = "target/jacoco-batch"
+
+
 class ProjectTestRunner(JavaRunner):
     project_info: dict
     testclass_path: str
     report_path: str
     test_result: dict
+    html_report: bool
 
-    def __init__(self, project_info, dep_fd, tc_path, rpt_path):
+    def __init__(self, project_info, dep_fd, tc_path, rpt_path, html_report=True, jvm_args=None):
+        '''
+        html_report: render html reports; otherwise only xml & csv reports are written and the
+        exec files are kept in <report path>/jacoco-exec/ for `render_html_report`
+        '''
         self.project_info = project_info
         self.testclass_path = tc_path.replace("<project>",project_info["project-name"])
         self.report_path = rpt_path.replace("<project>",project_info["project-name"])
-        super().__init__(project_info["project-url"], dep_fd)
+        self.html_report = html_report
+        self.test_result = {}
+        super().__init__(project_info["project-url"], dep_fd, jvm_args=jvm_args)
         self.logger = logging.getLogger(__name__)
         return
 
-    def run_project_test(self, compile=True):
+    def run_project_test(self, compile=True, workers=1, batch=False):
+        '''
+        workers: focal methods tested concurrently, each in its own sandbox of the project if > 1
+        batch: run the test classes of all focal methods in one launch (see `run_project_batch`), instead of sandboxes
+        '''
         project_name = self.project_info["project-name"]
-        project_url = self.project_info["project-url"]
         test_objects = self.project_info["focal-methods"]
         self.test_result = {}
 
         self.logger.info(f"Running tests for project: {project_name}")
+        if batch and self._service_daemon() is not None:
+            return self.run_project_batch(compile)
+        if workers <= 1 or len(test_objects) <= 1:
+            for tobject in test_objects:
+                self.run_focal_test(tobject, compile)
+            return self.test_result
+        sandboxes = SandboxManager(self.project_info["project-url"], workers)
+        sandboxes.prepare()
+        runners = {
+            sandbox.index: ProjectTestRunner({**self.project_info, "project-url": sandbox.root}, self.dependency_fd,
+                                             self.testclass_path, self.report_path, self.html_report, self.jvm_args)
+            for sandbox in sandboxes.sandboxes
+        }
+
+        def test_in_sandbox(tobject):
+            with sandboxes.sandbox() as sandbox:
+                result = runners[sandbox.index].run_focal_test(tobject, compile)
+                sandboxes.collect(sandbox, tobject["test-path"], tobject["test-class"])
+            return result
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(test_in_sandbox, test_objects))
+        # results in dataset order, as in the sequential run
+        for tobject, result in zip(test_objects, results):
+            self.test_result[f"{tobject['class']}#{tobject['method-name']}"] = result
+        for runner in runners.values():
+            runner.close()
+        sandboxes.merge(test_objects)
+        sandboxes.cleanup()
+        return self.test_result
+
+    def run_project_batch(self, compile=True):
+        '''
+        compile the test classes of all focal methods together and run them in one launch of the test runner daemon,
+        then the passed test methods in a second launch; results & coverage (one exec file per test class) are
+        split back per focal method. Classes without a batch result are run one by one.
+        '''
+        test_objects = [tobject for tobject in self.project_info["focal-methods"] if self.copy_focal_test(tobject)]
+        if compile:
+            compile_results = self.compile_tests([tobject["test-path"] for tobject in test_objects])
+            for tobject in test_objects:
+                if not compile_results[tobject["test-path"]][0]:
+                    self.test_result[f"{tobject['class']}#{tobject['method-name']}"]["error_type"] = "compile error"
+            test_objects = [tobject for tobject in test_objects if compile_results[tobject["test-path"]][0]]
+        if len(test_objects) == 0: return self.test_result
+        class_results = self.run_test_batch(classes=[tobject["test-class"] for tobject in test_objects], exec_dir=BATCH_EXEC_DIR)
+        if class_results is None: class_results = {}
+
+        correct_tests = {}
         for tobject in test_objects:
             test_class = tobject["test-class"]
-            test_path = tobject["test-path"]
-            testid = tobject["id"]
-            method = tobject["method-name"]
-            class_path = f"{self.testclass_path}/{test_path.split('/')[-1]}"
-            data_id = f"{tobject['class']}#{method}"
-            self.test_result[data_id] = {}
-            try:
-                utils.copy_file(class_path, f"{project_url}/{test_path}")
-            except FileNotFoundError:
-                self.test_result[data_id].update({
-                    "error_type": "compile error",
-                    "test_cases": 0,
-                    "passed_cases": 0,
-                    "note": "test class not found"
-                })
+            data_id = f"{tobject['class']}#{tobject['method-name']}"
+            class_result = class_results.get(test_class)
+            if class_result is None:
+                self.execute_focal_test(tobject)
                 continue
-
-            if compile:
-                cflag, _ = self.compile_test(test_path)
-                if not cflag:
-                    self.test_result[data_id]["error_type"] = "compile error"
-                    continue
-            eflag, feedback = self.run_singal_unit_test(test_class)
-            if eflag:
-                passed_test = self.deal_execution_feedback(data_id, feedback)
-            else:
-                self.test_result[data_id]["error_type"] = "execution error"
-                continue
-            html_report = f"{self.report_path}/jacoco-report-html/{testid}/"
-            csv_report = f"{self.report_path}/jacoco-report-csv/{testid}.csv"
-            if not self.generate_report_single(html_report, csv_report):
+            self.logger.info(f"test execution info of {test_class}: {class_result.get('output', '')}")
+            self.test_result[data_id].update({"test_cases": class_result["started"], "passed_cases": class_result["succeeded"]})
+            if not self.generate_reports(tobject["id"], f"{BATCH_EXEC_DIR}/{test_class}.exec"):
                 self.test_result[data_id]["error_type"] = "report error"
                 continue
-            self.delete_jacoco_exec()
-            if len(passed_test)>0:
-                passed_test = [f"{test_class}#{method}" for method in passed_test]
-                if not self.run_selected_mehods(passed_test): continue
-                correct_html_report = f"{self.report_path}/jacoco-report-html/{testid}_correct/"
-                correct_csv_report = f"{self.report_path}/jacoco-report-csv/{testid}_correct.csv"
-                self.generate_report_single(correct_html_report, correct_csv_report)
-                self.delete_jacoco_exec()
+            if len(class_result["passed"]) > 0:
+                correct_tests[test_class] = tobject
             else:
                 self.test_result[data_id].update({"correct_inst_cov": 0.0, "correct_bran_cov": 0.0})
+        if len(correct_tests) == 0: return self.test_result
+
+        passed_methods = [f"{test_class}#{method}" for test_class in correct_tests for method in class_results[test_class]["passed"]]
+        correct_results = self.run_test_batch(methods=passed_methods, exec_dir=BATCH_EXEC_DIR)
+        if correct_results is None: return self.test_result
+        for test_class, tobject in correct_tests.items():
+            if test_class in correct_results:
+                self.generate_reports(f"{tobject['id']}_correct", f"{BATCH_EXEC_DIR}/{test_class}.exec")
         return self.test_result
 
+    def run_focal_test(self, tobject, compile=True) -> dict:
+        '''
+        test & coverage reports of the test class of a focal method -> test result of the method
+        '''
+        data_id = f"{tobject['class']}#{tobject['method-name']}"
+        if not self.copy_focal_test(tobject):
+            return self.test_result[data_id]
+        if compile:
+            cflag, _ = self.compile_test(tobject["test-path"])
+            if not cflag:
+                self.test_result[data_id]["error_type"] = "compile error"
+                return self.test_result[data_id]
+        return self.execute_focal_test(tobject)
+
+    def copy_focal_test(self, tobject) -> bool:
+        '''
+        copy the generated test class of a focal method into the project, False if it is not found
+        '''
+        test_path = tobject["test-path"]
+        class_path = f"{self.testclass_path}/{test_path.split('/')[-1]}"
+        data_id = f"{tobject['class']}#{tobject['method-name']}"
+        self.test_result[data_id] = {}
+        try:
+            utils.copy_file(class_path, f"{self.project_info['project-url']}/{test_path}")
+        except FileNotFoundError:
+            self.test_result[data_id].update({
+                "error_type": "compile error",
+                "test_cases": 0,
+                "passed_cases": 0,
+                "note": "test class not found"
+            })
+            return False
+        return True
+
+    def execute_focal_test(self, tobject) -> dict:
+        '''
+        run the compiled test class of a focal method & generate coverage reports
+        '''
+        test_class = tobject["test-class"]
+        testid = tobject["id"]
+        data_id = f"{tobject['class']}#{tobject['method-name']}"
+        eflag, feedback = self.run_singal_unit_test(test_class)
+        if eflag:
+            passed_test = self.deal_execution_feedback(data_id, feedback)
+        else:
+            self.test_result[data_id]["error_type"] = "execution error"
+            return self.test_result[data_id]
+        if not self.generate_reports(testid):
+            self.test_result[data_id]["error_type"] = "report error"
+            return self.test_result[data_id]
+        if len(passed_test)>0:
+            passed_test = [f"{test_class}#{method}" for method in passed_test]
+            if self.run_selected_mehods(passed_test):
+                self.generate_reports(f"{testid}_correct")
+        else:
+            self.test_result[data_id].update({"correct_inst_cov": 0.0, "correct_bran_cov": 0.0})
+        return self.test_result[data_id]
+
+    def generate_reports(self, report_id, exec_file="target/jacoco.exec"):
+        '''
+        reports of the exec file, which is deleted or kept for a later html report
+        '''
+        html_report = f"{self.report_path}/jacoco-report-html/{report_id}/" if self.html_report else None
+        csv_report = f"{self.report_path}/jacoco-report-csv/{report_id}.csv"
+        xml_report = f"{self.report_path}/jacoco-report-xml/{report_id}.xml"
+        utils.check_path(xml_report)
+        flag = self.generate_report_single(html_report, csv_report, xml_report, exec_file)
+        if flag and not self.html_report:
+            kept_file = f"{self.report_path}/jacoco-exec/{report_id}.exec"
+            utils.check_path(kept_file)
+            self.keep_jacoco_exec(kept_file, exec_file)
+        else:
+            self.delete_jacoco_exec(exec_file)
+        return flag
+
+    def render_html_report(self, report_id):
+        '''
+        html report from the kept exec file of a metrics-only run (classes in target/classes should be unchanged)
+        '''
+        exec_file = f"{self.report_path}/jacoco-exec/{report_id}.exec"
+        if not os.path.exists(exec_file):
+            self.logger.error(f"exec file not found: {exec_file}")
+            return False
+        return self.generate_report_single(f"{self.report_path}/jacoco-report-html/{report_id}/", exec_file=exec_file)
+
     def deal_execution_feedback(self, data_id, feedback):
         cases = int(re.findall(r"([0-9]+) tests started", feedback)[0])
         passed = int(re.findall(r"([0-9]+) tests successful", feedback)[0])
@@ -146,16 +275,19 @@ class CoverageCalculator(CoverageExtractor):
             else:
                 package = test["package"]
                 classname = test["class"].split(".")[-1]
+                class_fqn = f"{package}.{classname}"
+                xml_path = f"{self.report_path}/jacoco-report-xml/{testid}.xml"
                 html_path = f"{self.report_path}/jacoco-report-html/{testid}/{package}/{classname}.html"
-                cov_score = self.extract_single_coverage(html_path, method)
+                cov_score = self.extract_coverage(xml_path, html_path, class_fqn, method)
                 data_id = f"{test['class']}#{method}"
                 if cov_score: 
                     summary[data_id].update({"inst_cov": cov_score[0], "bran_cov": cov_score[1]})
                 else: 
                     summary[data_id].update({"inst_cov": "<missing>", "bran_cov": "<missing>"})
                 if "correct_inst_cov" not in summary[data_id]:
+                    xml_path = f"{self.report_path}/jacoco-report-xml/{testid}_correct.xml"
                     html_path = f"{self.report_path}/jacoco-report-html/{testid}_correct/{package}/{classname}.html"
-                    cov_score = self.extract_single_coverage(html_path, method)
+                    cov_score = self.extract_coverage(xml_path, html_path, class_fqn, method)
                     if cov_score:
                         summary[data_id].update({"correct_inst_cov": cov_score[0], "correct_bran_cov": cov_score[1]})
                         if filter:
@@ -219,10 +351,78 @@ class CoverageCalculator(CoverageExtractor):
         for metric in metrics:
             exist_result.pop(metric, None)
         self.count_general_metrics(exist_result)
-        utils.write_json(result_file, exist_result)
+        utils.write_json_atomic(result_file, exist_result)
+
+
+def evaluation_budget(task_setting) -> int:
+    '''
+    number of test JVMs running at the same time: EVAL_WORKERS, or if it is 0,
+    the CPU count limited by the physical memory for JVMs of EVAL_JVM_MEMORY_MB heap
+    '''
+    workers = getattr(task_setting, "EVAL_WORKERS", 1)
+    if workers > 0: return workers
+    workers = os.cpu_count() or 1
+    try:
+        memory_mb = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1 << 20)
+        workers = min(workers, memory_mb // getattr(task_setting, "EVAL_JVM_MEMORY_MB", 2048))
+    except (AttributeError, ValueError, OSError):
+        # no sysconf on windows
+        pass
+    return max(1, workers)
+
+
+def evaluation_jvm_args(task_setting, budget:int) -> list[str]|None:
+    # concurrent JVMs are limited to their share of the memory
+    if budget <= 1: return None
+    return [f"-Xmx{getattr(task_setting, 'EVAL_JVM_MEMORY_MB', 2048)}m"]
+
+
+def evaluate_projects(evaluate, projects:dict, workers:int, on_result):
+    '''
+    evaluate(pj_name, info) for each project, in `workers` processes if > 1;
+    on_result(pj_name, result) is called in this process as the projects finish.
+    As in the sequential run, an error of a project is raised, in parallel after the other projects finish
+    '''
+    logger = logging.getLogger(__name__)
+    if workers <= 1:
+        for pj_name, info in projects.items():
+            on_result(pj_name, evaluate(pj_name, info))
+        return
+    error = None
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(evaluate, pj_name, info): pj_name for pj_name, info in projects.items()}
+        for future in concurrent.futures.as_completed(futures):
+            pj_name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Error evaluating project {pj_name}: {e}")
+                if error is None: error = e
+                continue
+            on_result(pj_name, result)
+    if error is not None: raise error
+    return
+
+
+def _evaluate_project(dependency_dir, testclass_path, report_path, compile_test, html_report, method_workers, batch, jvm_args, pj_name, info):
+    # run converage test & generate report
+    runner = ProjectTestRunner(info, dependency_dir, testclass_path, report_path, html_report, jvm_args)
+    test_result = runner.run_project_test(compile_test, method_workers, batch)
+    runner.close()
+    logging.getLogger(__name__).info(test_result)
+    # extract coverage
+    calculator = CoverageCalculator(info, report_path)
+    coverage_data = calculator.generate_project_summary(test_result, filter=True)
+    coverage_file = f"{report_path}/summary.json".replace("<project>", pj_name)
+    utils.write_json_atomic(coverage_file, coverage_data)
+    return coverage_data
 
 
 def test_coverage(fstruct, task_setting, dataset_info: dict):
+    '''
+    the projects are evaluated in parallel processes and their focal methods in sandboxes,
+    within the budget of `evaluation_budget`; project results are merged into summary-<model>.json as they finish
+    '''
     root_path = os.getcwd().replace("\\", "/")
     dataset_dir = f"{root_path}/{fstruct.DATASET_PATH}"
     testclass_path = f"{root_path}/{fstruct.TESTCLASSS_PATH}"
@@ -233,28 +433,54 @@ def test_coverage(fstruct, task_setting, dataset_info: dict):
     model = task_setting.MODEL
     select = True if len(projects)>0 else False
     logger = logging.getLogger(__name__)
-    total_result = {}
     calculator: CoverageCalculator = CoverageCalculator({}, "")
 
     logger.info(f"Start coverage test ...")
+    selected = {}
     for pj_name, info in dataset_info.items():
         if select and pj_name not in projects: continue
-        project_path = f"{dataset_dir}/{info['project-url']}"
-        info["project-url"] = project_path
-        # run converage test & generate report
-        runner = ProjectTestRunner(info, dependency_dir, testclass_path, report_path)
-        test_result = runner.run_project_test(compile_test)
-        logger.info(test_result)
-        # extract coverage
-        calculator = CoverageCalculator(info, report_path)
-        coverage_data = calculator.generate_project_summary(test_result, filter=True)
-        total_result.update(coverage_data)
-        logger.info(f"report data:\n{coverage_data}")
-        coverage_file = f"{report_path}/summary.json".replace("<project>", pj_name)
-        utils.write_json(coverage_file, coverage_data)
-
+        info["project-url"] = f"{dataset_dir}/{info['project-url']}"
+        selected[pj_name] = info
+    budget = evaluation_budget(task_setting)
+    project_workers = max(1, min(budget, len(selected)))
+    method_workers = max(1, budget // project_workers)
+    evaluate = functools.partial(_evaluate_project, dependency_dir, testclass_path, report_path, compile_test,
+                                 getattr(task_setting, "COVERAGE_HTML", True), method_workers,
+                                 getattr(task_setting, "EVAL_BATCH", False), evaluation_jvm_args(task_setting, budget))
     total_file = report_path.split("<project>")[0] + f"summary-{model}.json"
-    calculator.calculate_total_result(total_result, total_file)
+
+    def merge_result(pj_name, coverage_data):
+        logger.info(f"report data of {pj_name}:\n{coverage_data}")
+        calculator.calculate_total_result(coverage_data, total_file)
+
+    evaluate_projects(evaluate, selected, project_workers, merge_result)
+    return
+
+
+def render_html_reports(fstruct, task_setting, dataset_info: dict):
+    '''
+    render the html reports of the focal methods in CASES_LIST (all if empty) after a metrics-only run
+    '''
+    root_path = os.getcwd().replace("\\", "/")
+    dataset_dir = f"{root_path}/{fstruct.DATASET_PATH}"
+    testclass_path = f"{root_path}/{fstruct.TESTCLASSS_PATH}"
+    report_path = f"{root_path}/{fstruct.REPORT_PATH}"
+    dependency_dir = f"{root_path}/{fstruct.DEPENDENCY_PATH}"
+    projects = task_setting.PROJECTS
+    cases = task_setting.CASES_LIST
+    logger = logging.getLogger(__name__)
+    for pj_name, info in dataset_info.items():
+        if len(projects) > 0 and pj_name not in projects: continue
+        info["project-url"] = f"{dataset_dir}/{info['project-url']}"
+        runner = ProjectTestRunner(info, dependency_dir, testclass_path, report_path, html_report=True)
+        for tobject in info["focal-methods"]:
+            testid = tobject["id"]
+            if len(cases) > 0 and testid not in cases: continue
+            for report_id in [testid, f"{testid}_correct"]:
+                if os.path.exists(f"{runner.report_path}/jacoco-exec/{report_id}.exec"):
+                    logger.info(f"Rendering html report {report_id} of project {pj_name}")
+                    runner.render_html_report(report_id)
+        runner.close()
     return
 
 
@@ -2,11 +2,12 @@ import os
 import re
 import shutil
 import logging
+import functools
 import subprocess
 
 
 import tools.io_utils as io_utils
-from evaluations.coverage_test import ProjectTestRunner, CoverageCalculator
+from evaluations.coverage_test import ProjectTestRunner, CoverageCalculator, evaluation_budget, evaluate_projects
 
 
 class HITSRunner(ProjectTestRunner):
@@ -241,6 +242,23 @@ def set_file_structure(report_path, dataset_info):
     pass
 
 
+def _evaluate_baseline_project(runner_class, dependency_dir, testclass_path, report_path, compile_test, pj_name, info):
+    # run converage test & generate report
+    runner = runner_class(info, dependency_dir, testclass_path, report_path)
+    test_result = runner.run_project_test(compile_test)
+    runner.close()
+    logging.getLogger(__name__).info(test_result)
+    # extract coverage
+    if runner_class.__name__ == UTGenRunner.__name__:
+        calculator = UTGenCalculator(info, report_path)
+    else:
+        calculator = CoverageCalculator(info, report_path)
+    coverage_data = calculator.generate_project_summary(test_result)
+    coverage_file = f"{report_path}/summary.json".replace("<project>", pj_name)
+    io_utils.write_json_atomic(coverage_file, coverage_data)
+    return coverage_data
+
+
 def extract_coverage_generic(runner_class, result_folder, dataset_info, fstruct, task_setting):
     """通用覆盖率提取函数，用于消除重复代码"""
     root_path = os.getcwd().replace("\\", "/")
@@ -255,25 +273,18 @@ def extract_coverage_generic(runner_class, result_folder, dataset_info, fstruct,
     total_result = {}
     calculator: CoverageCalculator = CoverageCalculator({}, "")
 
-    for pj_name, info in dataset_info.items():
-        if select and pj_name not in projects: continue
-        # run converage test & generate report
-        runner = runner_class(info, dependency_dir, testclass_path, report_path)
-        test_result = runner.run_project_test(compile_test)
-        logger.info(test_result)
-        # extract coverage
-        if runner_class.__name__ == UTGenRunner.__name__:
-            calculator = UTGenCalculator(info, report_path)
-        else:
-            calculator = CoverageCalculator(info, report_path)
-        coverage_data = calculator.generate_project_summary(test_result)
+    selected = {pj_name: info for pj_name, info in dataset_info.items() if not select or pj_name in projects}
+    # baseline runners share the project folder between focal methods, only projects run in parallel
+    project_workers = max(1, min(evaluation_budget(task_setting), len(selected)))
+    evaluate = functools.partial(_evaluate_baseline_project, runner_class, dependency_dir, testclass_path, report_path, compile_test)
+    total_file = report_path.split("<project>")[0] + "summary.json"
+
+    def merge_result(pj_name, coverage_data):
+        logger.info(f"report data of {pj_name}:\n{coverage_data}")
         total_result.update(coverage_data)
-        logger.info(f"report data:\n{coverage_data}")
-        coverage_file = f"{report_path}/summary.json".replace("<project>", pj_name)
-        io_utils.write_json(coverage_file, coverage_data)
+        calculator.calculate_total_result(coverage_data, total_file)
 
-    total_file = report_path.split("<project>")[0] + "summary.json"
-    calculator.calculate_total_result(total_result, total_file)
+    evaluate_projects(evaluate, selected, project_workers, merge_result)
     return total_result
 
 
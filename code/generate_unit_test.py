@@ -9,7 +9,9 @@ import tools.io_utils as utils
 import procedure.generate_prompt as GenPrompt
 import procedure.generate_code as GenCode
 import procedure.post_process as Post
-from settings import FileStructure as FS, TaskSettings as TS
+import procedure.pipeline as Pipeline
+from tools.llm_cache import get_response_cache
+from settings import FileStructure as FS, TaskSettings as TS, LLMSettings as ST
 
 
 def get_args():
@@ -29,6 +31,14 @@ def get_args():
     return args
 
 
+def log_cache_stats(logger:logging.Logger):
+    cache = get_response_cache(ST)
+    if cache is None: return
+    stats = cache.stats()
+    logger.info(f"LLM response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries ({stats['bytes']/1024/1024:.1f} MB)")
+    return
+
+
 # TODO: a complete procedure for singal case in dataset
 def run():
     '''
@@ -60,6 +70,13 @@ def run():
         TS.PROMPT_LIST = prompt_list
         logger.info(f"prompt list: {TS.PROMPT_LIST}")
 
+    if getattr(TS, "PIPELINE", False):
+        # each focal method moves through the stages on its own
+        Pipeline.run_pipeline(FS, TS, dataset_info)
+        log_cache_stats(logger)
+        logger.info(f"total elapsed time: {time.time() - start_time:.2f} seconds")
+        return
+
     # generate prompts
     prompt_gen_start = time.time()
     GenPrompt.generate_init_prompts(FS, TS, dataset_info)
@@ -88,6 +105,7 @@ def run():
     post_end = time.time()
     logger.info(f"time for post process: {post_end - post_start:.2f} seconds")
     
+    log_cache_stats(logger)
     end_time = time.time()
     elapsed_time = end_time - start_time
     logger.info(f"total elapsed time: {elapsed_time:.2f} seconds")
@@ -8,6 +8,7 @@ from settings import FileStructure as FS
 import tools.io_utils as utils
 import procedure.workspace_preparation as WSP
 import procedure.preprocess_project as PreProcess
+from tools.index_store import convert_project_index
 
 
 def get_args():
@@ -17,6 +18,10 @@ def get_args():
     parser.add_argument('-W', '--workspace', action='store_true', help='prepare workspace: True/False')
     parser.add_argument('-D', '--dataset', action='store_true', help='prepare dataset_info.json: True/False')
     parser.add_argument('-P', '--project_index', action='store_true', help='prepare project index: True/False')
+    parser.add_argument('-I', '--incremental', action='store_true', help='with -P, only process source files changed since the last preparation: True/False')
+    parser.add_argument('-G', '--code_graph', action='store_true', help='build calling graphs & invoke patterns from the project index: True/False')
+    parser.add_argument('-J', '--jobs', type=int, default=1, help='number of processes for -G, projects & their classes are distributed among them')
+    parser.add_argument('-B', '--binary_index', action='store_true', help='convert project index to binary format: True/False')
 
     args = parser.parse_args()
     log_level = {
@@ -45,9 +50,11 @@ def set_file_structure():
         gen_folder = testclass_path.replace("<project>", pj_name)+'/'
         report_folder = report_path.replace("<project>", pj_name)
         report_csv = f"{report_folder}/jacoco-report-csv/"
+        report_xml = f"{report_folder}/jacoco-report-xml/"
         utils.check_path(gen_folder)
         utils.check_path(f"{gen_folder}temp/")
         utils.check_path(report_csv)
+        utils.check_path(report_xml)
         
         for test_info in pj_info["focal-methods"]:
             id = test_info["id"]
@@ -78,14 +85,32 @@ def run(args):
     #     logger.info("Preparing dataset_info.json ...")
     #     DatasetProcessor = jpype.JClass("DatasetPrepare")
     #     DatasetProcessor.main([dataset_abs])
-    if args.project_index:
+    if args.project_index and args.incremental:
+        logger.info("Updating project index for changed source files ...")
+        dataset_info = utils.load_json(f"{dataset_path}/dataset_info.json")
+        for pj_name, pj_info in dataset_info.items():
+            PreProcess.update_project_index(FS, pj_name, pj_info)
+    elif args.project_index:
         logger.info("Constructing project index ...")
         ProjectPreprocessor = jpype.JClass("PreProcessor")
         ProjectPreprocessor.main([dataset_abs, f"{root_path}/{code_info_path}/json"])
+        # digests of the source files, for incremental updates (-P -I)
+        dataset_info = utils.load_json(f"{dataset_path}/dataset_info.json")
+        for pj_name, pj_info in dataset_info.items():
+            PreProcess.write_source_manifest(code_info_path, pj_name, f"{dataset_path}/{pj_info['project-url']}")
         # PreProcess.build_calling_graph(FS)
         # PreProcess.extract_invoke_patterns(FS)
         # IndexBuilder = jpype.JClass("IndexBuilder")
         # IndexBuilder.main(["group", f"{code_info_path}/json", f"{code_info_path}/lucene"])
+    if args.code_graph:
+        logger.info("Building calling graphs & extracting invoke patterns ...")
+        PreProcess.build_calling_graph(FS, args.jobs)
+        PreProcess.extract_invoke_patterns(FS, args.jobs)
+    if args.binary_index:
+        logger.info("Converting project index to binary format ...")
+        dataset_info = utils.load_json(f"{dataset_path}/dataset_info.json")
+        for pj_name in dataset_info.keys():
+            convert_project_index(code_info_path, pj_name)
     
     logger.info("preparation completed.")
     return
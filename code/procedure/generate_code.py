@@ -1,13 +1,206 @@
 import os
+import asyncio
 import logging
 import concurrent.futures
 from threading import Lock
 
 import tools.io_utils as io_utils
-from tools.llm_api import LLMCaller
+from tools.llm_api import LLMCaller, AsyncLLMCaller, SharedLLMCaller, get_llm_caller
+from tools.task_journal import TaskJournal, PartialResult, open_journal, stage_files, result_value
 from procedure.post_process import check_class_name, insert_test_case
 
 
+file_lock = Lock() # ensure thread-safe file writing
+
+'''
+The LLM stages are written as steps (generators): each LLM request is yielded as ("code" | "json", prompt)
+and the response is sent back. `run_steps` runs them in the calling thread with a synchronous caller;
+`arun_steps` awaits the requests on the event loop of the shared async caller and runs only the work
+between them (file IO, JPype) in executor threads.
+'''
+
+
+def _advance(steps, response):
+    # -> (False, next request) or (True, result of the steps)
+    try:
+        return False, steps.send(response)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+def run_steps(llm_caller:LLMCaller|SharedLLMCaller, steps):
+    done, value = _advance(steps, None)
+    while not done:
+        kind, prompt = value
+        response = llm_caller.get_response_code(prompt) if kind == "code" else llm_caller.get_response_json(prompt)
+        done, value = _advance(steps, response)
+    return value
+
+
+async def arun_steps(llm_caller:AsyncLLMCaller, executor:concurrent.futures.Executor, steps):
+    loop = asyncio.get_running_loop()
+    done, value = await loop.run_in_executor(executor, _advance, steps, None)
+    while not done:
+        kind, prompt = value
+        if kind == "code":
+            response = await llm_caller.get_response_code(prompt)
+        else:
+            response = await llm_caller.get_response_json(prompt)
+        done, value = await loop.run_in_executor(executor, _advance, steps, response)
+    return value
+
+
+def submit_stage(executor:concurrent.futures.Executor, llm_caller:LLMCaller|SharedLLMCaller, journal:TaskJournal,
+                 test_info:dict, stage:str, files:tuple, steps) -> concurrent.futures.Future:
+    '''
+    run the steps of a journaled stage of a focal method -> future of (skipped, result);
+    with the shared async caller the stage is a coroutine on its event loop and holds an executor thread
+    only between LLM requests, so requests in flight are not bounded by the executor size
+    '''
+    if isinstance(llm_caller, SharedLLMCaller):
+        return llm_caller.submit(journal.arun(test_info["id"], stage, *files, arun_steps, llm_caller.caller, executor, steps))
+    return executor.submit(journal.run, test_info["id"], stage, *files, run_steps, llm_caller, steps)
+
+
+def init_response_steps(test_info, project_prompt, project_response, gen_folder, save_res):
+    id = test_info["id"]
+    class_name = test_info["test-class"].split('.')[-1]
+    test_class_path = f"{gen_folder}/{class_name}.java"
+    prompt = io_utils.load_text(f"{project_prompt}/{id}/init_prompt.md")
+    code, response = yield ("code", prompt)
+    code = check_class_name(code, class_name)
+    with file_lock:
+        io_utils.write_text(test_class_path, code)
+        if save_res:
+            res_path = f"{project_response}/{id}/init_response.md"
+            io_utils.write_text(res_path, response)
+    # recorded as failed after saving, so a resumed run retries it
+    if response == "": return PartialResult(id, f"no response for the test class framework of {id}")
+    return id
+
+
+def process_init_response(llm_caller:LLMCaller, test_info, project_prompt, project_response, gen_folder, save_res):
+    return run_steps(llm_caller, init_response_steps(test_info, project_prompt, project_response, gen_folder, save_res))
+
+
+def case_response_steps(test_info, project_prompt, project_response, gen_folder, prompt_list, save_res):
+    logger = logging.getLogger(__name__)
+    class_name = test_info["test-class"].split('.')[-1]
+    id = test_info["id"]
+    save_path = f"{gen_folder}/{class_name}.java"
+    init_class = io_utils.load_text(save_path)
+    failed = []
+    for prompt_name in prompt_list:
+        prompt = io_utils.load_text(f"{project_prompt}/{id}/{prompt_name}_prompt.md")
+        prompt = prompt.replace('<initial_class>', init_class)
+        code, response = yield ("code", prompt)
+        if response == "": failed.append(prompt_name)
+        logger.debug("finish get response")
+        init_class = insert_test_case(init_class, code)
+        logger.debug("finish insert test case")
+        if save_res:
+            response_path = f"{project_response}/{id}/{prompt_name}_response.md"
+            with file_lock:
+                io_utils.write_text(response_path, response)
+    with file_lock:
+        io_utils.write_text(save_path, init_class)
+    if len(failed) > 0: return PartialResult(id, f"no response for prompts {failed} of {id}")
+    return id
+
+
+def process_case_response(llm_caller:LLMCaller, test_info, project_prompt, project_response, gen_folder, prompt_list, save_res):
+    return run_steps(llm_caller, case_response_steps(test_info, project_prompt, project_response, gen_folder, prompt_list, save_res))
+
+
+def case_json_steps(test_info, project_prompt, project_response, prompt_list, save_res):
+    '''
+    generate test cases in json format, saved to `<response>/<id>/cases.json`
+    '''
+    logger = logging.getLogger(__name__)
+    id = test_info["id"]
+    response_folder = f"{project_response}/{id}"
+    prompt_folder = f"{project_prompt}/{id}"
+    cases_json = []
+    failed = []
+    for prompt_name in prompt_list:
+        if prompt_name == "gencode": continue
+        prompt = io_utils.load_text(f"{prompt_folder}/{prompt_name}_prompt.md")
+        prompt.replace('<cases_json>', str(cases_json))
+        case_data, response = yield ("json", prompt)
+        logger.debug("finish get response")
+        if case_data is None: failed.append(prompt_name)
+        try:
+            cases_json = merge_testcases(cases_json, case_data)
+        except Exception as e:
+            logger.warning(f"Error while adding test cases for {id} from prompt {prompt_name}: {e}")
+        logger.debug("finish insert test case")
+        if save_res:
+            with file_lock:
+                io_utils.write_text(f"{response_folder}/{prompt_name}_response.md", response)
+    with file_lock:
+        io_utils.write_json(f"{response_folder}/cases.json", cases_json)
+    # the test code is still generated from the cases of the other prompts
+    if len(failed) > 0: return PartialResult(cases_json, f"no test cases from prompts {failed} of {id}")
+    return cases_json
+
+
+def process_case_json(llm_caller:LLMCaller, test_info, project_prompt, project_response, prompt_list, save_res):
+    return run_steps(llm_caller, case_json_steps(test_info, project_prompt, project_response, prompt_list, save_res))
+
+
+def gencode_steps(test_info, project_prompt, project_response, gen_folder, cases_json, save_res):
+    '''
+    generate test code based on test cases, loaded from `<response>/<id>/cases.json` if cases_json is None
+    '''
+    id = test_info["id"]
+    response_folder = f"{project_response}/{id}"
+    if cases_json is None:
+        cases_json = io_utils.load_json(f"{response_folder}/cases.json")
+    class_name = test_info["test-class"].split('.')[-1]
+    save_path = f"{gen_folder}/{class_name}.java"
+    init_class = io_utils.load_text(save_path)
+    prompt = io_utils.load_text(f"{project_prompt}/{id}/gencode_prompt.md")
+    prompt = prompt.replace('<initial_class>', init_class).replace('<cases_json>', str(cases_json))
+    code, response = yield ("code", prompt)
+    init_class = insert_test_case(init_class, code)
+    with file_lock:
+        io_utils.write_text(save_path, init_class)
+        if save_res:
+            io_utils.write_text(f"{response_folder}/gencode_response.md", response)
+    if response == "": return PartialResult(id, f"no response for the test code of {id}")
+    return id
+
+
+def process_gencode_response(llm_caller:LLMCaller, test_info, project_prompt, project_response, gen_folder, cases_json, save_res):
+    return run_steps(llm_caller, gencode_steps(test_info, project_prompt, project_response, gen_folder, cases_json, save_res))
+
+
+def process_case_then_code(llm_caller:LLMCaller, test_info, project_prompt, project_response, gen_folder, prompt_list, save_res,
+                           journal:TaskJournal|None=None):
+    if journal is None:
+        cases_json = result_value(process_case_json(llm_caller, test_info, project_prompt, project_response, prompt_list, save_res))
+        return result_value(process_gencode_response(llm_caller, test_info, project_prompt, project_response, gen_folder, cases_json, save_res))
+    id = test_info["id"]
+    files = lambda stage: stage_files(stage, test_info, project_prompt, project_response, gen_folder, prompt_list)
+    _, cases_json = journal.run(id, "cases", *files("cases"), process_case_json,
+                                llm_caller, test_info, project_prompt, project_response, prompt_list, save_res)
+    journal.run(id, "gencode", *files("gencode"), process_gencode_response,
+                llm_caller, test_info, project_prompt, project_response, gen_folder, cases_json, save_res)
+    return id
+
+
+async def aprocess_case_then_code(llm_caller:AsyncLLMCaller, executor, test_info, project_prompt, project_response, gen_folder,
+                                  prompt_list, save_res, journal:TaskJournal):
+    id = test_info["id"]
+    files = lambda stage: stage_files(stage, test_info, project_prompt, project_response, gen_folder, prompt_list)
+    _, cases_json = await journal.arun(id, "cases", *files("cases"), arun_steps, llm_caller, executor,
+                                       case_json_steps(test_info, project_prompt, project_response, prompt_list, save_res))
+    await journal.arun(id, "gencode", *files("gencode"), arun_steps, llm_caller, executor,
+                       gencode_steps(test_info, project_prompt, project_response, gen_folder, cases_json, save_res))
+    return id
+
+
+
 def generate_testclass_framework(file_structure, task_setting, dataset_info: dict):
     prompt_path = file_structure.PROMPT_PATH
     response_path = file_structure.RESPONSE_PATH
@@ -19,23 +212,8 @@ def generate_testclass_framework(file_structure, task_setting, dataset_info: dic
     project_select = True if len(projects)>0 else False
     case_select = True if len(case_list)>0 else False
     logger = logging.getLogger(__name__)
-    file_lock = Lock() # ensure thread-safe file writing
-    llm_callers = [LLMCaller() for _ in range(mworkers)]
-
-    def process_init_response(llm_caller:LLMCaller, test_info, project_prompt, project_response, gen_folder):
-        id = test_info["id"]
-        class_name = test_info["test-class"].split('.')[-1]
-        test_class_path = f"{gen_folder}/{class_name}.java"
-        prompt = io_utils.load_text(f"{project_prompt}/{id}/init_prompt.md")
-        code, response = llm_caller.get_response_code(prompt)
-        code = check_class_name(code, class_name)
-        with file_lock:
-            io_utils.write_text(test_class_path, code)
-            if save_res:
-                res_path = f"{project_response}/{id}/init_response.md"
-                io_utils.write_text(res_path, response)
-        return id
-    
+    llm_callers = [get_llm_caller() for _ in range(mworkers)]
+
     for pj_name, pj_info in dataset_info.items():
         if project_select and pj_name not in projects: continue
         logger.info(f"Generating test class framework for project {pj_name}...")
@@ -43,27 +221,29 @@ def generate_testclass_framework(file_structure, task_setting, dataset_info: dic
         project_response = response_path.replace("<project>", pj_name)
         gen_folder = gen_path.replace("<project>", pj_name)
         if not os.path.exists(gen_folder): os.makedirs(gen_folder)
+        journal = open_journal(file_structure, task_setting, pj_name)
         logger.debug(f"max workers: {mworkers}")
         with concurrent.futures.ThreadPoolExecutor(max_workers=mworkers) as executor:
             futures = []
             api_count = 0
             for test_info in pj_info["focal-methods"]:
                 if case_select and test_info["id"] not in case_list: continue
-                future = executor.submit(
-                    process_init_response, 
+                future = submit_stage(
+                    executor,
                     llm_callers[api_count],
-                    test_info, 
-                    project_prompt, 
-                    project_response, 
-                    gen_folder
+                    journal,
+                    test_info,
+                    "framework",
+                    stage_files("framework", test_info, project_prompt, project_response, gen_folder, []),
+                    init_response_steps(test_info, project_prompt, project_response, gen_folder, save_res)
                 )
                 futures.append(future)
                 api_count = (api_count+1) % mworkers
             # wait for all tasks complete
             for future in concurrent.futures.as_completed(futures):
                 try:
-                    id = future.result()
-                    logger.info(f"Completed test class framework generation for {id}")
+                    skipped, id = future.result()
+                    if not skipped: logger.info(f"Completed test class framework generation for {id}")
                 except Exception as e:
                     logger.error(f"Error processing test framework for: {e}")
     return
@@ -81,28 +261,7 @@ def generate_testcase_code(file_structure, task_setting, dataset_info: dict):
     project_select = True if len(projects)>0 else False
     case_select = True if len(case_list)>0 else False
     logger = logging.getLogger(__name__)
-    file_lock = Lock()
-    llm_callers = [LLMCaller() for _ in range(mworkers)]
-
-    def process_case_response(llm_caller:LLMCaller, test_info, project_prompt, project_response, gen_folder):
-        class_name = test_info["test-class"].split('.')[-1]
-        id = test_info["id"]
-        save_path = f"{gen_folder}/{class_name}.java"
-        init_class = io_utils.load_text(save_path)
-        for prompt_name in prompt_list:
-            prompt = io_utils.load_text(f"{project_prompt}/{id}/{prompt_name}_prompt.md")
-            prompt = prompt.replace('<initial_class>', init_class)
-            code, response = llm_caller.get_response_code(prompt)
-            logger.debug("finish get response")
-            init_class = insert_test_case(init_class, code)
-            logger.debug("finish insert test case")
-            if save_res:
-                response_path = f"{project_response}/{id}/{prompt_name}_response.md"
-                with file_lock:
-                    io_utils.write_text(response_path, response)
-        with file_lock:
-            io_utils.write_text(save_path, init_class)
-        return id
+    llm_callers = [get_llm_caller() for _ in range(mworkers)]
 
     for pj_name, pj_info in dataset_info.items():
         if project_select and pj_name not in projects: continue
@@ -110,27 +269,29 @@ def generate_testcase_code(file_structure, task_setting, dataset_info: dict):
         project_prompt = prompt_path.replace("<project>", pj_name)
         project_response = response_path.replace("<project>", pj_name)
         gen_folder = gen_path.replace("<project>", pj_name)
+        journal = open_journal(file_structure, task_setting, pj_name)
         logger.debug(f"max workers: {mworkers}")
         with concurrent.futures.ThreadPoolExecutor(max_workers=mworkers) as executor:
             futures = []
             api_count = 0
             for test_info in pj_info["focal-methods"]:
                 if case_select and test_info["id"] not in case_list: continue
-                future = executor.submit(
-                    process_case_response, 
+                future = submit_stage(
+                    executor,
                     llm_callers[api_count],
-                    test_info, 
-                    project_prompt, 
-                    project_response, 
-                    gen_folder
+                    journal,
+                    test_info,
+                    "cases",
+                    stage_files("cases", test_info, project_prompt, project_response, gen_folder, prompt_list),
+                    case_response_steps(test_info, project_prompt, project_response, gen_folder, prompt_list, save_res)
                 )
                 futures.append(future)
                 api_count = (api_count+1) % mworkers
             # wait for all tasks complete
             for future in concurrent.futures.as_completed(futures):
                 try:
-                    id = future.result()
-                    logger.info(f"Completed test case generation for {id}")
+                    skipped, id = future.result()
+                    if not skipped: logger.info(f"Completed test case generation for {id}")
                 except Exception as e:
                     logger.error(f"Error processing test case: {e}")
     return
@@ -205,44 +366,7 @@ def generate_case_then_code(file_structure, task_setting, dataset_info: dict):
     project_select = True if len(projects)>0 else False
     case_select = True if len(case_list)>0 else False
     logger = logging.getLogger(__name__)
-    file_lock = Lock()
-    llm_callers = [LLMCaller() for _ in range(mworkers)]
-
-    def process_case_response(llm_caller:LLMCaller, test_info, project_prompt, project_response, gen_folder):
-        id = test_info["id"]
-        response_folder = f"{project_response}/{id}"
-        prompt_folder = f"{project_prompt}/{id}"
-        # generate test cases in json format
-        cases_json = []
-        for prompt_name in prompt_list:
-            if prompt_name == "gencode": continue
-            prompt = io_utils.load_text(f"{prompt_folder}/{prompt_name}_prompt.md")
-            prompt.replace('<cases_json>', str(cases_json))
-            case_data, response = llm_caller.get_response_json(prompt)
-            logger.debug("finish get response")
-            try:
-                cases_json = merge_testcases(cases_json, case_data)
-            except Exception as e:
-                logger.warning(f"Error while adding test cases for {id} from prompt {prompt_name}: {e}")
-            logger.debug("finish insert test case")
-            if save_res:
-                with file_lock:
-                    io_utils.write_text(f"{response_folder}/{prompt_name}_response.md", response)
-        with file_lock:
-            io_utils.write_json(f"{response_folder}/cases.json", cases_json)
-        # generate test code based on test cases
-        class_name = test_info["test-class"].split('.')[-1]
-        save_path = f"{gen_folder}/{class_name}.java"
-        init_class = io_utils.load_text(save_path)
-        prompt = io_utils.load_text(f"{prompt_folder}/gencode_prompt.md")
-        prompt = prompt.replace('<initial_class>', init_class).replace('<cases_json>', str(cases_json))
-        code, response = llm_caller.get_response_code(prompt)
-        init_class = insert_test_case(init_class, code)
-        with file_lock:
-            io_utils.write_text(save_path, init_class)
-            if save_res:
-                io_utils.write_text(f"{response_folder}/gencode_response.md", response)
-        return id
+    llm_callers = [get_llm_caller() for _ in range(mworkers)]
 
     for pj_name, pj_info in dataset_info.items():
         if project_select and pj_name not in projects: continue
@@ -250,20 +374,30 @@ def generate_case_then_code(file_structure, task_setting, dataset_info: dict):
         project_prompt = prompt_path.replace("<project>", pj_name)
         project_response = response_path.replace("<project>", pj_name)
         gen_folder = gen_path.replace("<project>", pj_name)
+        journal = open_journal(file_structure, task_setting, pj_name)
         logger.debug(f"max workers: {mworkers}")
         with concurrent.futures.ThreadPoolExecutor(max_workers=mworkers) as executor:
             futures = []
             api_count = 0
             for test_info in pj_info["focal-methods"]:
                 if case_select and test_info["id"] not in case_list: continue
-                future = executor.submit(
-                    process_case_response,
-                    llm_callers[api_count],
-                    test_info,
-                    project_prompt,
-                    project_response,
-                    gen_folder
-                )
+                llm_caller = llm_callers[api_count]
+                if isinstance(llm_caller, SharedLLMCaller):
+                    # the stages are coroutines on the loop of the shared caller, see `submit_stage`
+                    future = llm_caller.submit(aprocess_case_then_code(llm_caller.caller, executor, test_info, project_prompt,
+                                                                       project_response, gen_folder, prompt_list, save_res, journal))
+                else:
+                    future = executor.submit(
+                        process_case_then_code,
+                        llm_caller,
+                        test_info,
+                        project_prompt,
+                        project_response,
+                        gen_folder,
+                        prompt_list,
+                        save_res,
+                        journal
+                    )
                 futures.append(future)
                 api_count = (api_count+1) % mworkers
             # wait for all tasks complete
@@ -5,6 +5,51 @@ import tools.io_utils as utils
 from tools.code_search import CodeSearcher
 from tools.prompt_generator import PromptGenerator
 
+
+def build_init_prompt(searcher:CodeSearcher, generator:PromptGenerator, test_info:dict, prompt_dir:str):
+    if not os.path.exists(prompt_dir):
+        os.makedirs(prompt_dir)
+    # get context
+    construct_context = searcher.collect_construct_context(test_info["class"], test_info["method-name"], test_info["source-path"])
+    contxet_file = f"{prompt_dir}/init_context.json"
+    utils.write_json(contxet_file, construct_context)
+    # generate prompt
+    test_class_name =  test_info["test-class"].split('.')[-1]
+    content = {
+        "method_name": test_info["method-name"],
+        "class_name": test_info["class"].split('.')[-1],
+        "class_code": test_info["class-code"],
+        "package_name": test_info["package"],
+        "class_name": test_class_name,
+        "context_dict": construct_context,
+    }
+    prompt = generator.generate_single('init', content)
+    # save prompt
+    result_path = f"{prompt_dir}/init_prompt.md"
+    utils.write_text(result_path, prompt)
+    return
+
+
+def build_test_case_prompts(searcher:CodeSearcher, generator:PromptGenerator, test_info:dict, prompt_dir:str, sim_funcs=None):
+    # get context
+    usage_context =searcher.collect_usage_context(test_info["class"], test_info["method-name"], sim_funcs)
+    contxet_file = f"{prompt_dir}/usage_context.json"
+    utils.write_json(contxet_file, usage_context)
+    # generate prompt
+    content = {
+        "method_name": test_info["method-name"],
+        "class_name": test_info["class"].split('.')[-1],
+        "class_code": test_info["class-code"],
+        "context_dict": usage_context,
+    }
+    prompt_list = generator.generate_group(content)
+    # save prompt
+    for tmp_name, prompt in prompt_list.items():
+        result_path = f"{prompt_dir}/{tmp_name}_prompt.md"
+        utils.write_text(result_path, prompt)
+    return
+
+
 def generate_init_prompts(file_structure, task_setting, dataset_info:dict):
     dataset_dir = file_structure.DATASET_PATH
     code_info_path = file_structure.CODE_INFO_PATH
@@ -22,28 +67,8 @@ def generate_init_prompts(file_structure, task_setting, dataset_info:dict):
         project_path = f"{dataset_dir}/{project_url}"
         searcher = CodeSearcher(project_path, pj_name, code_info_path, top_k)
         for test_info in pj_info["focal-methods"]:
-            id = test_info["id"]
-            prompt_dir = f"{prompt_path}/{id}".replace("<project>", pj_name)
-            if not os.path.exists(prompt_dir):
-                os.makedirs(prompt_dir)
-            # get context
-            construct_context = searcher.collect_construct_context(test_info["class"], test_info["method-name"], test_info["source-path"])
-            contxet_file = f"{prompt_dir}/init_context.json"
-            utils.write_json(contxet_file, construct_context)
-            # generate prompt
-            test_class_name =  test_info["test-class"].split('.')[-1]
-            content = {
-                "method_name": test_info["method-name"],
-                "class_name": test_info["class"].split('.')[-1],
-                "class_code": test_info["class-code"],
-                "package_name": test_info["package"],
-                "class_name": test_class_name,
-                "context_dict": construct_context,
-            }
-            prompt = generator.generate_single('init', content)
-            # save prompt
-            result_path = f"{prompt_dir}/init_prompt.md"
-            utils.write_text(result_path, prompt)
+            prompt_dir = f"{prompt_path}/{test_info['id']}".replace("<project>", pj_name)
+            build_init_prompt(searcher, generator, test_info, prompt_dir)
 
 
 def generate_test_case_prompts(file_structure, task_setting, dataset_info:dict):
@@ -64,23 +89,13 @@ def generate_test_case_prompts(file_structure, task_setting, dataset_info:dict):
         project_url = pj_info["project-url"]
         project_path = f"{dataset_dir}/{project_url}"
         searcher = CodeSearcher(project_path, pj_name, code_info_path, top_k)
+        # search similar functions of all focal methods in one pass
+        queries = {}
+        for test_info in pj_info["focal-methods"]:
+            queries[test_info["id"]] = searcher.get_usage_queries(test_info["class"], test_info["method-name"])
+        sim_results = searcher.batch_search_similar_function(queries)
         for test_info in pj_info["focal-methods"]:
-            id = test_info["id"]
-            prompt_dir = f"{prompt_path}/{id}".replace("<project>", pj_name)
-            # get context
-            usage_context =searcher.collect_usage_context(test_info["class"], test_info["method-name"])
-            contxet_file = f"{prompt_dir}/usage_context.json"
-            utils.write_json(contxet_file, usage_context)
-            # generate prompt
-            content = {
-                "method_name": test_info["method-name"],
-                "class_name": test_info["class"].split('.')[-1],
-                "class_code": test_info["class-code"],
-                "context_dict": usage_context,
-            }
-            prompt_list = generator.generate_group(content)
-            # save prompt
-            for tmp_name, prompt in prompt_list.items():
-                result_path = f"{prompt_dir}/{tmp_name}_prompt.md"
-                utils.write_text(result_path, prompt)
+            prompt_dir = f"{prompt_path}/{test_info['id']}".replace("<project>", pj_name)
+            build_test_case_prompts(searcher, generator, test_info, prompt_dir, sim_results[test_info["id"]])
+        searcher.close()
     return
\ No newline at end of file
@@ -0,0 +1,340 @@
+import os
+import time
+import logging
+import functools
+import threading
+import concurrent.futures
+
+from tools.llm_api import LLMCaller, get_llm_caller, get_shared_llm_caller
+from tools.code_search import CodeSearcher
+from tools.code_index import load_code_info_index
+from tools.prompt_generator import PromptGenerator
+from tools.sandbox import SandboxManager
+from tools.task_journal import TaskJournal, open_journal, stage_files
+import procedure.generate_prompt as GenPrompt
+import procedure.generate_code as GenCode
+from procedure.post_process import CodeRepairer
+
+'''
+Pipelined generation: every focal method moves through the stages on its own,
+    prompt -> framework -> cases -> gencode -> verify
+each stage has a bounded worker pool, so LLM calls for one method overlap with
+prompt construction and javac/JUnit runs of other methods.
+With the shared async LLM caller, the LLM stages are coroutines on its event loop
+and take a worker of their stage only between LLM requests.
+'''
+STAGES = ["prompt", "framework", "cases", "gencode", "verify"]
+LLM_STAGES = ["framework", "cases", "gencode"]
+
+
+class ProjectContext:
+    '''
+    per-project resources shared by the tasks of a project,
+    searcher and repairer are not thread-safe and guarded by their locks;
+    with more than one verify worker, each worker repairs in its own sandbox
+    '''
+    name: str
+    project_path: str
+    project_prompt: str
+    project_response: str
+    project_fix: str
+    gen_folder: str
+    searcher: CodeSearcher
+    sim_results: dict
+    code_repair: CodeRepairer|None
+    sandboxes: SandboxManager|None
+    journal: TaskJournal
+    search_lock: threading.Lock
+    verify_lock: threading.Lock
+
+    def __init__(self, file_structure, task_setting, pj_name, pj_info, test_infos, verify_workers=1):
+        self.name = pj_name
+        self.project_path = f"{file_structure.DATASET_PATH}/{pj_info['project-url']}"
+        self.project_prompt = file_structure.PROMPT_PATH.replace("<project>", pj_name)
+        self.project_response = file_structure.RESPONSE_PATH.replace("<project>", pj_name)
+        self.project_fix = file_structure.FIX_PATH.replace("<project>", pj_name)
+        self.gen_folder = file_structure.TESTCLASSS_PATH.replace("<project>", pj_name)
+        if not os.path.exists(self.gen_folder): os.makedirs(self.gen_folder)
+        self.code_info_path = file_structure.CODE_INFO_PATH
+        self.dependency_path = f"{os.getcwd().replace(os.sep, '/')}/{file_structure.DEPENDENCY_PATH}"
+        self.fix_tries = task_setting.FIX_TRIES
+        self.searcher = CodeSearcher(self.project_path, pj_name, self.code_info_path, task_setting.SIM_TOP_K)
+        # search similar functions of all focal methods of the project in one pass
+        queries = {tinfo["id"]: self.searcher.get_usage_queries(tinfo["class"], tinfo["method-name"]) for tinfo in test_infos}
+        self.sim_results = self.searcher.batch_search_similar_function(queries)
+        self.test_infos = test_infos
+        self.remaining = len(test_infos)
+        self.code_repair = None
+        self.repairers = {}
+        self.sandboxes = SandboxManager(self.project_path, verify_workers) if verify_workers > 1 else None
+        self.journal = open_journal(file_structure, task_setting, pj_name)
+        self.search_lock = threading.Lock()
+        self.verify_lock = threading.Lock()
+        self.count_lock = threading.Lock()
+
+    def _new_repairer(self, project_url):
+        import_dict = load_code_info_index(f"{self.code_info_path}/json/{self.name}.json").import_dict
+        return CodeRepairer(self.dependency_path, project_url, self.gen_folder, self.fix_tries, import_dict)
+
+    def check_test_class(self, test_info, prompt_path, response_path, context_path):
+        if self.sandboxes is None:
+            # test classes are compiled and executed in the project folder
+            with self.verify_lock:
+                if self.code_repair is None:
+                    self.code_repair = self._new_repairer(self.project_path)
+                self.code_repair.check_test_class(test_info, prompt_path, response_path, context_path)
+            return
+        with self.verify_lock:
+            if not self.sandboxes.prepared:
+                self.sandboxes.prepare()
+                self.repairers = {sandbox.index: self._new_repairer(sandbox.root) for sandbox in self.sandboxes.sandboxes}
+        with self.sandboxes.sandbox() as sandbox:
+            self.repairers[sandbox.index].check_test_class(test_info, prompt_path, response_path, context_path)
+            self.sandboxes.collect(sandbox, test_info["test-path"], test_info["test-class"])
+        return
+
+    def task_done(self):
+        with self.count_lock:
+            self.remaining -= 1
+            finished = self.remaining == 0
+        if finished:
+            with self.search_lock:
+                self.searcher.close()
+            for code_repair in [self.code_repair] + list(self.repairers.values()):
+                if code_repair is not None: code_repair.close()
+            if self.sandboxes is not None and self.sandboxes.prepared:
+                self.sandboxes.merge(self.test_infos)
+                self.sandboxes.cleanup()
+        return
+
+
+class FocalMethodTask:
+    project: ProjectContext
+    test_info: dict
+    id: str
+    cases_json: list|None
+    stage_times: dict
+
+    def __init__(self, project:ProjectContext, test_info:dict):
+        self.project = project
+        self.test_info = test_info
+        self.id = test_info["id"]
+        self.cases_json = None
+        self.stage_times = {}
+
+
+class PipelineScheduler:
+    '''
+    DAG scheduler over (focal method, stage), each stage owns a ThreadPoolExecutor
+    stage_workers: {"<stage>": max workers}
+    '''
+    def __init__(self, task_setting, stage_workers:dict):
+        self.prompt_list = task_setting.PROMPT_LIST
+        self.case_then_code = task_setting.CASE_THEN_CODE
+        self.save_res = task_setting.SAVE_INTER_RESULT
+        self.executors = {
+            stage: concurrent.futures.ThreadPoolExecutor(max_workers=stage_workers[stage], thread_name_prefix=stage)
+            for stage in STAGES
+        }
+        self.handlers = {
+            "prompt": self.run_prompt,
+            "framework": functools.partial(self.run_llm_stage, stage="framework"),
+            "cases": functools.partial(self.run_llm_stage, stage="cases"),
+            "gencode": functools.partial(self.run_llm_stage, stage="gencode"),
+            "verify": self.run_verify,
+        }
+        self.shared_caller = get_shared_llm_caller()
+        self.init_generator = PromptGenerator('./templates', [])
+        self.case_generator = PromptGenerator('./templates', self.prompt_list)
+        self.local = threading.local()
+        self.pending = 0
+        self.condition = threading.Condition()
+        self.busy_time = {stage: 0.0 for stage in STAGES}
+        self.completed = []
+        self.failed = []
+        self.logger = logging.getLogger(__name__)
+
+    def _llm_caller(self) -> LLMCaller:
+        # one LLM caller per worker thread, or the shared async caller if ASYNC_CLIENT
+        caller = getattr(self.local, "llm_caller", None)
+        if caller is None:
+            caller = get_llm_caller()
+            self.local.llm_caller = caller
+        return caller
+
+    def run_prompt(self, task:FocalMethodTask):
+        project = task.project
+        prompt_dir = f"{project.project_prompt}/{task.id}"
+        with project.search_lock:
+            GenPrompt.build_init_prompt(project.searcher, self.init_generator, task.test_info, prompt_dir)
+            GenPrompt.build_test_case_prompts(project.searcher, self.case_generator, task.test_info, prompt_dir, project.sim_results[task.id])
+        return
+
+    def _run_journaled(self, task:FocalMethodTask, stage:str, func, *args):
+        # skipped if the stage of the task is up to date in the journal of the project
+        project = task.project
+        files = stage_files(stage, task.test_info, project.project_prompt, project.project_response, project.gen_folder, self.prompt_list)
+        skipped, result = project.journal.run(task.id, stage, *files, func, *args)
+        if skipped: self.logger.info(f"stage {stage} of {task.id} is up to date")
+        return result
+
+    def _llm_steps(self, task:FocalMethodTask, stage:str):
+        # steps of an LLM stage (see procedure.generate_code), None if there is nothing to do
+        project = task.project
+        args = (task.test_info, project.project_prompt, project.project_response)
+        if stage == "framework":
+            return GenCode.init_response_steps(*args, project.gen_folder, self.save_res)
+        if stage == "cases":
+            if self.case_then_code:
+                return GenCode.case_json_steps(*args, self.prompt_list, self.save_res)
+            return GenCode.case_response_steps(*args, project.gen_folder, self.prompt_list, self.save_res)
+        # test code is generated together with the cases if not CASE_THEN_CODE
+        if not self.case_then_code: return None
+        # cases_json is None if the cases stage was skipped, the steps load the cases of the last run
+        return GenCode.gencode_steps(*args, project.gen_folder, task.cases_json, self.save_res)
+
+    def _llm_stage_done(self, task:FocalMethodTask, stage:str, result):
+        if stage == "cases" and self.case_then_code:
+            task.cases_json = result
+        return
+
+    def run_llm_stage(self, task:FocalMethodTask, stage:str):
+        steps = self._llm_steps(task, stage)
+        if steps is None: return
+        result = self._run_journaled(task, stage, GenCode.run_steps, self._llm_caller(), steps)
+        self._llm_stage_done(task, stage, result)
+        return
+
+    async def arun_llm_stage(self, task:FocalMethodTask, stage:str):
+        steps = self._llm_steps(task, stage)
+        if steps is None: return
+        project = task.project
+        files = stage_files(stage, task.test_info, project.project_prompt, project.project_response, project.gen_folder, self.prompt_list)
+        skipped, result = await project.journal.arun(task.id, stage, *files, GenCode.arun_steps,
+                                                     self.shared_caller.caller, self.executors[stage], steps)
+        if skipped: self.logger.info(f"stage {stage} of {task.id} is up to date")
+        self._llm_stage_done(task, stage, result)
+        return
+
+    def run_verify(self, task:FocalMethodTask):
+        project = task.project
+        context_path = f"{project.project_prompt}/{task.id}/usage_context.json"
+        case_prompt_path = f"{project.project_fix}/{task.id}/repair_prompt"
+        case_response_path = f"{project.project_fix}/{task.id}/repair_response"
+        self._run_journaled(task, "verify", project.check_test_class, task.test_info, case_prompt_path, case_response_path, context_path)
+        return
+
+    def _run_stage(self, task:FocalMethodTask, index:int):
+        start = time.time()
+        try:
+            self.handlers[STAGES[index]](task)
+        except Exception as e:
+            self._stage_done(task, index, start, e)
+            return
+        self._stage_done(task, index, start)
+        return
+
+    async def _arun_stage(self, task:FocalMethodTask, index:int):
+        start = time.time()
+        try:
+            await self.arun_llm_stage(task, STAGES[index])
+        except Exception as e:
+            self._stage_done(task, index, start, e)
+            return
+        self._stage_done(task, index, start)
+        return
+
+    def _stage_done(self, task:FocalMethodTask, index:int, start:float, error:Exception|None=None):
+        stage = STAGES[index]
+        elapsed = time.time() - start
+        task.stage_times[stage] = elapsed
+        with self.condition:
+            self.busy_time[stage] += elapsed
+        if error is not None:
+            self.logger.error(f"Error in stage {stage} of {task.id}: {error}")
+            self._finish(task, False)
+            return
+        self.logger.debug(f"stage {stage} of {task.id} finished in {elapsed:.2f} seconds")
+        if index + 1 < len(STAGES):
+            self._submit(task, index + 1)
+        else:
+            self._finish(task, True)
+        return
+
+    def _submit(self, task:FocalMethodTask, index:int):
+        # exceptions in the executor threads are not seen by anyone, a task that can not go on is finished as failed
+        stage = STAGES[index]
+        try:
+            if self.shared_caller is not None and stage in LLM_STAGES:
+                self.shared_caller.submit(self._arun_stage(task, index))
+            else:
+                self.executors[stage].submit(self._run_stage, task, index)
+        except Exception as e:
+            self.logger.error(f"Error in submitting stage {stage} of {task.id}: {e}")
+            self._finish(task, False)
+        return
+
+    def _finish(self, task:FocalMethodTask, success:bool):
+        try:
+            task.project.task_done()
+        except Exception as e:
+            self.logger.exception(f"Error in finishing project of {task.id}: {e}")
+        finally:
+            with self.condition:
+                if success:
+                    self.completed.append(task.id)
+                    self.logger.info(f"Completed pipeline for {task.id}")
+                else:
+                    self.failed.append(task.id)
+                self.pending -= 1
+                self.condition.notify_all()
+        return
+
+    def add_task(self, task:FocalMethodTask):
+        with self.condition:
+            self.pending += 1
+        self._submit(task, 0)
+        return
+
+    def wait(self):
+        with self.condition:
+            while self.pending > 0:
+                self.condition.wait()
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+        return
+
+
+def get_stage_workers(task_setting):
+    mworkers = task_setting.MAX_WORKERS
+    stage_workers = {"prompt": 2, "framework": mworkers, "cases": mworkers, "gencode": mworkers, "verify": 1}
+    stage_workers.update(getattr(task_setting, "STAGE_WORKERS", {}))
+    return stage_workers
+
+
+def run_pipeline(file_structure, task_setting, dataset_info:dict):
+    projects = task_setting.PROJECTS
+    case_list = task_setting.CASES_LIST
+    project_select = True if len(projects)>0 else False
+    case_select = True if len(case_list)>0 else False
+    logger = logging.getLogger(__name__)
+    stage_workers = get_stage_workers(task_setting)
+    logger.info(f"pipeline stage workers: {stage_workers}")
+    scheduler = PipelineScheduler(task_setting, stage_workers)
+    start_time = time.time()
+
+    for pj_name, pj_info in dataset_info.items():
+        if project_select and pj_name not in projects: continue
+        test_infos = [tinfo for tinfo in pj_info["focal-methods"] if not case_select or tinfo["id"] in case_list]
+        if len(test_infos) == 0: continue
+        logger.info(f"Scheduling {len(test_infos)} focal methods of project {pj_name}...")
+        project = ProjectContext(file_structure, task_setting, pj_name, pj_info, test_infos, stage_workers["verify"])
+        for test_info in test_infos:
+            scheduler.add_task(FocalMethodTask(project, test_info))
+    scheduler.wait()
+
+    elapsed = time.time() - start_time
+    for stage in STAGES:
+        logger.info(f"busy time of stage {stage}: {scheduler.busy_time[stage]:.2f} seconds ({stage_workers[stage]} workers)")
+    logger.info(f"pipeline finished in {elapsed:.2f} seconds, {len(scheduler.completed)} completed, {len(scheduler.failed)} failed")
+    return scheduler
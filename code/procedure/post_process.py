@@ -4,13 +4,18 @@ import copy
 from sys import flags
 import jpype
 import logging
+import concurrent.futures
 from enum import Enum
 
 from tools import io_utils
-from tools.llm_api import LLMCaller
+from tools.llm_api import LLMCaller, get_llm_caller
+from tools.code_index import load_code_info_index
 from tools.code_analysis import JavaCodeEditor
+from tools.diagnostics import CompileDiagnostic, errors_in_file, parse_javac_output
 from tools.execute_test import JavaRunner
 from tools.prompt_generator import PromptGenerator
+from tools.sandbox import SandboxManager
+from tools.task_journal import open_journal, stage_files
 
 
 def check_class_name(init_class:str, tcname:str, pcname:str=""):
@@ -66,7 +71,7 @@ class CodeRepairer(JavaRunner):
         self.testclass_path = tc_path
         self.temp_path = f"{self.testclass_path}/temp/"
         self.import_dict = impt_dict
-        self.llm_caller = LLMCaller()
+        self.llm_caller = get_llm_caller()
         self.prompt_gen = PromptGenerator('./templates', [])
         self.parser = JavaCodeEditor()
         self.class_editor = jpype.JClass("editcode.TestClassUpdator")
@@ -91,34 +96,27 @@ class CodeRepairer(JavaRunner):
         return (VerifyResult.PASS, "", passrate)
 
 
-    def parse_feedback(self, feedback:str, class_path:str):
+    def parse_feedback(self, feedback:str, class_path:str) -> list[CompileDiagnostic]:
         '''
-        Parse the compilation feedback to get the error line number and error message.
+        Get the compilation errors of the test class, as diagnostic records (line, column, message, symbol).
+        Diagnostics of the last compilation are used, the feedback text is parsed if there are none.
         '''
-        rule_fixes = []
-        llm_fixes = []
-        split_str = class_path.replace("/", "\\")
-        errors = feedback.split(f"{split_str}:")
-        for error in errors:
-            if str(error).find(": error: ")==-1: continue
-            splits = error.split(": error: ")
-            try:
-                line = int(splits[0]) - 1
-                msg = splits[1]
-                if msg.find("cannot find symbol") > -1:
-                    rule_fixes.append([line, msg, RuleError.UNRESLOVE_SYMBOL])
-                elif msg.find("unreported exception") > -1:
-                    rule_fixes.append([line, msg, RuleError.UNREPORTED_EXCEPTION])
-                # elif msg.find("private access")>-1 and msg.find(method_name)>-1:
-                #     rule_fixes.append([line, msg, RuleError.PRIVATE_ACCESS])
-                llm_fixes.append([line, msg])
-            except:
-                continue
-        return [rule_fixes, llm_fixes]
+        diagnostics = self.diagnostics if self.diagnostics is not None else parse_javac_output(feedback)
+        return errors_in_file(diagnostics, class_path)
 
-    def repair_by_rules(self, test_class, error_infos):
+    def classify_error(self, diagnostic:CompileDiagnostic) -> RuleError|None:
+        code = diagnostic.code or ""
+        if code.startswith("compiler.err.cant.resolve"):
+            return RuleError.UNRESLOVE_SYMBOL
+        elif code.startswith("compiler.err.unreported.exception"):
+            return RuleError.UNREPORTED_EXCEPTION
+        # elif code == "compiler.err.report.access" and diagnostic.message.find(method_name)>-1:
+        #     return RuleError.PRIVATE_ACCESS
+        return None
+
+    def repair_by_rules(self, test_class, diagnostics:list[CompileDiagnostic]):
         '''
-        Use the compilation feedback and corresponding test cases as input
+        Use the compilation errors and corresponding test cases as input
         Repair the test cases through rules.
         0. check package name and class name
         1. fix wrong/missing import statements
@@ -128,15 +126,15 @@ class CodeRepairer(JavaRunner):
         remove_imports = []
         add_imports = set()
         exception_lines = []
-        symbol_pattern = r'symbol:\s+(class|variable) (.*)'
-        for line, msg, type in error_infos:
+        for diagnostic in diagnostics:
+            line = diagnostic.line - 1
+            type = self.classify_error(diagnostic)
             if type == RuleError.UNRESLOVE_SYMBOL:
-                group = re.findall(symbol_pattern, msg)
-                if len(group) > 0:
-                    symbol = group[0][1]
-                    add_import = self.import_dict.get(symbol, [])
+                symbol = diagnostic.symbol
+                if symbol is not None and symbol[0] in ("class", "variable"):
+                    add_import = self.import_dict.get(symbol[1], [])
                     add_imports.update(add_import)
-                if msg.find("import ") > -1:
+                if diagnostic.source_line.lstrip().startswith("import "):
                     remove_imports.append(line)
             elif type == RuleError.UNREPORTED_EXCEPTION:
                 exception_lines.append(line)
@@ -153,10 +151,11 @@ class CodeRepairer(JavaRunner):
         new_class = self.parser.get_code()
         return new_class
 
-    def repair_by_LLM(self, test_class, feedback, prompt_path, response_path, context, repair_type:VerifyResult):
+    def repair_by_LLM(self, test_class, feedback, prompt_path, response_path, context, repair_type:VerifyResult, attempt:int=0):
         '''
         Use the compilation/execution feedback and corresponding test cases as input
         Repair the test cases through LLM.
+        attempt: repair try, each try samples a new response even if the prompt is the same
         '''
         context = {
             repair_type.value: True,
@@ -165,20 +164,20 @@ class CodeRepairer(JavaRunner):
             "context_dict": context
         }
         prompt = self.prompt_gen.generate_single("post", context)
-        code, response = self.llm_caller.get_response_code(prompt)
+        code, response = self.llm_caller.get_response_code(prompt, attempt)
         code = str(self.class_editor.main([test_class, code, "true"]))
         io_utils.write_text(prompt_path, prompt)
         io_utils.write_text(response_path, response)
         ## todo: transform to code diff
         return code
 
-    def clean_error_cases(self, error_infos:list, code:str):
+    def clean_error_cases(self, diagnostics:list[CompileDiagnostic], code:str):
         '''
         Clean/Comment the error test cases from the test class.
         '''
         self.parser.parse(code)
         start, end, _ = self.parser.get_test_case_position()
-        lines = [line for line, _ in error_infos]
+        lines = [diagnostic.line - 1 for diagnostic in diagnostics]
         for line in lines.copy():
             for i in range(0, len(start)):
                 if line >=start[i] and line<=end[i]:
@@ -210,19 +209,19 @@ class CodeRepairer(JavaRunner):
             io_utils.write_text(temp, fixed_code)
             self.logger.info(f"try to repair test class {class_path}...")
             if flag == VerifyResult.COMPILE_ERROR:
-                error_infos = self.parse_feedback(feedback, test_path)
-                fixed_code = self.repair_by_rules(fixed_code, error_infos[0])
+                diagnostics = self.parse_feedback(feedback, test_path)
+                fixed_code = self.repair_by_rules(fixed_code, diagnostics)
                 io_utils.write_text(target_path, fixed_code)
                 flag, feedback, passrate = self.compile_and_execute(test_path, test_class)
             if flag!=VerifyResult.PASS:
                 prompt = f"{prompt_path}_{count}.md"
                 response = f"{response_path}_{count}.md"
-                fixed_code = self.repair_by_LLM(fixed_code, feedback, prompt, response, context, flag)
+                fixed_code = self.repair_by_LLM(fixed_code, feedback, prompt, response, context, flag, count)
                 io_utils.write_text(target_path, fixed_code)
                 flag, feedback, passrate = self.compile_and_execute(test_path, test_class)
                 if flag == VerifyResult.COMPILE_ERROR and count>=self.half_tries:
-                    error_infos = self.parse_feedback(feedback, test_path)
-                    commented_code = self.clean_error_cases(error_infos[-1], fixed_code)
+                    diagnostics = self.parse_feedback(feedback, test_path)
+                    commented_code = self.clean_error_cases(diagnostics, fixed_code)
                     io_utils.write_text(target_path, commented_code)
                     cflag, cfeedback, cpassrate = self.compile_and_execute(test_path, test_class)
                     if cpassrate > passrate:
@@ -235,8 +234,8 @@ class CodeRepairer(JavaRunner):
         
         # while cflag==False:
         # if flag == VerifyResult.COMPILE_ERROR:
-        #     error_infos = self.parse_feedback(feedback, test_path)[-1]
-        #     fixed_code = self.clean_error_cases(error_infos, fixed_code)
+        #     diagnostics = self.parse_feedback(feedback, test_path)
+        #     fixed_code = self.clean_error_cases(diagnostics, fixed_code)
         #     # io_utils.write_text(target_path, fixed_code)
         #     # cflag, feedback = self.compile_test(test_path)
         #     count += 1
@@ -272,7 +271,7 @@ def verify_test_classes(file_structure, task_setting, dataset_info):
     case_select = True if len(case_list)>0 else False
     logger = logging.getLogger(__name__)
 
-    # TODO: multi-threading
+    verify_workers = getattr(task_setting, "VERIFY_WORKERS", 1)
     for pj_name, pj_info in dataset_info.items():
         if project_select and pj_name not in projects: continue
         logger.info(f"verify process test classes in {pj_name}...")
@@ -280,17 +279,58 @@ def verify_test_classes(file_structure, task_setting, dataset_info):
         project_prompt = prompt_path.replace("<project>",pj_name)
         project_fix = fix_path.replace("<project>",pj_name)
         project_testclass = testclass_path.replace("<project>",pj_name)
-        code_info = io_utils.load_json(f"{code_info_path}/json/{pj_name}.json")
-        import_dict = code_info["import_dict"]
-        code_repair = CodeRepairer(dependency_path, project_path, project_testclass, fix_tries, import_dict)
+        code_info = load_code_info_index(f"{code_info_path}/json/{pj_name}.json")
+        import_dict = code_info.import_dict
+        test_infos = [ts_info for ts_info in pj_info["focal-methods"] if not case_select or ts_info["id"] in case_list]
+        journal = open_journal(file_structure, task_setting, pj_name)
 
-        for ts_info in pj_info["focal-methods"]:
+        def check_args(ts_info):
             tid = ts_info["id"]
-            if case_select and tid not in case_list: continue
             context_path = f"{project_prompt}/{tid}/usage_context.json"
             case_prompt_path = f"{project_fix}/{tid}/repair_prompt"
             case_response_path = f"{project_fix}/{tid}/repair_response"
-            code_repair.check_test_class(ts_info, case_prompt_path, case_response_path, context_path)
+            return (ts_info, case_prompt_path, case_response_path, context_path)
+
+        def check_journaled(code_repair:CodeRepairer, ts_info):
+            outputs = stage_files("verify", ts_info, project_prompt, "", project_testclass, [])[1]
+            skipped, _ = journal.run(ts_info["id"], "verify", [], outputs, code_repair.check_test_class, *check_args(ts_info))
+            return skipped
+
+        if verify_workers <= 1:
+            code_repair = CodeRepairer(dependency_path, project_path, project_testclass, fix_tries, import_dict)
+            for ts_info in test_infos:
+                try:
+                    check_journaled(code_repair, ts_info)
+                except Exception as e:
+                    logger.error(f"Error verifying test class {ts_info['id']}: {e}")
+            code_repair.close()
+            continue
+        # repair test classes concurrently, each worker compiles & runs in its own sandbox
+        sandboxes = SandboxManager(project_path, verify_workers)
+        sandboxes.prepare()
+        repairers = {
+            sandbox.index: CodeRepairer(dependency_path, sandbox.root, project_testclass, fix_tries, import_dict)
+            for sandbox in sandboxes.sandboxes
+        }
+
+        def check_in_sandbox(ts_info):
+            with sandboxes.sandbox() as sandbox:
+                if not check_journaled(repairers[sandbox.index], ts_info):
+                    sandboxes.collect(sandbox, ts_info["test-path"], ts_info["test-class"])
+            return ts_info["id"]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=verify_workers) as executor:
+            futures = [executor.submit(check_in_sandbox, ts_info) for ts_info in test_infos]
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    tid = future.result()
+                    logger.info(f"Completed verification of {tid}")
+                except Exception as e:
+                    logger.error(f"Error verifying test class: {e}")
+        for code_repair in repairers.values():
+            code_repair.close()
+        sandboxes.merge(test_infos)
+        sandboxes.cleanup()
     return
 
 
@@ -1,21 +1,24 @@
-import re
-import copy
-import networkx as nx
-from queue import Queue
+import os
+import jpype
+import hashlib
+import logging
+import functools
+import multiprocessing
+from collections import deque
 from networkx import DiGraph
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 
 import tools.io_utils as io_utils
 from tools.code_search import SnippetReader
+from tools.code_index import CodeInfoIndex, load_code_info_index, process_signature
+from tools.index_store import load_index_data, index_path_of, convert_project_index
 
-def process_signature(osig, return_type=None):
-        if return_type:
-            method_sig = osig[osig.index(return_type)+len(return_type):]
-        else:
-            method_sig = osig
-        while len(re.findall(r"<[^<>]*>", method_sig, flags=re.DOTALL))>0:
-            method_sig = re.sub(r"<[^<>]*>", "", method_sig, flags=re.DOTALL)
-        method_sig = re.sub(r"\w+\.", "", method_sig, flags=re.DOTALL)
-        return method_sig
+# classes per invoke pattern extraction task in process-pool mode
+CLASS_SHARD_SIZE = 32
+# call chains kept per private method, and paths searched at most for them
+MAX_CALL_CHAINS = 3
+MAX_CHAIN_PATHS = 4096
 
 '''
 structure of calling graph:
@@ -35,70 +38,213 @@ structure of calling graph:
     }
 }
 '''
-def build_calling_graph(file_structure):
+def _process_pool(workers:int) -> ProcessPoolExecutor:
+    # the JPype JVM of preparation.py is running, forking its threads may deadlock; workers only need python
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def build_calling_graph(file_structure, workers:int=1):
+    '''
+    workers: number of processes, the projects are distributed among them if > 1
+    '''
     code_info_path = file_structure.CODE_INFO_PATH
     dataset_dir = f"{file_structure.DATASET_PATH}/dataset_info.json"
     dataset_info = io_utils.load_json(dataset_dir)
+    if workers <= 1:
+        for pj_name in dataset_info.keys():
+            _write_calling_graph(code_info_path, pj_name)
+        return
+    with _process_pool(workers) as executor:
+        futures = [executor.submit(_write_calling_graph, code_info_path, pj_name) for pj_name in dataset_info.keys()]
+        for future in futures: future.result()
+    return
 
-    for pj_name, pj_info in dataset_info.items():
-        calling_graph = {}
-        code_info = io_utils.load_json(f"{code_info_path}/json/{pj_name}.json")
-        source_data = code_info["source"]
-        for class_fqn, cinfo in source_data.items():
-            class_data = {}
-            for _, method_infos in cinfo["methods"].items():
-                for minfo in method_infos:
-                    return_type = minfo["return_type"].split('.')[-1] + " "
-                    method_sig = process_signature(minfo["signature"], return_type)
-                    class_data[method_sig] = {
-                        "type": minfo["access_type"],
-                        "caller": []
-                    }
-            for minfo in cinfo["constructors"]:
-                method_sig = minfo["signature"]
+
+def _write_calling_graph(code_info_path, pj_name):
+    code_info = load_code_info_index(f"{code_info_path}/json/{pj_name}.json")
+    calling_graph = calling_graph_of(code_info)
+    graph_path = f"{code_info_path}/codegraph/{pj_name}_callgraph.json"
+    io_utils.write_json(graph_path, calling_graph)
+
+
+def calling_graph_of(code_info:CodeInfoIndex) -> dict:
+    '''
+    one pass over the classes: methods are registered and their call sites collected,
+    call sites are resolved to callees afterwards (callers keep the order of the classes)
+    '''
+    calling_graph = {}
+    call_sites = []
+    for class_fqn, cinfo in code_info.source.items():
+        class_data = {}
+        for _, method_infos in cinfo.methods.items():
+            for minfo in method_infos:
+                return_type = minfo.return_type.split('.')[-1] + " "
+                method_sig = process_signature(minfo.signature, return_type)
                 class_data[method_sig] = {
-                        "type": minfo["access_type"],
-                        "caller": []
+                    "type": minfo.access_type,
+                    "caller": []
                 }
-            calling_graph.update({class_fqn: class_data})
+                caller_sig = f"{class_fqn}#{method_sig}"
+                for call_info in minfo.call_methods:
+                    call_sites.append((caller_sig, call_info))
+        for minfo in cinfo.constructors:
+            class_data[minfo.signature] = {
+                "type": minfo.access_type,
+                "caller": []
+            }
+        calling_graph[class_fqn] = class_data
 
-        for class_fqn, cinfo in source_data.items():
-            # class_data = calling_graph[class_fqn]
-            for _, method_infos in cinfo["methods"].items():
-                for minfo in method_infos:
-                    method_sig = minfo["signature"]
-                    return_type = minfo["return_type"].split('.')[-1] + " "
-                    # method_sig = method_sig[method_sig.index(return_type)+len(return_type):]
-                    method_sig = process_signature(method_sig, return_type)
-
-                    for call_info in minfo["call_methods"]:
-                        call_split = call_info["signature"].split('#')
-                        callee = call_split[0]
-                        call_sig = process_signature(call_split[-1])
-                        if callee in calling_graph and call_sig in calling_graph[callee]:
-                            calling_graph[callee][call_sig]["caller"].append({
-                                "sig": f"{class_fqn}#{method_sig}",
-                                "lines": call_info["line_numbers"]
-                                })
-        graph_path = f"{code_info_path}/codegraph/{pj_name}_callgraph.json"
-        io_utils.write_json(graph_path, calling_graph)
+    for caller_sig, call_info in call_sites:
+        call_split = call_info.signature.split('#')
+        callee_data = calling_graph.get(call_split[0])
+        if callee_data is None: continue
+        node = callee_data.get(process_signature(call_split[-1]))
+        if node is not None:
+            node["caller"].append({
+                "sig": caller_sig,
+                "lines": list(call_info.line_numbers)
+            })
+    return calling_graph
+
+
+def signature_parts(signature:str) -> list[str]:
+    # e.g. "a.B#foo(int, String)" -> ["a.B#foo(", "int,", "String", ")"]
+    return signature.replace("(", "( ").replace(")", " )").split()
+
+
+class MethodCfgTable(Mapping):
+    '''
+    "<class_fqn>#<method_sig>" -> control flow graph, the graph is built on first access;
+    keys are bucketed by "<class_fqn>#<method name>(" and the number of signature parts,
+    signatures can only match fuzzily (`InvokePatternExtractor._equal_sig`) inside a bucket
+    '''
+    def __init__(self, cfg_data:Mapping):
+        self.cfg_data = cfg_data
+        self.keys_index = {}
+        self.buckets = {}
+        for class_fqn, cdata in cfg_data.items():
+            for method_sig in cdata.keys():
+                key = f"{class_fqn}#{method_sig}"
+                self.keys_index[key] = (class_fqn, method_sig)
+                parts = signature_parts(key)
+                self.buckets.setdefault(self._bucket_of(parts), []).append((key, parts))
+        self.graphs = {}
+
+    def _bucket_of(self, parts:list[str]):
+        return (parts[0] if len(parts) > 0 else None, len(parts))
+
+    def candidates(self, signature:str) -> list[tuple[str, list[str]]]:
+        '''
+        (key, signature parts) of the methods which may match the signature, in the order of the keys
+        '''
+        return self.buckets.get(self._bucket_of(signature_parts(signature)), [])
+
+    def __getitem__(self, key) -> "MethodCfgIndex":
+        graph = self.graphs.get(key)
+        if graph is None:
+            class_fqn, method_sig = self.keys_index[key]
+            graph = MethodCfgIndex(self.cfg_data[class_fqn][method_sig])
+            self.graphs[key] = graph
+        return graph
+
+    def __contains__(self, key):
+        return key in self.keys_index
+
+    def __iter__(self):
+        return iter(self.keys_index)
+
+    def __len__(self):
+        return len(self.keys_index)
+
+
+class MethodCfgIndex:
+    '''
+    control flow graph of a method, indexed once for queries from the BEGIN node:
+    BFS distances, predecessors on shortest paths (a DAG) and line -> nodes;
+    the nodes on any shortest path to a target are the ancestors of the target in the DAG
+    '''
+    __slots__ = ("node_lines", "line_nodes", "start", "dist", "preds", "reach_lines")
+
+    def __init__(self, mdata:Mapping):
+        self.node_lines = {}
+        self.line_nodes = {}
+        self.start = None
+        successors = {}
+        for node in mdata["nodes"]:
+            nid = node["id"]
+            self.node_lines[nid] = list(node["lines"])
+            successors[nid] = set()
+            for line in node["lines"]:
+                self.line_nodes.setdefault(line, []).append(nid)
+            # the last BEGIN node is the entry, as in the node order of the graph
+            if node["kind"] == "BEGIN": self.start = nid
+        for edge in mdata["edges"]:
+            successors.setdefault(edge["source"], set()).add(edge["target"])
+        self.dist = {}
+        self.preds = {}
+        self.reach_lines = {}
+        if self.start is None: return
+        self.dist[self.start] = 0
+        self.preds[self.start] = []
+        frontier = [self.start]
+        while len(frontier) > 0:
+            next_frontier = []
+            for nid in frontier:
+                for succ in successors.get(nid, ()):
+                    if succ not in self.dist:
+                        self.dist[succ] = self.dist[nid] + 1
+                        self.preds[succ] = [nid]
+                        next_frontier.append(succ)
+                    elif self.dist[succ] == self.dist[nid] + 1:
+                        self.preds[succ].append(nid)
+            frontier = next_frontier
+
+    def _lines_to(self, target) -> set:
+        # lines of all nodes on the shortest paths from BEGIN to target, memoised per target
+        lines = self.reach_lines.get(target)
+        if lines is not None: return lines
+        lines = set()
+        seen = {target}
+        stack = [target]
+        while len(stack) > 0:
+            nid = stack.pop()
+            lines.update(self.node_lines.get(nid, ()))
+            for pred in self.preds[nid]:
+                if pred not in seen:
+                    seen.add(pred)
+                    stack.append(pred)
+        self.reach_lines[target] = lines
+        return lines
+
+    def lines_to(self, target_lines) -> set:
+        '''
+        target lines and the lines needed to reach them from BEGIN
+        '''
+        visited = set(target_lines)
+        if self.start is None: return visited
+        targets = {nid for line in target_lines for nid in self.line_nodes.get(line, ())}
+        for target in targets:
+            # unreachable targets only contribute their own lines
+            if target in self.dist:
+                visited.update(self._lines_to(target))
+        return visited
 
 
 class InvokePatternExtractor:
-    code_info: dict
-    calling_data: dict
+    code_info: CodeInfoIndex
+    calling_data: Mapping
     call_graph: DiGraph
-    method_cfgs: dict
+    method_cfgs: MethodCfgTable
 
     def __init__(self, code_info_path, calling_path, cfg_path):
-        self.code_info = io_utils.load_json(code_info_path)
-        self.calling_data = io_utils.load_json(calling_path)
-        cfg_data = io_utils.load_json(cfg_path)
+        self.code_info = load_code_info_index(code_info_path)
+        self.calling_data = load_index_data(calling_path)
+        cfg_data = load_index_data(cfg_path)
         self.build_calling_graph(self.calling_data)
         self.build_method_cfg(cfg_data)
         pass
 
-    def build_calling_graph(self, calling_data:dict):
+    def build_calling_graph(self, calling_data:Mapping):
         graph = DiGraph()
         nodes:dict = {}
         edges = []
@@ -119,18 +265,8 @@ class InvokePatternExtractor:
         return
 
     def build_method_cfg(self, cfg_data):
-        cfg_cache = {}
-        for class_fqn, cdata in cfg_data.items():
-            for method_sig, mdata in cdata.items():
-                method_graph = DiGraph()
-                nodes = []
-                edges = []
-                nodes = [(node["id"], {"kind": node["kind"], "lines": node["lines"]}) for node in mdata["nodes"]]
-                edges = [(edge["source"], edge["target"], {"is_back": edge["is_back"]}) for edge in mdata["edges"]]
-                method_graph.add_nodes_from(nodes)
-                method_graph.add_edges_from(edges)
-                cfg_cache[f"{class_fqn}#{method_sig}"] = method_graph
-        self.method_cfgs = cfg_cache
+        self.method_cfgs = MethodCfgTable(cfg_data)
+        self.cfg_matches = {}
         return
 
     def _build_path(self, prev, start_id):
@@ -144,27 +280,42 @@ class InvokePatternExtractor:
         return path
 
     def get_call_chain(self, node_id):
-        bfs_queue = Queue()
-        bfs_queue.put((node_id,[]))
+        '''
+        BFS through private callers up to the first non-private caller, paths are linked
+        (node_id, target lines, parent) tuples sharing their prefixes; chains are found in order
+        of length, the search stops at the MAX_CALL_CHAINS shortest ones or MAX_CHAIN_PATHS paths
+        '''
+        bfs_queue = deque([(node_id, None)])
         call_chains = []
-        while not bfs_queue.empty():
-            cur_node_id, path = bfs_queue.get()
-            for edge in self.call_graph.edges(cur_node_id,data=True):
-                caller = edge[1]
-                caller_node = self.call_graph.nodes[caller]
-                chain = [node[0] for node in path]
-                npath = copy.deepcopy(path)
-                npath.append((caller, edge[2]["target"]))
-                if caller_node["type"] == "PRIVATE" and caller not in chain:
-                    bfs_queue.put((caller, npath))
+        queued = 0
+        while len(bfs_queue) > 0 and len(call_chains) < MAX_CALL_CHAINS:
+            cur_node_id, path = bfs_queue.popleft()
+            for _, caller, edge in self.call_graph.edges(cur_node_id, data=True):
+                npath = (caller, edge["target"], path)
+                if self.call_graph.nodes[caller]["type"] == "PRIVATE" and not self._in_path(caller, path):
+                    if queued < MAX_CHAIN_PATHS:
+                        bfs_queue.append((caller, npath))
+                        queued += 1
                 else:
-                    call_chains.append(npath)
-        # keep the shortest 3 paths
-        call_chains.sort(key=lambda x: len(x))
-        call_chains = call_chains[:min(3, len(call_chains))]
+                    call_chains.append(self._unlink_path(npath))
+                    if len(call_chains) == MAX_CALL_CHAINS: break
         print("call_chains of ",node_id,": ",call_chains)
         return call_chains
 
+    def _in_path(self, node_id, path):
+        while path is not None:
+            if path[0] == node_id: return True
+            path = path[2]
+        return False
+
+    def _unlink_path(self, path):
+        chain = []
+        while path is not None:
+            chain.append((path[0], list(path[1])))
+            path = path[2]
+        chain.reverse()
+        return chain
+
     def _order_code_lines(self, code_lines:list):
         '''
         simplify lines expression, e.g. [1,2,3,4,5,7,9] to [[1,5],7,9]
@@ -187,29 +338,13 @@ class InvokePatternExtractor:
         else: ordered_lines.append([start, end])
         return (ordered_lines, length)
 
-    def _get_lines_from_cfg(self, cfg:DiGraph, target_lines):
-        visited = set(target_lines)
-        # find the node with kind="BEGIN"
-        start_node = None
-        target_nodes = set()
-        for nid, node in cfg.nodes.data():
-            if any(line in node["lines"] for line in target_lines):
-                target_nodes.add(nid)
-            if node["kind"] == "BEGIN":
-                start_node = nid
-        # 如果没有找到BEGIN节点，返回已访问的行
-        if start_node is None:
-            return list(visited)
-        for target in target_nodes:
-            paths = nx.all_shortest_paths(cfg, start_node, target)
-            for path in paths:
-                for node in path:
-                    visited.update(cfg.nodes[node]["lines"])
-        return list(visited)
+    def _get_lines_from_cfg(self, cfg:MethodCfgIndex, target_lines):
+        return list(cfg.lines_to(target_lines))
 
     def _equal_sig(self, candidate, target):
-        cand_parts = candidate.replace("(", "( ").replace(")", " )").split()
-        target_parts = target.replace("(", "( ").replace(")", " )").split()
+        return self._equal_parts(signature_parts(candidate), signature_parts(target))
+
+    def _equal_parts(self, cand_parts:list[str], target_parts:list[str]):
         if len(cand_parts) != len(target_parts):
             return False
         if cand_parts[0] != target_parts[0]:
@@ -221,36 +356,30 @@ class InvokePatternExtractor:
                 return False
         return True
 
+    def _find_method_cfg(self, full_sig) -> MethodCfgIndex|None:
+        # the first cfg key matching the signature, resolved once per signature
+        if full_sig not in self.cfg_matches:
+            target_parts = signature_parts(full_sig)
+            self.cfg_matches[full_sig] = next((key for key, parts in self.method_cfgs.candidates(full_sig)
+                                               if self._equal_parts(parts, target_parts)), None)
+        key = self.cfg_matches[full_sig]
+        return None if key is None else self.method_cfgs[key]
+
     def _get_lines_from_method(self, class_fqn, method_sig, target_lines):
-        class_info = self.code_info["source"][class_fqn]
-        method_info = None
-        for method, m_infos in class_info["methods"].items():
-            if method_sig.find(method) != -1:
-                for m_info in m_infos: 
-                    if process_signature(m_info["signature"]).endswith(method_sig):
-                        method_info = m_info
-                        break
-        if method_info is None:
-            for m_info in class_info["constructors"]:
-                if process_signature(m_info["signature"]).endswith(method_sig):
-                    method_info = m_info
-                    break
+        class_info = self.code_info.source[class_fqn]
+        method_info = class_info.get_normalised(method_sig)
         if method_info is None:
             err_msg = f"method {method_sig} not found in class {class_fqn}"
             raise ValueError(err_msg)
-        method_cfg = None
         full_sig = f"{class_fqn}#{method_sig}"
-        for candidate in self.method_cfgs.keys():
-            if self._equal_sig(candidate, full_sig):
-                method_cfg = self.method_cfgs[candidate]
-                break
+        method_cfg = self._find_method_cfg(full_sig)
         if method_cfg is None: 
             err_msg = f"sig {full_sig} not found in method cfg"
             print(err_msg)
             # raise ValueError(err_msg)
             return (None, None)
         visited = self._get_lines_from_cfg(method_cfg, target_lines)
-        visited.extend([method_info["start_line"], method_info["end_line"]-1])
+        visited.extend([method_info.start_line, method_info.end_line-1])
         return self._order_code_lines(visited)
 
     def extract_code_public(self, callers):
@@ -261,7 +390,7 @@ class InvokePatternExtractor:
             class_fqn, method_sig = full_fqn.split("#")
             code_line, length = self._get_lines_from_method(class_fqn, method_sig, target_lines)
             if code_line is None: continue
-            file_path = self.code_info["source"][class_fqn]["file"]
+            file_path = self.code_info.source[class_fqn].file
             path_line.append({"file_path": file_path, "lines": code_line})
             path_lines.append((path_line, length))
 
@@ -279,7 +408,7 @@ class InvokePatternExtractor:
                 result = self._get_lines_from_method(class_fqn, method_sig, target_lines)
                 code_line, length = result
                 if code_line is None: continue
-                file_path = self.code_info["source"][class_fqn]["file"]
+                file_path = self.code_info.source[class_fqn].file
                 path_line.append({"file_path": file_path, "lines": code_line})
             # 计算总长度
             total_length = sum(len(item.get("lines", [])) for item in path_line if isinstance(item, dict))
@@ -297,14 +426,20 @@ class InvokePatternExtractor:
         }
     }
     '''
-    def extract_invoke_pattern(self):
+    def extract_invoke_pattern(self, targets:set|None=None, classes:list|None=None):
+        '''
+        targets: "<class_fqn>#<method_sig>" of the methods to extract, all methods if None
+        classes: classes to extract (a shard of the project), all classes if None
+        '''
         invoke_patterns = {}
         # extract invoke pattern
-        for class_fqn, cdata in self.calling_data.items():
+        for class_fqn in (self.calling_data.keys() if classes is None else classes):
+            cdata = self.calling_data[class_fqn]
             invoke_patterns[class_fqn] = {}
             for method_sig, mdata in cdata.items():
                 if len(mdata["caller"])==0: continue
                 node_id = f"{class_fqn}#{method_sig}"
+                if targets is not None and node_id not in targets: continue
                 if mdata["type"] == "PRIVATE":
                     call_chains = self.get_call_chain(node_id)
                     if len(call_chains)==0: continue
@@ -317,15 +452,241 @@ class InvokePatternExtractor:
         return invoke_patterns
 
 
-def extract_invoke_patterns(file_structure):
+def _invoke_pattern_extractor(code_info_path, pj_name):
+    code_info = f"{code_info_path}/json/{pj_name}.json"
+    calling_graph = f"{code_info_path}/codegraph/{pj_name}_callgraph.json"
+    method_cfg = f"{code_info_path}/codegraph/{pj_name}_controlflow.json"
+    return InvokePatternExtractor(code_info, calling_graph, method_cfg)
+
+
+@functools.lru_cache(maxsize=1)
+def _shard_extractor(code_info_path, pj_name):
+    # one extractor per worker process, reused by the following shards of the same project
+    return _invoke_pattern_extractor(code_info_path, pj_name)
+
+
+def _extract_invoke_shard(code_info_path, pj_name, classes):
+    return _shard_extractor(code_info_path, pj_name).extract_invoke_pattern(classes=classes)
+
+
+def invoke_shards(code_info_path, pj_name, shard_size:int=CLASS_SHARD_SIZE) -> list[list[str]]:
+    '''
+    consecutive class slices of the calling graph of a project
+    '''
+    classes = list(load_index_data(f"{code_info_path}/codegraph/{pj_name}_callgraph.json").keys())
+    return [classes[i:i+shard_size] for i in range(0, len(classes), shard_size)]
+
+
+def extract_invoke_patterns(file_structure, workers:int=1):
+    '''
+    workers: number of processes, the classes of each project are split into shards of
+    CLASS_SHARD_SIZE classes; every worker loads the (lazy) index of a project once and returns
+    the invoke patterns of its shards, which are merged in class order
+    '''
     code_info_path = file_structure.CODE_INFO_PATH
     dataset_dir = f"{file_structure.DATASET_PATH}/dataset_info.json"
     dataset_info = io_utils.load_json(dataset_dir)
-    for pj_name, pj_info in dataset_info.items():
-        code_info = f"{code_info_path}/json/{pj_name}.json"
-        calling_graph = f"{code_info_path}/codegraph/{pj_name}_callgraph.json"
-        method_cfg = f"{code_info_path}/codegraph/{pj_name}_controlflow.json"
-        extractor = InvokePatternExtractor(code_info, calling_graph, method_cfg)
-        invoke_patterns = extractor.extract_invoke_pattern()
-        io_utils.write_json(f"{code_info_path}/codegraph/{pj_name}_invoke.json", invoke_patterns)
-    return
\ No newline at end of file
+    if workers <= 1:
+        for pj_name in dataset_info.keys():
+            extractor = _invoke_pattern_extractor(code_info_path, pj_name)
+            invoke_patterns = extractor.extract_invoke_pattern()
+            io_utils.write_json(f"{code_info_path}/codegraph/{pj_name}_invoke.json", invoke_patterns)
+        return
+    with _process_pool(workers) as executor:
+        # shards of the same project are submitted together, so workers mostly reuse their extractor
+        project_futures = {
+            pj_name: [executor.submit(_extract_invoke_shard, code_info_path, pj_name, shard)
+                      for shard in invoke_shards(code_info_path, pj_name)]
+            for pj_name in dataset_info.keys()
+        }
+        for pj_name, futures in project_futures.items():
+            invoke_patterns = {}
+            for future in futures:
+                invoke_patterns.update(future.result())
+            io_utils.write_json(f"{code_info_path}/codegraph/{pj_name}_invoke.json", invoke_patterns)
+    return
+
+
+'''
+Incremental preparation: the digests of the source files under src/main/java are kept in
+{code_info_path}/manifest/<project>.json, only classes of changed files are extracted again;
+the calling graph is rebuilt from the code info (cheap), invoke patterns are extracted again
+only for methods whose callers or call chains changed, lucene documents are replaced per class.
+'''
+def source_digests(source_dir:str) -> dict:
+    '''
+    {path relative to source_dir: sha256 of the file} of the java files
+    '''
+    digests = {}
+    for root, _, files in os.walk(source_dir):
+        for file in files:
+            if not file.endswith(".java"): continue
+            path = os.path.join(root, file)
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            digests[os.path.relpath(path, source_dir).replace(os.sep, "/")] = digest
+    return digests
+
+
+def manifest_path_of(code_info_path, pj_name):
+    return f"{code_info_path}/manifest/{pj_name}.json"
+
+
+def write_source_manifest(code_info_path, pj_name, project_dir):
+    manifest_path = manifest_path_of(code_info_path, pj_name)
+    io_utils.check_path(manifest_path)
+    io_utils.write_json(manifest_path, source_digests(f"{project_dir}/src/main/java"))
+    return
+
+
+def _changed_nodes(old_graph:Mapping, new_graph:dict, affected_classes:set) -> set:
+    # methods of re-extracted classes, and methods whose type or callers changed
+    changed = set()
+    for class_fqn, cdata in new_graph.items():
+        old_cdata = old_graph.get(class_fqn, {})
+        for method_sig, mdata in cdata.items():
+            node_id = f"{class_fqn}#{method_sig}"
+            old_mdata = old_cdata.get(method_sig)
+            if class_fqn in affected_classes or old_mdata is None or \
+                old_mdata["type"] != mdata["type"] or list(old_mdata["caller"]) != mdata["caller"]:
+                changed.add(node_id)
+    return changed
+
+
+def affected_methods(old_graph:Mapping, new_graph:dict, affected_classes:set) -> set:
+    '''
+    methods whose invoke pattern may change: the invoke pattern of a method covers its callers,
+    and the callers of private callers (call chains), so changes propagate from callers to
+    callees and further only through private callees
+    '''
+    callees = {}
+    for class_fqn, cdata in new_graph.items():
+        for method_sig, mdata in cdata.items():
+            for caller in mdata["caller"]:
+                callees.setdefault(caller["sig"], []).append(f"{class_fqn}#{method_sig}")
+    affected = _changed_nodes(old_graph, new_graph, affected_classes)
+    queue = list(affected)
+    propagated = set()
+    while len(queue) > 0:
+        node_id = queue.pop()
+        for callee in callees.get(node_id, []):
+            affected.add(callee)
+            class_fqn, method_sig = callee.split("#", 1)
+            if new_graph[class_fqn][method_sig]["type"] == "PRIVATE" and callee not in propagated:
+                propagated.add(callee)
+                queue.append(callee)
+    return affected
+
+
+def update_project_index(file_structure, pj_name:str, pj_info:dict):
+    '''
+    update the index of a project for the source files changed since the last preparation
+    '''
+    logger = logging.getLogger(__name__)
+    root_path = os.getcwd().replace("\\", "/")
+    code_info_path = file_structure.CODE_INFO_PATH
+    project_dir = f"{root_path}/{file_structure.DATASET_PATH}/{pj_info['project-url']}"
+    json_path = f"{code_info_path}/json/{pj_name}.json"
+    callgraph_path = f"{code_info_path}/codegraph/{pj_name}_callgraph.json"
+    invoke_path = f"{code_info_path}/codegraph/{pj_name}_invoke.json"
+    lucene_path = f"{code_info_path}/lucene/{pj_name}"
+    manifest_path = manifest_path_of(code_info_path, pj_name)
+    PreProcessor = jpype.JClass("PreProcessor")
+    IndexBuilder = jpype.JClass("IndexBuilder")
+    Paths = jpype.JClass("java.nio.file.Paths")
+    preprocessor = PreProcessor(Paths.get(f"{root_path}/{code_info_path}"))
+
+    if not os.path.exists(manifest_path) or not os.path.exists(json_path):
+        logger.info(f"no source manifest of {pj_name}, building the whole project index")
+        preprocessor.processSingleProject(pj_name, Paths.get(project_dir))
+        code_info = load_code_info_index(json_path)
+        io_utils.write_json(callgraph_path, calling_graph_of(code_info))
+        invoke_patterns = _invoke_pattern_extractor(code_info_path, pj_name).extract_invoke_pattern()
+        io_utils.write_json(invoke_path, invoke_patterns)
+        IndexBuilder.main(["single", json_path, lucene_path])
+        write_source_manifest(code_info_path, pj_name, project_dir)
+        return
+
+    old_digests = io_utils.load_json(manifest_path)
+    new_digests = source_digests(f"{project_dir}/src/main/java")
+    changed = sorted(path for path, digest in new_digests.items() if old_digests.get(path) != digest)
+    removed = sorted(path for path in old_digests if path not in new_digests)
+    if len(changed) + len(removed) == 0:
+        logger.info(f"index of {pj_name} is up to date")
+        return
+    logger.info(f"updating index of {pj_name}: {len(changed)} changed, {len(removed)} removed source files")
+    affected_classes = set(str(c) for c in preprocessor.updateProject(pj_name, Paths.get(project_dir), changed, removed))
+
+    # patch the calling graph and the invoke patterns of the affected methods
+    code_info = load_code_info_index(json_path)
+    old_graph = io_utils.load_json(callgraph_path) if os.path.exists(callgraph_path) else {}
+    new_graph = calling_graph_of(code_info)
+    io_utils.write_json(callgraph_path, new_graph)
+    targets = affected_methods(old_graph, new_graph, affected_classes)
+    invoke_patterns = io_utils.load_json(invoke_path) if os.path.exists(invoke_path) else {}
+    for class_fqn in list(invoke_patterns.keys()):
+        if class_fqn not in new_graph: del invoke_patterns[class_fqn]
+    for node_id in targets:
+        class_fqn, method_sig = node_id.split("#", 1)
+        invoke_patterns.get(class_fqn, {}).pop(method_sig, None)
+    new_patterns = _invoke_pattern_extractor(code_info_path, pj_name).extract_invoke_pattern(targets)
+    for class_fqn in new_graph:
+        invoke_patterns.setdefault(class_fqn, {}).update(new_patterns.get(class_fqn, {}))
+    io_utils.write_json(invoke_path, invoke_patterns)
+    logger.info(f"invoke patterns of {len(targets)} methods extracted again")
+
+    IndexBuilder.main(["update", json_path, lucene_path] + sorted(affected_classes))
+    # binary index files are rebuilt if they were used
+    if os.path.exists(index_path_of(json_path)):
+        convert_project_index(code_info_path, pj_name)
+    io_utils.write_json(manifest_path, new_digests)
+    return
+
+
+if __name__ == "__main__":
+    # benchmark the calling graph construction against the regex normaliser & two-pass build:
+    # python -m procedure.preprocess_project <json/project.json> [<json/project.json> ...]
+    import re
+    import sys
+    import time
+
+    def regex_signature(osig, return_type=None):
+        method_sig = osig[osig.index(return_type)+len(return_type):] if return_type else osig
+        while len(re.findall(r"<[^<>]*>", method_sig, flags=re.DOTALL))>0:
+            method_sig = re.sub(r"<[^<>]*>", "", method_sig, flags=re.DOTALL)
+        return re.sub(r"\w+\.", "", method_sig, flags=re.DOTALL)
+
+    def regex_calling_graph(code_info:CodeInfoIndex):
+        calling_graph = {}
+        for class_fqn, cinfo in code_info.source.items():
+            class_data = {}
+            for _, method_infos in cinfo.methods.items():
+                for minfo in method_infos:
+                    method_sig = regex_signature(minfo.signature, minfo.return_type.split('.')[-1] + " ")
+                    class_data[method_sig] = {"type": minfo.access_type, "caller": []}
+            for minfo in cinfo.constructors:
+                class_data[minfo.signature] = {"type": minfo.access_type, "caller": []}
+            calling_graph[class_fqn] = class_data
+        for class_fqn, cinfo in code_info.source.items():
+            for _, method_infos in cinfo.methods.items():
+                for minfo in method_infos:
+                    method_sig = regex_signature(minfo.signature, minfo.return_type.split('.')[-1] + " ")
+                    for call_info in minfo.call_methods:
+                        call_split = call_info.signature.split('#')
+                        call_sig = regex_signature(call_split[-1])
+                        if call_split[0] in calling_graph and call_sig in calling_graph[call_split[0]]:
+                            calling_graph[call_split[0]][call_sig]["caller"].append({
+                                "sig": f"{class_fqn}#{method_sig}", "lines": list(call_info.line_numbers)})
+        return calling_graph
+
+    for json_path in sys.argv[1:]:
+        code_info = load_code_info_index(json_path)
+        start = time.perf_counter()
+        expected = regex_calling_graph(code_info)
+        regex_time = time.perf_counter() - start
+        process_signature.cache_clear()
+        start = time.perf_counter()
+        graph = calling_graph_of(code_info)
+        scan_time = time.perf_counter() - start
+        print(f"{json_path}: regex {regex_time*1000:.1f} ms, scanner {scan_time*1000:.1f} ms, "
+              f"speedup {regex_time/scan_time:.1f}x, identical: {graph == expected}")
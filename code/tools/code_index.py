@@ -0,0 +1,240 @@
+import re
+import sys
+import functools
+from collections.abc import Mapping
+
+import tools.io_utils as io_utils
+from tools.index_store import LazyDict, load_index_data
+
+
+QUALIFIER_PATTERN = re.compile(r"\w+\.")
+
+
+def strip_generics(signature:str) -> str:
+    '''
+    remove generic arguments in one pass, e.g. "put(Map<K, List<V>> m)" -> "put(Map m)";
+    the output is truncated back to the matching "<" on each ">", unmatched brackets are kept
+    '''
+    if "<" not in signature: return signature
+    out = []
+    opens = []
+    for ch in signature:
+        if ch == "<":
+            opens.append(len(out))
+            out.append(ch)
+        elif ch == ">" and len(opens) > 0:
+            del out[opens.pop():]
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def process_signature(osig, return_type=None):
+    '''
+    normalise a method signature: remove the modifiers and return type (if given),
+    generic arguments and package/outer class qualifiers; results are memoised by raw signature
+    '''
+    if return_type:
+        method_sig = osig[osig.index(return_type)+len(return_type):]
+    else:
+        method_sig = osig
+    return QUALIFIER_PATTERN.sub("", strip_generics(method_sig))
+
+
+def signature_tail(signature:str):
+    '''
+    part of the signature starting from the method name, e.g. "public Option getOption()" -> "getOption()"
+    '''
+    paren = signature.find("(")
+    if paren == -1: return signature
+    start = paren
+    while start > 0 and (signature[start-1].isalnum() or signature[start-1] in "_$"):
+        start -= 1
+    return signature[start:]
+
+
+def _intern(text):
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+class VariableRecord:
+    __slots__ = ("name", "type")
+
+    def __init__(self, info:dict):
+        self.name = _intern(info["name"])
+        self.type = _intern(info["type"])
+
+
+class CallRecord:
+    __slots__ = ("signature", "return_type", "line_numbers")
+
+    def __init__(self, info:dict):
+        self.signature = _intern(info["signature"])
+        self.return_type = _intern(info.get("return_type"))
+        self.line_numbers = tuple(info.get("line_numbers", []))
+
+
+class MethodRecord:
+    __slots__ = ("name", "signature", "return_type", "access_type", "parameters",
+                 "call_methods", "external_fields", "start_line", "end_line", "javadoc")
+
+    def __init__(self, name:str, info:dict):
+        self.name = _intern(name)
+        self.signature = _intern(info["signature"])
+        self.return_type = _intern(info.get("return_type"))
+        self.access_type = _intern(info["access_type"])
+        self.parameters = tuple(VariableRecord(param) for param in info["parameters"])
+        self.call_methods = tuple(CallRecord(call) for call in info["call_methods"])
+        self.external_fields = tuple(VariableRecord(field) for field in info["external_fields"])
+        self.start_line = info["start_line"]
+        self.end_line = info["end_line"]
+        self.javadoc = info.get("javadoc")
+
+    @property
+    def is_constructor(self):
+        return self.return_type is None
+
+
+class ClassRecord:
+    '''
+    methods: {"<method name>": (MethodRecord, ...)}
+    method_index: signature (tail, full, "..." as "[]") -> method, the first method wins
+    normalised_index: normalised signature tail -> method or constructor
+    '''
+    __slots__ = ("fqn", "file", "javadoc", "is_abstract", "constructors", "methods",
+                 "method_index", "normalised_index")
+
+    def __init__(self, fqn:str, info:dict):
+        self.fqn = _intern(fqn)
+        self.file = info["file"]
+        self.javadoc = info.get("javadoc")
+        self.is_abstract = info.get("is_abstract", False)
+        name = fqn.split(".")[-1]
+        self.constructors = tuple(MethodRecord(name, cinfo) for cinfo in info.get("constructors", []))
+        self.methods = {
+            _intern(mname): tuple(MethodRecord(mname, minfo) for minfo in minfos)
+            for mname, minfos in info.get("methods", {}).items()
+        }
+        self.method_index = {}
+        self.normalised_index = {}
+        for minfos in self.methods.values():
+            for minfo in minfos:
+                for key in (minfo.signature, signature_tail(minfo.signature)):
+                    self.method_index.setdefault(key, minfo)
+                    self.method_index.setdefault(key.replace("...", "[]"), minfo)
+                self.normalised_index.setdefault(signature_tail(process_signature(minfo.signature)), minfo)
+        for cinfo in self.constructors:
+            self.normalised_index.setdefault(signature_tail(process_signature(cinfo.signature)), cinfo)
+
+    def get_method(self, signature:str) -> MethodRecord|None:
+        '''
+        signature: method signature from the method name on (e.g. "nextToken(Token)"), or the full signature
+        '''
+        return self.method_index.get(signature)
+
+    def get_normalised(self, signature:str) -> MethodRecord|None:
+        '''
+        signature: normalised signature (see `process_signature`), searched in methods and constructors
+        '''
+        return self.normalised_index.get(signature)
+
+
+def _import_lines(symbol:str, lines:list):
+    return tuple(_intern(line) for line in lines)
+
+
+class LazyRecords(Mapping):
+    '''
+    records built on first access from a lazily decoded table of the binary index
+    '''
+    def __init__(self, table:Mapping, factory):
+        self.table = table
+        self.factory = factory
+        self.records = {}
+
+    def __getitem__(self, key):
+        record = self.records.get(key)
+        if record is None:
+            record = self.factory(key, self.table[key])
+            self.records[key] = record
+        return record
+
+    def __contains__(self, key):
+        return key in self.table
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+
+class CodeInfoIndex:
+    '''
+    Compact, indexed view of the project code info (`json/<project>.json`).
+    The nested json data is converted to slotted records once and dropped;
+    with a binary index (`json/<project>.idx`) the records are built on first access.
+    '''
+    project: str
+    source: Mapping[str, ClassRecord]
+    test: Mapping[str, ClassRecord]
+    import_dict: Mapping[str, tuple]
+
+    def __init__(self, code_info:Mapping):
+        self.project = code_info.get("project", "")
+        source = code_info.get("source", {})
+        test = code_info.get("test", {})
+        import_dict = code_info.get("import_dict", {})
+        if isinstance(code_info, LazyDict):
+            self.source = LazyRecords(source, ClassRecord)
+            self.test = LazyRecords(test, ClassRecord)
+            self.import_dict = LazyRecords(import_dict, _import_lines)
+            return
+        self.source = {_intern(fqn): ClassRecord(fqn, cinfo) for fqn, cinfo in source.items()}
+        self.test = {_intern(fqn): ClassRecord(fqn, cinfo) for fqn, cinfo in test.items()}
+        self.import_dict = {_intern(symbol): _import_lines(symbol, lines) for symbol, lines in import_dict.items()}
+
+    @classmethod
+    def from_file(cls, code_info_path:str):
+        return cls(load_index_data(code_info_path))
+
+    def get_class(self, class_fqn:str, istest=False) -> ClassRecord|None:
+        if istest:
+            return self.test.get(class_fqn)
+        return self.source.get(class_fqn)
+
+    def get_method(self, class_fqn:str, signature:str) -> MethodRecord|None:
+        class_info = self.source.get(class_fqn)
+        if class_info is None: return None
+        return class_info.get_method(signature)
+
+    def get_imports(self, symbol:str) -> tuple:
+        return self.import_dict.get(symbol, ())
+
+
+@functools.lru_cache(maxsize=16)
+def load_code_info_index(code_info_path:str) -> CodeInfoIndex:
+    '''
+    build the code info index once per project and share it between procedures
+    '''
+    return CodeInfoIndex.from_file(code_info_path)
+
+
+if __name__ == "__main__":
+    # memory usage of the json data vs. the index: python -m tools.code_index <json/project.json>
+    import gc
+    import tracemalloc
+    path = sys.argv[1] if len(sys.argv) > 1 else "../data/project_index/json/jdom2.json"
+    tracemalloc.start()
+    data = io_utils.load_json(path)
+    json_size = tracemalloc.get_traced_memory()[0]
+    del data
+    gc.collect()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    index = CodeInfoIndex.from_file(path)
+    gc.collect()
+    index_size = tracemalloc.get_traced_memory()[0] - base
+    print(f"{path}: json dict {json_size/2**20:.1f} MB, index {index_size/2**20:.1f} MB, "
+          f"ratio {json_size/max(index_size, 1):.2f}x")
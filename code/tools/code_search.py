@@ -1,27 +1,102 @@
 import os
 import re
-import copy
 import json
+import mmap
+import time
 import jpype
 import logging
+import functools
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
 
 import tools.io_utils as utils
+from tools.code_index import CodeInfoIndex, ClassRecord, MethodRecord, load_code_info_index, process_signature
+from tools.index_store import load_index_data
+
+
+LINE_BREAK = re.compile(r"\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+# the same line boundaries (see str.splitlines) in utf-8 encoded text
+LINE_BREAK_BYTES = re.compile(rb"\r\n|[\n\r\v\f\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+SNIPPET_CACHE_BYTES = 64 << 20
+# placeholder of a code snippet in the context: <position:[<file path>, <start line>, <end line>]>
+POSITION_MARKER = re.compile(r"<position:\[([^>]*)\]>")
+
+
+class SourceLines:
+    '''
+    text of a source file with its line offset table, lines are sliced on access
+    '''
+    __slots__ = ("content", "starts", "ends", "size")
+
+    def __init__(self, content:str|bytes|mmap.mmap):
+        self.content = content
+        pattern = LINE_BREAK if isinstance(content, str) else LINE_BREAK_BYTES
+        self.starts = array("q", [0])
+        self.ends = array("q")
+        for match in pattern.finditer(content):
+            self.ends.append(match.start())
+            self.starts.append(match.end())
+        if self.starts[-1] == len(content):
+            # no empty line after a trailing line break
+            self.starts.pop()
+        else:
+            self.ends.append(len(content))
+        self.size = len(content) + self.starts.itemsize * 2 * len(self.starts)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index:int) -> str:
+        line = self.content[self.starts[index]:self.ends[index]]
+        return line if isinstance(line, str) else line.decode("utf-8", errors="ignore")
+
+    def slice(self, start:int, end:int) -> list[str]:
+        return [self[i] for i in range(*slice(start, end).indices(len(self)))]
 
 
 class SnippetReader:
+    '''
+    line reader of the source files of a project, shared by the focal methods of the project;
+    files are kept with their line offset tables in a LRU cache of at most max_bytes,
+    with use_mmap the files are memory-mapped instead of decoded into memory
+    '''
     project_path: str
-    cache:dict # {"<file_path>": ["line1", "line2"]}
-    def __init__(self, pj_path):
+    cache: OrderedDict # {"<file_path>": SourceLines}
+    max_bytes: int
+    use_mmap: bool
+
+    def __init__(self, pj_path, max_bytes:int=SNIPPET_CACHE_BYTES, use_mmap:bool=False):
         self.project_path = pj_path
-        self.cache = {}
+        self.cache = OrderedDict()
+        self.max_bytes = max_bytes
+        self.use_mmap = use_mmap
+        self.size = 0
+        self.lock = threading.Lock()
         pass
 
-    def _get_contents(self, file_path):
-        lines = self.cache.get(file_path)
-        if lines is None:
-            content:str = utils.load_text(f"{self.project_path}/{file_path}")
-            lines = content.splitlines()
+    def _load(self, file_path) -> SourceLines:
+        path = f"{self.project_path}/{file_path}"
+        if not self.use_mmap:
+            return SourceLines(utils.load_text(path))
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0: return SourceLines(b"")
+            return SourceLines(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _get_contents(self, file_path) -> SourceLines:
+        with self.lock:
+            lines = self.cache.get(file_path)
+            if lines is not None:
+                self.cache.move_to_end(file_path)
+                return lines
+            lines = self._load(file_path)
             self.cache[file_path] = lines
+            self.size += lines.size
+            # the file just read is kept even if it exceeds the budget alone
+            while self.size > self.max_bytes and len(self.cache) > 1:
+                _, evicted = self.cache.popitem(last=False)
+                self.size -= evicted.size
         return lines
 
     def read_single_line(self, file_path, line):
@@ -33,7 +108,29 @@ class SnippetReader:
         start_line = max(0, start_line if start_line is not None else 0)
         lines = self._get_contents(file_path)
         end_line = min(max(start_line, end_line) + 1, len(lines))
-        return lines[start_line:end_line]
+        return lines.slice(start_line, end_line)
+
+    def _parse_position(self, position:str):
+        file_path, start_line, end_line = position.split(", ")
+        return file_path, int(start_line), int(end_line)
+
+    def expand_positions(self, context:Mapping[str, str]) -> dict[str, str]:
+        '''
+        replace the position markers (POSITION_MARKER) in the context values with the snippets,
+        the distinct ranges of all values are read once, grouped by file, and every value
+        is expanded in a single scan
+        '''
+        ranges = {}
+        for value in context.values():
+            for position in POSITION_MARKER.findall(value):
+                file_path, start_line, end_line = self._parse_position(position)
+                ranges.setdefault(file_path, set()).add((start_line, end_line))
+        snippets = {}
+        for file_path, file_ranges in ranges.items():
+            for start_line, end_line in sorted(file_ranges):
+                snippets[(file_path, start_line, end_line)] = '\n'.join(self.read_lines(file_path, start_line, end_line))
+        expand = lambda match: snippets[self._parse_position(match.group(1))]
+        return {key: POSITION_MARKER.sub(expand, value) for key, value in context.items()}
 
     def read_incoherent_lines(self, file_path, read_lines:list):
         extracted_contents = []
@@ -45,13 +142,105 @@ class SnippetReader:
         return extracted_contents
 
 
+@functools.lru_cache(maxsize=16)
+def shared_snippet_reader(project_path:str) -> SnippetReader:
+    '''
+    one snippet reader per project, kept for the whole run
+    '''
+    return SnippetReader(project_path)
+
+
+class SearchSession:
+    """
+    Long-lived similar function search session of a project.
+    The Lucene index is opened once and reused by every query, queries are passed 
+    to Java as structured objects and results are read without JSON serialization.
+    """
+    project_path: str
+    index_path: str
+    top_k: int
+    searcher: jpype.JObject
+
+    def __init__(self, project_path: str, index_path: str, top_k):
+        self.project_path = project_path
+        self.index_path = index_path
+        self.top_k = int(top_k)
+        self.searcher = None
+        self.logger = logging.getLogger(__name__)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        if self.searcher is not None:
+            return self
+        if not os.path.isdir(self.project_path):
+            raise ValueError(f"project root should be a directory: {self.project_path}")
+        if not os.path.exists(self.index_path):
+            raise ValueError(f"index path not found: {self.index_path}")
+        JavaSearcher = jpype.JClass("CodeSearcher")
+        Paths = jpype.JClass("java.nio.file.Paths")
+        self.searcher = JavaSearcher(Paths.get(self.project_path), Paths.get(self.index_path))
+        self.searcher.setTopK(self.top_k)
+        self.logger.info(f"Search session opened for index {self.index_path}")
+        return self
+
+    def close(self):
+        if self.searcher is not None:
+            self.searcher.close()
+            self.searcher = None
+        return
+
+    def _to_java_queries(self, query_list:list):
+        QueryFormat = jpype.JClass("CodeSearcher$QueryFormat")
+        java_queries = [QueryFormat(query["sig"], query["function"], query["field"]) for query in query_list]
+        return jpype.JArray(QueryFormat)(java_queries)
+
+    def _to_python_results(self, results) -> list[dict]:
+        return [{
+            "class_fqn": str(result.class_fqn),
+            "signature": str(result.signature),
+            "related_func": [str(func) for func in result.related_func],
+            "file": str(result.file),
+            "start": int(result.start),
+            "end": int(result.end),
+            "score": float(result.score),
+        } for result in results]
+
+    def search(self, query_list:list) -> list[dict]:
+        """
+        query format: [{"sig": "xxx", "function": ["xxx"], "field": ["xxx"]}, ...]
+        """
+        self.open()
+        results = self.searcher.searchSimilar(self._to_java_queries(query_list))
+        return self._to_python_results(results)
+
+    def batch_search(self, query_lists:dict) -> dict[str, list[dict]]:
+        """
+        Search the queries of many focal methods in a single pass over the index.
+        query_lists: {"<focal method id>": [query, ...]}
+        return: {"<focal method id>": [result, ...]}
+        """
+        self.open()
+        if len(query_lists) == 0: return {}
+        ids = list(query_lists.keys())
+        QueryFormat = jpype.JClass("CodeSearcher$QueryFormat")
+        java_lists = jpype.JArray(QueryFormat, 2)([self._to_java_queries(query_lists[qid]) for qid in ids])
+        group_results = self.searcher.searchBatch(ids, java_lists)
+        return {str(qid): self._to_python_results(results) for qid, results in group_results.items()}
+
+
 class CodeSearcher:
     project_path: str
     top_k: str
     index_path: str
-    code_info: dict
-    invoke_pattern: dict
+    code_info: CodeInfoIndex
+    invoke_pattern: Mapping
     snippet_reader: SnippetReader
+    search_session: SearchSession
 
     def __init__(self, project_path: str, project_name: str, project_index_path: str, top_k):
         self.project_path = project_path
@@ -61,8 +250,13 @@ class CodeSearcher:
         self.index_path = f"{project_index_path}/lucene/{project_name}"
         invoke_pattern_path = f"{project_index_path}/codegraph/{project_name}_invoke.json"
         self.logger.info(f"Loading code index for {project_name}")
-        self.code_info = utils.load_json(code_info_path)
-        self.invoke_pattern = utils.load_json(invoke_pattern_path)
+        self.code_info = load_code_info_index(code_info_path)
+        self.invoke_pattern = load_index_data(invoke_pattern_path)
+        self.search_session = SearchSession(project_path, self.index_path, top_k)
+        self.snippet_reader = shared_snippet_reader(project_path)
+
+    def close(self):
+        self.search_session.close()
 
     # todo: will be replaced by _get_class_info
     def _get_test_classes(self, class_url: str):
@@ -75,42 +269,17 @@ class CodeSearcher:
             content = utils.load_text(test_source)
         return content
 
-    def _get_class_info(self, class_name: str, istest=False) -> dict:
-        if istest:
-            return self.code_info["test"].get(class_name, None)
-        else:
-            return self.code_info["source"].get(class_name, None)
+    def _get_class_info(self, class_name: str, istest=False) -> ClassRecord|None:
+        return self.code_info.get_class(class_name, istest)
 
-    def _get_method_info(self, class_info: str, method_name: str) -> dict:
+    def _get_method_info(self, class_info: ClassRecord, method_name: str) -> MethodRecord|None:
         '''
         get the method info in the class info
         '''
-        method_info = next(
-            (m_info for method, m_infos in class_info["methods"].items()
-             if method_name.find(method) != -1
-             for m_info in m_infos if m_info["signature"].endswith(method_name)),
-            None
-        )
-        return method_info
+        return class_info.get_method(method_name)
 
     def _extract_snippet(self, context:dict):
-        full_context = {}
-        for key, value in context.items():
-            finds = re.findall(r"(<position:\[([^>]*)\]>)", value, re.DOTALL)
-            if len(finds) > 0:
-                new_value = copy.copy(value)
-                for find in finds:
-                    pivot = find[0]
-                    position = find[1].split(", ")
-                    file_path = position[0]
-                    start_line = int(position[1])
-                    end_line = int(position[2])
-                    snippet = '\n'.join(self.snippet_reader.read_lines(file_path, start_line, end_line))
-                    new_value = new_value.replace(pivot, snippet)
-                full_context[key] = new_value
-            else:
-                full_context[key] = value
-        return full_context
+        return self.snippet_reader.expand_positions(context)
 
 
     class DependentClassInfo:
@@ -156,11 +325,7 @@ class CodeSearcher:
             return '\n'.join(class_info)
 
     def _process_signature(self, signature:str):
-        processed_sig = copy.copy(signature)
-        while len(re.findall(r"<[^<>]*>", processed_sig, flags=re.DOTALL))>0:
-            processed_sig = re.sub(r"<[^<>]*>", "", processed_sig, flags=re.DOTALL)
-        processed_sig = re.sub(r"\w+\.", "", processed_sig, flags=re.DOTALL)
-        return processed_sig
+        return process_signature(signature)
 
     # todo: compress overlong context
     def collect_construct_context(self, class_name, method_name:str, class_url):
@@ -179,26 +344,25 @@ class CodeSearcher:
         if method_info is None:
             raise ValueError(f"Method `{method_name}` not found in class `{class_name}`")
 
-        self.snippet_reader = SnippetReader(self.project_path)
-        source_path = "/src/main/java/"+class_info["file"].replace("\\","/")
+        source_path = "/src/main/java/"+class_info.file.replace("\\","/")
         context = {}
         pclass = {}
         # get api document
-        if "javadoc" in class_info:
-            context[f"api document of class {class_name}"] = class_info["javadoc"]
+        if class_info.javadoc is not None:
+            context[f"api document of class {class_name}"] = class_info.javadoc
         # get the constructor info
         constructor_info = []
-        for constructor in class_info["constructors"]:
+        for constructor in class_info.constructors:
             ptext = []
-            for param in constructor["parameters"]:
-                ptype = param["type"]
-                pname = param["name"]
+            for param in constructor.parameters:
+                ptype = param.type
+                pname = param.name
                 pinfo = self._get_class_info(ptype)
                 if pinfo is not None:
                     pclass[ptype] = pinfo
                     ptext.append(f"{ptype} {pname} ")
-            start_line = constructor["start_line"]
-            end_line = constructor["end_line"]
+            start_line = constructor.start_line
+            end_line = constructor.end_line
             body_pos = f"<position:[{source_path}, {start_line}, {end_line}]>"
             param_text = '\n'.join(ptext)
             constructor_info.append(f"params: {param_text}\nbody:\n```java\n{body_pos}\n```")
@@ -206,21 +370,21 @@ class CodeSearcher:
             context[f"constructors for class `{class_name}`"] = '\n'.join(constructor_info)
         # parameter in constructor & focus method
         parameter_info = []
-        for param in method_info["parameters"]:
-            ptype = param["type"]
-            pname = param["name"]
+        for param in method_info.parameters:
+            ptype = param.type
+            pname = param.name
             pinfo = self._get_class_info(ptype)
             if pinfo is not None:
                 pclass[ptype] = pinfo
         for param, pinfo in pclass.items():
             pcontext = f"class `{param}`:\n"
-            if "javadoc" in pinfo:
-                pcontext += f"api document : {pinfo['javadoc']}\n"
+            if pinfo.javadoc is not None:
+                pcontext += f"api document : {pinfo.javadoc}\n"
             pcontext += f"constructor:\n```java\n"
-            for constructor in pinfo["constructors"]:
-                file_path = "src/main/java/" + pinfo["file"].replace("\\","/")
-                start_line = constructor["start_line"]
-                end_line = constructor["end_line"]
+            for constructor in pinfo.constructors:
+                file_path = "src/main/java/" + pinfo.file.replace("\\","/")
+                start_line = constructor.start_line
+                end_line = constructor.end_line
                 pcontext += f"<position:[{file_path}, {start_line}, {end_line}]>\n"
             pcontext += f"```"
             parameter_info.append(pcontext)
@@ -253,7 +417,39 @@ class CodeSearcher:
         return context
 
 
-    def collect_usage_context(self, class_name, method_name:str):
+    def get_usage_queries(self, class_name, method_name:str) -> list[dict]:
+        '''
+        queries for searching related functions of the focal method:
+        the focal method itself and the project methods called in it
+        '''
+        class_info = self._get_class_info(class_name)
+        if class_info is None:
+            raise ValueError(f"Class `{class_name}` not found in code info")
+        method_info = self._get_method_info(class_info, method_name)
+        if method_info is None:
+            raise ValueError(f"Method `{method_name}` not found in class `{class_name}`")
+        method_sig = method_info.signature
+        return_type = method_info.return_type.split('.')[-1] + " "
+        query_list = [{
+            "sig": class_name + "." + method_sig[method_sig.index(return_type)+len(return_type):],
+            "function": [cm.signature for cm in method_info.call_methods],
+            "field": [cf.name for cf in method_info.external_fields],
+        }]
+        for cmethod in method_info.call_methods:
+            method_sig = cmethod.signature
+            sig_split = method_sig.split(".")
+            cinfo = self._get_class_info('.'.join(sig_split[:-1]))
+            if cinfo is None: continue
+            minfo = self._get_method_info(cinfo, sig_split[-1])
+            if minfo is None: continue
+            query_list.append({
+                "sig": method_sig,
+                "function": [cm.signature for cm in minfo.call_methods],
+                "field":[cf.name for cf in minfo.external_fields],
+            })
+        return query_list
+
+    def collect_usage_context(self, class_name, method_name:str, sim_funcs:list|None=None):
         '''
         content in usage context:
         - Parameter & Return Value in the focus method, expecially classes defined in the project
@@ -262,6 +458,7 @@ class CodeSearcher:
         - Code context for calling focus methods (unimplemented)
         - API documents (optional)
         - Code summary (optional) (unimplemented)
+        sim_funcs: results of similar function search, searched here if not given
         '''
         # get the class info and method info
         class_info = self._get_class_info(class_name)
@@ -270,65 +467,54 @@ class CodeSearcher:
         method_info = self._get_method_info(class_info, method_name)
         if method_info is None:
             raise ValueError(f"Method `{method_name}` not found in class `{class_name}`")
+        if sim_funcs is None:
+            sim_funcs = self.search_similar_function(self.get_usage_queries(class_name, method_name))
         # collect the context
         context = {}
         depclass = self.DependentClassInfo()
-        method_sig = method_info["signature"]
-        return_type = method_info["return_type"].split('.')[-1] + " "
-        query_list = [{
-            "sig": class_name + "." + method_sig[method_sig.index(return_type)+len(return_type):],
-            "function": [cm["signature"] for cm in method_info["call_methods"]],
-            "field": [cf["name"] for cf in method_info["external_fields"]],
-        }]
         
         # api documents
-        if "javadoc" in class_info:
-            context[f"api document of class {class_name}"] = class_info["javadoc"]
-        if "javadoc" in method_info:
-            context[f"api document of method {method_name}"] = method_info["javadoc"]
+        if class_info.javadoc is not None:
+            context[f"api document of class {class_name}"] = class_info.javadoc
+        if method_info.javadoc is not None:
+            context[f"api document of method {method_name}"] = method_info.javadoc
         # parameters in focus method
-        for param in method_info["parameters"]:
-            ptype = param["type"]
+        for param in method_info.parameters:
+            ptype = param.type
             pinfo = self._get_class_info(ptype)
             if pinfo is not None:
-                if "javadoc" in pinfo:
-                    depclass.update_str(ptype, "APIdoc", pinfo["javadoc"])
+                if pinfo.javadoc is not None:
+                    depclass.update_str(ptype, "APIdoc", pinfo.javadoc)
             pass
         # return type in focus method
-        return_type:str = method_info["return_type"]
+        return_type:str = method_info.return_type
         if return_type!="void" and not return_type.startswith("java"):
             context["return type"] = return_type
         # calling methods in focus method
-        for cmethod in method_info["call_methods"]:
-            method_sig = cmethod["signature"]
+        for cmethod in method_info.call_methods:
+            method_sig = cmethod.signature
             sig_split = method_sig.split(".")
             class_name = '.'.join(sig_split[:-1])
             method_name = sig_split[-1]
             cinfo = self._get_class_info(class_name)
             if cinfo is not None:
-                if "javadoc" in cinfo:
-                    depclass.update_str(class_name, "APIdoc", cinfo["javadoc"])
+                if cinfo.javadoc is not None:
+                    depclass.update_str(class_name, "APIdoc", cinfo.javadoc)
                 minfo = self._get_method_info(cinfo, method_name)
                 if minfo is not None:
-                    api_doc = minfo.get("javadoc")
-                    return_type = minfo["return_type"]
+                    api_doc = minfo.javadoc
+                    return_type = minfo.return_type
                     cmtext = f"method `{method_name}` returns `{return_type}`"
                     if api_doc is not None: cmtext += f", api document: {api_doc}"
                     depclass.update_list(class_name, "dep_func", cmtext)
-                    query_list.append({
-                        "sig": method_sig,
-                        "function": [cm["signature"] for cm in minfo["call_methods"]],
-                        "field":[cf["name"] for cf in minfo["external_fields"]],
-                    })
         # external field in focus method
-        for field in method_info["external_fields"]:
-            fqn = field["name"]
-            ftype = field["type"]
+        for field in method_info.external_fields:
+            fqn = field.name
+            ftype = field.type
             class_name = '.'.join(fqn.split(".")[:-1])
             if self._get_class_info(class_name) is not None:
                 depclass.update_list(class_name, "dep_field", f"{ftype} {fqn};")
         # related functions
-        sim_funcs = self.search_similar_function(query_list)
         self.logger.debug(f"length of search result: {len(sim_funcs)}")
         for func in sim_funcs:
             class_fqn = func["class_fqn"]
@@ -336,8 +522,8 @@ class CodeSearcher:
             caller = func["related_func"]
             cinfo = self._get_class_info(class_fqn)
             minfo = self._get_method_info(cinfo, method_sig)
-            api_doc = minfo.get("javadoc")
-            return_type = minfo["return_type"]
+            api_doc = minfo.javadoc
+            return_type = minfo.return_type
             cmtext = f"method `{method_sig}` returns `{return_type}`, related with `{'`, `'.join(caller)}`"
             if api_doc is not None: cmtext += f", api document: {api_doc}"
             depclass.update_list(class_fqn, "rel_func", cmtext)
@@ -353,24 +539,58 @@ class CodeSearcher:
         Returns:
             A list containing similar function information. Each element is a dictionary containing file path, line number, and context.
         """
-        CodeSearcher = jpype.JClass("CodeSearcher")
-        result_str = str(CodeSearcher.main([self.project_path, self.index_path, str(query), self.top_k]))
-        results = json.loads(result_str)
-        return results
+        return self.search_session.search(query)
+
+    def batch_search_similar_function(self, queries:dict) -> dict[str, list[dict]]:
+        """
+        Search the similar functions of many focal methods at once.
+        Args:
+            queries: {"<focal method id>": [query, ...]}
+        Returns:
+            {"<focal method id>": [similar function information, ...]}
+        """
+        return self.search_session.batch_search(queries)
+
+
+def benchmark_search_session(searcher:CodeSearcher, query_lists:list, repeat=1):
+    """
+    Compare per-query latency of the one-shot `CodeSearcher.main` call with the search session and the batch search.
+    """
+    JavaSearcher = jpype.JClass("CodeSearcher")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in query_lists:
+            json.loads(str(JavaSearcher.main([searcher.project_path, searcher.index_path, json.dumps(query), str(searcher.top_k)])))
+    oneshot = (time.perf_counter() - start) / (repeat * len(query_lists))
+    session = SearchSession(searcher.project_path, searcher.index_path, searcher.top_k)
+    start = time.perf_counter()
+    with session:
+        for _ in range(repeat):
+            for query in query_lists:
+                session.search(query)
+        persistent = (time.perf_counter() - start) / (repeat * len(query_lists))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            session.batch_search({str(i): query for i, query in enumerate(query_lists)})
+        batch = (time.perf_counter() - start) / (repeat * len(query_lists))
+    return {"oneshot_ms": oneshot * 1000, "session_ms": persistent * 1000, "batch_ms": batch * 1000}
 
 
 if __name__ == "__main__":
     import sys 
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    project_path = "dataset/projects/commons-csv"
-    code_info_path = "dataset/project_index/json/commons-csv.json"
-    index_path = "./dataset/project_index//lucene/commons-csv"
-    top_k = 10
-    method_name = "nextToken(Token)"
-    searcher = CodeSearcher(project_path,code_info_path,index_path,top_k)
-    # results = searcher.search_method_usage(method_name)
-    class_name = "org.apache.commons.csv.Lexer" 
-    # results = searcher.search_class_usage(class_name)
-    class_url = "src/main/java/org/apache/commons/csv/CSVFormat.java"
-    results = searcher.collect_construct_context(class_name, method_name, class_url)
-    print(results)
\ No newline at end of file
+    from settings import FileStructure as FS
+    # benchmark: python tools/code_search.py <project name> [repeat]
+    project_name = sys.argv[1] if len(sys.argv) > 1 else "commons-csv"
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    dataset_info = utils.load_json(f"{FS.DATASET_PATH}/dataset_info.json")
+    pj_info = dataset_info[project_name]
+    project_path = f"{FS.DATASET_PATH}/{pj_info['project-url']}"
+    jpype.startJVM(jpype.getDefaultJVMPath(), '-Xmx4g', "-Djava.class.path=./Java/project-index-builder.jar")
+    searcher = CodeSearcher(project_path, project_name, FS.CODE_INFO_PATH, 10)
+    query_lists = [searcher.get_usage_queries(test_info["class"], test_info["method-name"]) for test_info in pj_info["focal-methods"]]
+    latency = benchmark_search_session(searcher, query_lists, repeat)
+    print(f"{project_name}: {len(query_lists)} queries x {repeat}, "
+          f"one-shot {latency['oneshot_ms']:.2f} ms/query, session {latency['session_ms']:.2f} ms/query, "
+          f"batch {latency['batch_ms']:.2f} ms/query")
+    jpype.shutdownJVM()
@@ -0,0 +1,142 @@
+import re
+
+# javac message keys of the messages used by the repair rules, for the output of a javac process
+MESSAGE_CODES = [
+    ("cannot find symbol", "compiler.err.cant.resolve"),
+    ("unreported exception", "compiler.err.unreported.exception.need.to.catch.or.throw"),
+    ("has private access", "compiler.err.report.access"),
+]
+HEADER_PATTERN = re.compile(r"^(.+?\.java):(\d+): (error|warning): (.*)$")
+SUMMARY_PATTERN = re.compile(r"^(\d+ (errors?|warnings?)|Note: .*)$")
+
+
+class CompileDiagnostic:
+    '''
+    a javac diagnostic, line and column are 1-based (-1 if unknown)
+    kind: ERROR, WARNING, MANDATORY_WARNING, NOTE, OTHER
+    code: javac message key, e.g. "compiler.err.cant.resolve.location", None if unknown
+    '''
+    __slots__ = ("kind", "file", "line", "column", "code", "message", "source_line")
+
+    def __init__(self, kind:str, file:str, line:int, column:int, code:str|None, message:str, source_line:str=""):
+        self.kind = kind
+        self.file = file
+        self.line = line
+        self.column = column
+        self.code = code
+        self.message = message
+        self.source_line = source_line
+
+    @classmethod
+    def from_java(cls, diagnostic):
+        # compiler.CompileDiagnostic of project-info-process
+        code = None if diagnostic.code is None else str(diagnostic.code)
+        return cls(str(diagnostic.kind), str(diagnostic.file), int(diagnostic.line), int(diagnostic.column),
+                   code, str(diagnostic.message), str(diagnostic.source_line))
+
+    @property
+    def is_error(self):
+        return self.kind == "ERROR"
+
+    @property
+    def symbol(self):
+        '''
+        (symbol kind, symbol name) of "cannot find symbol" errors, e.g. ("class", "List")
+        '''
+        group = re.findall(r'symbol:\s+(class|variable|method) (.*)', self.message)
+        return group[0] if len(group) > 0 else None
+
+    def detail(self):
+        '''
+        message with the source line and caret, as javac prints it after "<file>:<line>: error: "
+        '''
+        lines = self.message.split("\n")
+        text = lines[0]
+        if self.source_line:
+            text += f"\n{self.source_line}"
+            if self.column > 0:
+                text += "\n" + " " * (self.column - 1) + "^"
+        for line in lines[1:]:
+            text += f"\n{line}"
+        return text
+
+    def format(self):
+        kind = "error" if self.is_error else "warning"
+        return f"{self.file}:{self.line}: {kind}: {self.detail()}"
+
+    def __repr__(self):
+        return f"CompileDiagnostic({self.kind}, {self.file}:{self.line}:{self.column}, {self.code}, {self.message!r})"
+
+
+def format_diagnostics(diagnostics:list[CompileDiagnostic]):
+    errors = sum(1 for diagnostic in diagnostics if diagnostic.is_error)
+    text = "\n".join(diagnostic.format() for diagnostic in diagnostics)
+    if errors > 0:
+        text += f"\n{errors} error{'s' if errors > 1 else ''}"
+    return text + "\n"
+
+
+def parse_javac_output(output:str) -> list[CompileDiagnostic]:
+    '''
+    parse the output of a javac process into diagnostics, in one pass over the lines:
+        <file>:<line>: error: <message>
+        <source line>
+        <caret line>
+        <more message lines, e.g. symbol & location>
+    '''
+    diagnostics = []
+    current = None
+    extra = []
+    for text in output.splitlines():
+        header = HEADER_PATTERN.match(text)
+        if header is not None or SUMMARY_PATTERN.match(text) is not None:
+            if current is not None:
+                diagnostics.append(_finish_diagnostic(current, extra))
+            current, extra = None, []
+            if header is None: continue
+            file, line, kind, message = header.groups()
+            current = CompileDiagnostic("ERROR" if kind == "error" else "WARNING", file, int(line), -1, None, message)
+        elif current is not None:
+            extra.append(text)
+    if current is not None:
+        diagnostics.append(_finish_diagnostic(current, extra))
+    return diagnostics
+
+
+def _finish_diagnostic(diagnostic:CompileDiagnostic, extra:list[str]):
+    message_lines = []
+    caret = -1
+    for i, text in enumerate(extra):
+        if caret == -1 and text.strip() == "^":
+            caret = i
+            diagnostic.column = text.index("^") + 1
+    if caret > 0:
+        diagnostic.source_line = extra[caret-1]
+        message_lines = extra[:caret-1] + extra[caret+1:]
+    else:
+        message_lines = extra
+    if len(message_lines) > 0:
+        diagnostic.message += "\n" + "\n".join(message_lines)
+    for text, code in MESSAGE_CODES:
+        if diagnostic.message.startswith(text):
+            diagnostic.code = code
+            break
+    return diagnostic
+
+
+def _normalise_path(path:str):
+    return path.replace("\\", "/").lstrip("./")
+
+
+def errors_in_file(diagnostics:list[CompileDiagnostic], source_path:str) -> list[CompileDiagnostic]:
+    '''
+    errors reported for a source file, paths are compared independent of the separator
+    '''
+    source = _normalise_path(source_path)
+    errors = []
+    for diagnostic in diagnostics:
+        if not diagnostic.is_error: continue
+        file = _normalise_path(diagnostic.file)
+        if file == source or file.endswith("/" + source) or source.endswith("/" + file):
+            errors.append(diagnostic)
+    return errors
@@ -1,22 +1,126 @@
 import os
 import re
+import json
+import jpype
 import logging
+import threading
 import subprocess
+import xml.etree.ElementTree as ET
 from typing import List, Tuple
 from bs4 import BeautifulSoup
 
+from settings import TaskSettings as TS
+from tools.diagnostics import CompileDiagnostic, format_diagnostics, parse_javac_output
+
+TEST_RUNNER_JAR = "./Java/project-test-runner.jar"
+
+
+class TestRunnerDaemon:
+    '''
+    client of the long-lived test runner JVM of a project (Java/project-test-runner),
+    the daemon is started in the project folder on the first request
+    '''
+    project_url: str
+    dependency_fd: str
+    jvm_args: list[str]
+    process: subprocess.Popen|None
+
+    def __init__(self, project_url:str, dep_fd:str, jvm_args:list[str]|None=None):
+        self.project_url = project_url
+        self.dependency_fd = dep_fd
+        self.jvm_args = jvm_args or []
+        self.process = None
+        self.request_id = 0
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        classpath = os.pathsep.join([
+            os.path.abspath(TEST_RUNNER_JAR),
+            f"{self.dependency_fd}/junit-platform-console-standalone-1.9.3.jar",
+            f"{self.dependency_fd}/jacococli.jar",
+            # the vintage engine of console-standalone only sees junit 4 on the same class loader
+            f"{self.dependency_fd}/junit-4.13.2.jar",
+            f"{self.dependency_fd}/hamcrest-core-1.3.jar",
+        ])
+        # test classpath except target/test-classes & target/classes, which are reloaded for each run
+        shared_classpath = ["libs/*"]
+        cmd = ['java'] + self.jvm_args + [
+            f"-javaagent:{self.dependency_fd}/jacocoagent.jar=output=none",
+            '-cp', classpath,
+            'TestRunnerDaemon',
+        ] + shared_classpath
+        self.logger.info(f"starting test runner daemon in {self.project_url}")
+        self.process = subprocess.Popen(cmd, cwd=self.project_url, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        text=True, encoding="utf-8", errors="ignore")
+        return
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def request(self, cmd:str, **kwargs) -> tuple[int, str]:
+        '''
+        return (return code, output), return code -1 if the daemon failed
+        '''
+        response = self.request_json(cmd, **kwargs)
+        return (response["code"], response.get("output", ""))
+
+    def request_json(self, cmd:str, **kwargs) -> dict:
+        '''
+        the whole response, {"code": -1, "output": <error>} if the daemon failed
+        '''
+        with self.lock:
+            if not self.is_alive():
+                self.start()
+            self.request_id += 1
+            message = {"id": self.request_id, "cmd": cmd}
+            message.update(kwargs)
+            try:
+                self.process.stdin.write(json.dumps(message) + "\n")
+                self.process.stdin.flush()
+                line = self.process.stdout.readline()
+                response = json.loads(line)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"test runner daemon failed: {e}")
+                self.close()
+                return {"code": -1, "output": str(e)}
+        return response
+
+    def close(self):
+        if self.process is None: return
+        if self.is_alive():
+            try:
+                self.process.stdin.write(json.dumps({"id": 0, "cmd": "shutdown"}) + "\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+        self.process = None
+        return
+
 
 class JavaRunner:
     cd_cmd: list
     dependency_fd: str
+    diagnostics: list[CompileDiagnostic]|None
     logger: logging.Logger
     
-    def __init__(self, project_url:str, dep_fd=""):
+    def __init__(self, project_url:str, dep_fd="", use_daemon:bool|None=None, jvm_args:list[str]|None=None):
+        '''
+        jvm_args: extra options of the test JVMs and test runner daemons
+        '''
         self.cd_cmd = ['cd', project_url, '&&']
         self.dependency_fd = dep_fd
+        self.diagnostics = None
+        self.compiler = None
+        self.use_compile_service = getattr(TS, "COMPILE_SERVICE", True)
+        if use_daemon is None:
+            use_daemon = getattr(TS, "TEST_DAEMON", False) and os.path.exists(TEST_RUNNER_JAR)
+        self.jvm_args = jvm_args
+        self.daemon = TestRunnerDaemon(project_url, dep_fd, jvm_args) if use_daemon else None
+        self.service_daemon = None
         test_dependencies = f"libs/*;target/test-classes;target/classes;{self.dependency_fd}/*"
-        self.test_base_cmd = [
-            'java',
+        self.test_base_cmd = ['java'] + (jvm_args or []) + [
             '-cp', test_dependencies,
             'org.junit.platform.console.ConsoleLauncher',
             '--disable-banner',
@@ -26,16 +130,87 @@ class JavaRunner:
         self.logger = logging.getLogger(__name__)
         return
     
+    def _get_compiler(self):
+        '''
+        resident javac (compiler.TestCompiler) in the JPype JVM, None if not available
+        '''
+        if self.compiler is None and self.use_compile_service and jpype.isJVMStarted():
+            try:
+                TestCompiler = jpype.JClass("compiler.TestCompiler")
+                if TestCompiler.isAvailable():
+                    self.compiler = TestCompiler.forProject(self.cd_cmd[1])
+            except Exception as e:
+                self.logger.warning(f"compile service not available, use javac instead: {e}")
+            if self.compiler is None:
+                self.use_compile_service = False
+        return self.compiler
+
     def compile_test(self, class_path):
+        '''
+        compile a test class into target/test-classes,
+        errors of the compilation are kept in `self.diagnostics` as CompileDiagnostic records
+        '''
+        self.diagnostics = None
+        compiler = self._get_compiler()
+        if compiler is not None:
+            self.logger.info(f"compile {class_path} with compile service")
+            try:
+                diagnostics = [CompileDiagnostic.from_java(diag) for diag in compiler.compileFile(class_path)]
+            except Exception as e:
+                self.logger.error(f"error occured in compile test class, info:\n{e}")
+                return (False, str(e))
+            self.diagnostics = [diag for diag in diagnostics if diag.is_error]
+            if len(self.diagnostics) > 0:
+                feedback = format_diagnostics(self.diagnostics)
+                self.logger.error(f"error occured in compile test class, info:\n{feedback}")
+                return (False, feedback)
+            return (True, "")
         compile_cmd = ["javac", "-cp", "@dependencies.txt","-d","target/test-classes", class_path]
         script = self.cd_cmd + compile_cmd
         self.logger.info(" ".join(compile_cmd))
         result = subprocess.run(script, capture_output=True, text=True, shell=True, encoding="utf-8")
         if result.returncode!= 0:
+            self.diagnostics = [diag for diag in parse_javac_output(result.stderr) if diag.is_error]
             self.logger.error(f"error occured in compile test class, info:\n{result.stderr}")
             return (False, result.stderr)
+        self.diagnostics = []
         return (True, "")
 
+    def compile_tests(self, class_paths:list[str]) -> dict:
+        '''
+        compile test classes with as few javac runs as possible: all files at once, then again
+        without the files with errors -> {class path: (success, feedback)}
+        '''
+        results = {}
+        if self._get_compiler() is not None:
+            for class_path in class_paths:
+                results[class_path] = self.compile_test(class_path)
+            return results
+        pending = list(class_paths)
+        while len(pending) > 0:
+            compile_cmd = ["javac", "-cp", "@dependencies.txt","-d","target/test-classes"] + pending
+            self.logger.info(f"javac {len(pending)} test classes")
+            result = subprocess.run(self.cd_cmd + compile_cmd, capture_output=True, text=True, shell=True, encoding="utf-8")
+            if result.returncode == 0:
+                results.update({class_path: (True, "") for class_path in pending})
+                break
+            diagnostics = [diag for diag in parse_javac_output(result.stderr) if diag.is_error]
+            failed = {}
+            for class_path in pending:
+                errors = [diag for diag in diagnostics if os.path.normpath(diag.file).endswith(os.path.normpath(class_path))]
+                if len(errors) > 0: failed[class_path] = errors
+            if len(failed) == 0 or len(pending) == 1:
+                # errors can not be attributed to the files
+                for class_path in pending:
+                    results[class_path] = self.compile_test(class_path)
+                break
+            for class_path, errors in failed.items():
+                feedback = format_diagnostics(errors)
+                self.logger.error(f"error occured in compile test class {class_path}, info:\n{feedback}")
+                results[class_path] = (False, feedback)
+            pending = [class_path for class_path in pending if class_path not in failed]
+        return results
+
     def run_singal_unit_test(self, testclass, coverage:bool=True):
         """
         return code of JUnit test:
@@ -45,6 +220,9 @@ class JavaRunner:
         - 2: No tests
         """
         self.logger.info(f"Running single unit test, testclass: {testclass}")
+        if self.daemon is not None:
+            returncode, output = self.daemon.request("run", classes=[testclass], coverage=coverage, exec="target/jacoco.exec")
+            return self._test_result(testclass, returncode, output, "")
         test_cmd = self.test_base_cmd.copy() + ['--select-class', testclass]
         if coverage:
             java_agent = f"-javaagent:{self.dependency_fd}/jacocoagent.jar=destfile=target/jacoco.exec" 
@@ -52,21 +230,31 @@ class JavaRunner:
         
         script = self.cd_cmd + test_cmd
         result = subprocess.run(script, capture_output=True, text=True, shell=True, encoding="utf-8", errors='ignore')
-        self.logger.info(f"return code: {result.returncode}")
-        if result.returncode == 0:
-            self.logger.info(f"test execution info: {result.stdout}")
-            return (True, result.stdout)
-        elif result.returncode != -1:
-            test_info = f"{result.stderr}\n{result.stdout}"
+        return self._test_result(testclass, result.returncode, result.stdout, result.stderr)
+
+    def _test_result(self, testclass, returncode, stdout, stderr):
+        self.logger.info(f"return code: {returncode}")
+        if returncode == 0:
+            self.logger.info(f"test execution info: {stdout}")
+            return (True, stdout)
+        elif returncode != -1:
+            test_info = f"{stderr}\n{stdout}"
             self.logger.info(f"test case failed in {testclass}, info:\n{test_info}")
             flag = True if len(re.findall(r"([0-9]+) tests started", test_info))>0 else False
             return (flag, test_info)
         else:
-            test_info = f"{result.stderr}\n{result.stdout}"
+            test_info = f"{stderr}\n{stdout}"
             self.logger.error(f"error occured in execute test class {testclass}, info:\n{test_info}")
             return (False, test_info)
 
     def run_selected_mehods(self, methods:list[str]):
+        if self.daemon is not None:
+            returncode, output = self.daemon.request("run", methods=methods, coverage=True, exec="target/jacoco.exec")
+            if returncode == -1:
+                self.logger.error(f"error occured in execute: {methods}\n info:\n{output}")
+                return False
+            self.logger.info(f"test execution info: {output}")
+            return True
         java_agent = f"-javaagent:{self.dependency_fd}/jacocoagent.jar=destfile=target/jacoco.exec"
         test_cmd = self.test_base_cmd.copy()
         test_cmd.insert(test_cmd.index('-cp'), java_agent)
@@ -83,13 +271,67 @@ class JavaRunner:
             self.logger.info(f"test execution info: {result.stdout}")
         return True
 
-    def generate_report_single(self, html_report, csv_report=None):
-        # generate report
+    def _service_daemon(self) -> TestRunnerDaemon|None:
+        '''
+        the test runner daemon, or one started for matrix & batch runs if TEST_DAEMON is off;
+        None if Java/project-test-runner.jar is not available
+        '''
+        if self.daemon is not None: return self.daemon
+        if not os.path.exists(TEST_RUNNER_JAR): return None
+        if self.service_daemon is None:
+            self.service_daemon = TestRunnerDaemon(self.cd_cmd[1], self.dependency_fd, self.jvm_args)
+        return self.service_daemon
+
+    def run_test_batch(self, classes:list[str]|None=None, methods:list[str]|None=None, exec_dir="target/jacoco-batch") -> dict|None:
+        '''
+        run the test classes (or methods) in one launch, the coverage of each class is written to <exec_dir>/<class>.exec;
+        {"<test class>": {"started": n, "succeeded": n, "failed": n, "passed": [<method name>], "output": str}},
+        None if the test runner daemon is not available or failed
+        '''
+        daemon = self._service_daemon()
+        if daemon is None: return None
+        classes, methods = classes or [], methods or []
+        self.logger.info(f"Running batch of {len(classes)} test classes & {len(methods)} test methods")
+        response = daemon.request_json("batch", classes=classes, methods=methods, exec_dir=exec_dir)
+        if response["code"] == -1:
+            self.logger.error(f"error occured in batch run, info:\n{response.get('output', '')}")
+            return None
+        return response.get("classes", {})
+
+    def run_coverage_matrix(self, testclass, target_classes:list[str]) -> "CoverageMatrix|None":
+        '''
+        run a test class once, with the coverage of the target classes recorded per test method;
+        None if the test runner daemon is not available or failed
+        '''
+        daemon = self._service_daemon()
+        if daemon is None: return None
+        self.logger.info(f"Running coverage matrix of {testclass}, targets: {target_classes}")
+        response = daemon.request_json("matrix", classes=[testclass], targets=target_classes)
+        if response["code"] == -1:
+            self.logger.error(f"error occured in coverage matrix of {testclass}, info:\n{response.get('output', '')}")
+            return None
+        return CoverageMatrix(response.get("matrix", {}))
+
+    def generate_report_single(self, html_report=None, csv_report=None, xml_report=None, exec_file="target/jacoco.exec"):
+        '''
+        jacoco report of the exec file in the given formats, formats with report path None are skipped
+        '''
         jacoco_cli = f"{self.dependency_fd}/jacococli.jar"
-        report_cmd = ['java', '-jar', jacoco_cli, "report", "target/jacoco.exec", '--classfiles', 'target/classes', '--sourcefiles', 'src/main/java', "--html", html_report]
-        self.logger.debug(' '.join(report_cmd))
+        report_args = ["report", exec_file, '--classfiles', 'target/classes', '--sourcefiles', 'src/main/java']
+        if html_report is not None:
+            report_args += ["--html", html_report]
         if csv_report is not None:
-            report_cmd += ["--csv", csv_report]
+            report_args += ["--csv", csv_report]
+        if xml_report is not None:
+            report_args += ["--xml", xml_report]
+        if self.daemon is not None:
+            returncode, output = self.daemon.request("report", args=report_args)
+            if returncode != 0:
+                self.logger.error(f"error occured in generate report, info:\n{output}")
+                return False
+            return True
+        report_cmd = ['java', '-jar', jacoco_cli] + report_args
+        self.logger.debug(' '.join(report_cmd))
         script = self.cd_cmd + report_cmd
 
         result = subprocess.run(script, capture_output=True, text=True, shell=True, encoding="utf-8", errors='ignore')
@@ -98,16 +340,153 @@ class JavaRunner:
             return False
         return True
 
-    def delete_jacoco_exec(self):
-        jacoco_path = f"{self.cd_cmd[1]}/target/jacoco.exec"
+    def close(self):
+        for daemon in (self.daemon, self.service_daemon):
+            if daemon is not None: daemon.close()
+        return
+
+    def keep_jacoco_exec(self, exec_file, source="target/jacoco.exec"):
+        '''
+        move the exec file of the last run to exec_file, e.g. to render html reports later
+        '''
+        jacoco_path = f"{self.cd_cmd[1]}/{source}"
+        if os.path.exists(jacoco_path):
+            os.replace(jacoco_path, exec_file)
+        return
+
+    def delete_jacoco_exec(self, source="target/jacoco.exec"):
+        jacoco_path = f"{self.cd_cmd[1]}/{source}"
         if os.path.exists(jacoco_path):
             os.remove(jacoco_path)
         return
 
 
+_PRIMITIVE_TYPES = {"B": "byte", "C": "char", "D": "double", "F": "float", "I": "int",
+                    "J": "long", "S": "short", "Z": "boolean", "V": "void"}
+
+
+def _short_type_names(desc:str) -> list[str]:
+    '''
+    parameter types of a method descriptor as named in the jacoco html report,
+    e.g. "(ILjava/util/Map$Entry;[Ljava/lang/String;)V" -> ["int", "Map.Entry", "String[]"]
+    '''
+    names = []
+    i = desc.index("(") + 1
+    while desc[i] != ")":
+        dims = 0
+        while desc[i] == "[":
+            dims += 1
+            i += 1
+        if desc[i] == "L":
+            end = desc.index(";", i)
+            name = desc[i+1:end].split("/")[-1].replace("$", ".")
+            i = end + 1
+        else:
+            name = _PRIMITIVE_TYPES[desc[i]]
+            i += 1
+        names.append(name + "[]" * dims)
+    return names
+
+
+def jacoco_method_name(class_name:str, name:str, desc:str) -> str:
+    '''
+    method name of the jacoco html report from the vm names of the xml report
+    '''
+    if name == "<clinit>": return "static {...}"
+    if name == "<init>":
+        simple_name = class_name.split("/")[-1]
+        if simple_name.split("$")[-1].isdigit(): return "{...}"
+        name = simple_name.replace("$", ".")
+    return f"{name}({', '.join(_short_type_names(desc))})"
+
+
+def _ratio(missed:int, covered:int) -> float:
+    # truncated to whole percents like the html report, 0.0 if there is nothing to cover
+    if missed + covered == 0: return 0.0
+    return (covered * 100 // (missed + covered)) / 100
+
+
+def _counter_ratio(counter) -> float:
+    if counter is None: return 0.0
+    return _ratio(int(counter.get("missed")), int(counter.get("covered")))
+
+
+class CoverageMatrix:
+    '''
+    methods covered by each test method of a run:
+    {"<test class>#<test method>": {"<class fqn>": [("<method name>", (inst_cov, bran_cov))]}}
+    method names are the names of the jacoco html report (see `jacoco_method_name`)
+    '''
+    tests: dict
+
+    def __init__(self, matrix:dict):
+        self.tests = {}
+        for test_id, classes in matrix.items():
+            self.tests[test_id] = {
+                class_fqn: [(jacoco_method_name(class_fqn.replace(".", "/"), method["name"], method["desc"]),
+                                               (_ratio(*method["inst"]), _ratio(*method["branch"]))) for method in methods]
+                for class_fqn, methods in classes.items()
+            }
+        self.extractor = CoverageExtractor()
+
+    def coverage(self, test_id, class_fqn, method):
+        '''
+        (instruction coverage, branch coverage) of a method by a test, None if not covered
+        '''
+        for method_name, coverage_score in self.tests.get(test_id, {}).get(class_fqn, []):
+            if self.extractor.check_method_name(method_name, method):
+                return coverage_score
+        return None
+
+    def has_tests(self, test_class) -> bool:
+        '''
+        whether tests of the test class were run, an empty matrix means the tests were not found
+        '''
+        return any(test_id.startswith(f"{test_class}#") for test_id in self.tests)
+
+    def covers(self, test_id, class_fqn, method) -> bool:
+        coverage_score = self.coverage(test_id, class_fqn, method)
+        return coverage_score is not None and coverage_score[0] > 0
+
+
 class CoverageExtractor:
+    xml_reports: dict # {"<xml path>": {"<class fqn>": [("<method name>", (inst_cov, bran_cov))]}}
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        self.xml_reports = {}
+
+    def load_xml_report(self, xml_path) -> dict|None:
+        '''
+        method coverage index of a jacoco xml report, parsed once per report
+        '''
+        if xml_path in self.xml_reports: return self.xml_reports[xml_path]
+        if not os.path.exists(xml_path): return None
+        index = {}
+        for class_node in ET.parse(xml_path).getroot().iter("class"):
+            class_name = class_node.get("name")
+            methods = []
+            for method_node in class_node.iter("method"):
+                counters = {counter.get("type"): counter for counter in method_node.iter("counter")}
+                method_name = jacoco_method_name(class_name, method_node.get("name"), method_node.get("desc"))
+                methods.append((method_name, (_counter_ratio(counters.get("INSTRUCTION")), _counter_ratio(counters.get("BRANCH")))))
+            index[class_name.replace("/", ".")] = methods
+        self.xml_reports[xml_path] = index
+        return index
+
+    def extract_coverage(self, xml_path, html_path, class_fqn, method):
+        '''
+        (instruction coverage, branch coverage) of a method from the xml report,
+        from the html report if there is no xml report (reports of earlier runs)
+        '''
+        index = self.load_xml_report(xml_path)
+        if index is None:
+            return self.extract_single_coverage(html_path, method)
+        self.logger.info(f"Extracting coverage for class: {class_fqn} in {xml_path}, method: {method}")
+        for method_name, coverage_score in index.get(class_fqn, []):
+            if self.check_method_name(method_name, method):
+                return coverage_score
+        return None
 
     def check_method_name(self, method_name, target):
         while len(re.findall(r"<[^<>]*>", target, flags=re.DOTALL))>0:
@@ -0,0 +1,273 @@
+import os
+import mmap
+import struct
+from collections.abc import Mapping
+
+import tools.io_utils as io_utils
+
+'''
+Binary format of the project index files (`*.idx`, converted from the json files):
+    [data section]  encoded values, children of a lazy dict are written before the dict itself
+    [string table]  uint32 offsets[count+1], utf-8 blob; every string (keys & values) is stored once
+    [footer]        magic, version, string table offset, string count, root offset
+
+encoding of a value: 1 byte tag + payload
+    NONE/FALSE/TRUE     no payload
+    INT                 int32, LONG int64, FLOAT double
+    STR                 uint32 string id
+    LIST                uint32 n + n values
+    DICT                uint32 n + n * (uint32 key id + value), decoded at once
+    LAZY_DICT           uint32 n + n * (uint32 key id + uint64 value offset), values decoded on first access
+'''
+MAGIC = b"UTGIDX\x00\x00"
+VERSION = 1
+FOOTER = struct.Struct("<8sIQIQ")
+TAG_NONE, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_LONG, TAG_FLOAT, TAG_STR, TAG_LIST, TAG_DICT, TAG_LAZY_DICT = range(10)
+U32 = struct.Struct("<I")
+I32 = struct.Struct("<i")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+LAZY_ENTRY = struct.Struct("<IQ")
+
+
+class IndexStoreWriter:
+    '''
+    lazy_depth: number of dict levels from the root which are decoded lazily,
+    e.g. 2 for {"source": {"<class_fqn>": {...}}} or {"<class_fqn>": {"<method_sig>": {...}}}
+    '''
+    def __init__(self, lazy_depth=2):
+        self.lazy_depth = lazy_depth
+        self.strings = {}
+        self.buffer = bytearray()
+
+    def _string_id(self, text:str):
+        sid = self.strings.get(text)
+        if sid is None:
+            sid = len(self.strings)
+            self.strings[text] = sid
+        return sid
+
+    def _encode_inline(self, value, out:bytearray):
+        if value is None:
+            out.append(TAG_NONE)
+        elif value is True:
+            out.append(TAG_TRUE)
+        elif value is False:
+            out.append(TAG_FALSE)
+        elif isinstance(value, int):
+            if -2**31 <= value < 2**31:
+                out.append(TAG_INT)
+                out += I32.pack(value)
+            else:
+                out.append(TAG_LONG)
+                out += I64.pack(value)
+        elif isinstance(value, float):
+            out.append(TAG_FLOAT)
+            out += F64.pack(value)
+        elif isinstance(value, str):
+            out.append(TAG_STR)
+            out += U32.pack(self._string_id(value))
+        elif isinstance(value, (list, tuple)):
+            out.append(TAG_LIST)
+            out += U32.pack(len(value))
+            for item in value:
+                self._encode_inline(item, out)
+        elif isinstance(value, dict):
+            out.append(TAG_DICT)
+            out += U32.pack(len(value))
+            for key, item in value.items():
+                out += U32.pack(self._string_id(key))
+                self._encode_inline(item, out)
+        else:
+            raise TypeError(f"unsupported value type in index: {type(value)}")
+
+    def _write(self, value, depth) -> int:
+        if isinstance(value, dict) and depth > 0:
+            entries = [(self._string_id(key), self._write(item, depth-1)) for key, item in value.items()]
+            offset = len(self.buffer)
+            self.buffer.append(TAG_LAZY_DICT)
+            self.buffer += U32.pack(len(entries))
+            for key_id, item_offset in entries:
+                self.buffer += LAZY_ENTRY.pack(key_id, item_offset)
+            return offset
+        offset = len(self.buffer)
+        self._encode_inline(value, self.buffer)
+        return offset
+
+    def write(self, data, path:str):
+        root_offset = self._write(data, self.lazy_depth)
+        string_offset = len(self.buffer)
+        blobs = [text.encode("utf-8") for text in self.strings]
+        position = 0
+        offsets = bytearray()
+        for blob in blobs:
+            offsets += U32.pack(position)
+            position += len(blob)
+        offsets += U32.pack(position)
+        io_utils.check_path(path)
+        with open(path, "wb") as f:
+            f.write(self.buffer)
+            f.write(offsets)
+            for blob in blobs:
+                f.write(blob)
+            f.write(FOOTER.pack(MAGIC, VERSION, string_offset, len(blobs), root_offset))
+        return
+
+
+class LazyDict(Mapping):
+    '''
+    read-only dict backed by an index store, values are decoded on first access and cached
+    '''
+    def __init__(self, store, offset):
+        self.store = store
+        count = U32.unpack_from(store.data, offset + 1)[0]
+        self.entries = {}
+        position = offset + 5
+        for _ in range(count):
+            key_id, item_offset = LAZY_ENTRY.unpack_from(store.data, position)
+            self.entries[store.get_string(key_id)] = item_offset
+            position += LAZY_ENTRY.size
+        self.cache = {}
+
+    def __getitem__(self, key):
+        if key in self.cache:
+            return self.cache[key]
+        value = self.store.decode(self.entries[key])
+        self.cache[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class IndexStore:
+    '''
+    memory-mapped reader of an index file, `root()` returns the converted json data
+    '''
+    def __init__(self, path:str):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.string_offset, self.string_count, self.root_offset = \
+            FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a project index file: {path}")
+        self.blob_offset = self.string_offset + (self.string_count + 1) * U32.size
+        self.strings = [None] * self.string_count
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def get_string(self, sid:int) -> str:
+        text = self.strings[sid]
+        if text is None:
+            start, end = struct.unpack_from("<II", self.data, self.string_offset + sid * U32.size)
+            text = str(self.data[self.blob_offset + start:self.blob_offset + end], "utf-8")
+            self.strings[sid] = text
+        return text
+
+    def root(self):
+        return self.decode(self.root_offset)
+
+    def decode(self, offset:int):
+        if self.data[offset] == TAG_LAZY_DICT:
+            return LazyDict(self, offset)
+        return self._decode_inline(offset)[0]
+
+    def _decode_inline(self, offset:int):
+        data = self.data
+        tag = data[offset]
+        offset += 1
+        if tag == TAG_INT:
+            return I32.unpack_from(data, offset)[0], offset + 4
+        if tag == TAG_STR:
+            return self.get_string(U32.unpack_from(data, offset)[0]), offset + 4
+        if tag == TAG_LIST:
+            count = U32.unpack_from(data, offset)[0]
+            offset += 4
+            items = []
+            for _ in range(count):
+                item, offset = self._decode_inline(offset)
+                items.append(item)
+            return items, offset
+        if tag == TAG_DICT:
+            count = U32.unpack_from(data, offset)[0]
+            offset += 4
+            items = {}
+            for _ in range(count):
+                key = self.get_string(U32.unpack_from(data, offset)[0])
+                items[key], offset = self._decode_inline(offset + 4)
+            return items, offset
+        if tag == TAG_NONE:
+            return None, offset
+        if tag == TAG_TRUE:
+            return True, offset
+        if tag == TAG_FALSE:
+            return False, offset
+        if tag == TAG_LONG:
+            return I64.unpack_from(data, offset)[0], offset + 8
+        if tag == TAG_FLOAT:
+            return F64.unpack_from(data, offset)[0], offset + 8
+        raise ValueError(f"unknown tag {tag} at offset {offset-1} in {self.path}")
+
+
+def index_path_of(json_path:str):
+    return os.path.splitext(json_path)[0] + ".idx"
+
+
+def convert_json(json_path:str, lazy_depth=2):
+    '''
+    convert a json index file to a binary index file next to it, e.g. json/<project>.json -> json/<project>.idx
+    '''
+    data = io_utils.load_json(json_path)
+    index_path = index_path_of(json_path)
+    IndexStoreWriter(lazy_depth).write(data, index_path)
+    return index_path
+
+
+def convert_project_index(code_info_path:str, project:str):
+    '''
+    convert the code info, control flow, calling graph and invoke pattern files of a project
+    '''
+    converted = []
+    index_files = [
+        (f"{code_info_path}/json/{project}.json", 2),
+        (f"{code_info_path}/codegraph/{project}_controlflow.json", 2),
+        (f"{code_info_path}/codegraph/{project}_callgraph.json", 1),
+        (f"{code_info_path}/codegraph/{project}_invoke.json", 1),
+    ]
+    for json_path, lazy_depth in index_files:
+        if os.path.exists(json_path):
+            converted.append(convert_json(json_path, lazy_depth))
+    return converted
+
+
+def load_index_data(json_path:str):
+    '''
+    load an index file, the binary index is used (lazily) if it is not older than the json file
+    '''
+    index_path = index_path_of(json_path)
+    if os.path.exists(index_path) and \
+        (not os.path.exists(json_path) or os.path.getmtime(index_path) >= os.path.getmtime(json_path)):
+        return IndexStore(index_path).root()
+    return io_utils.load_json(json_path)
+
+
+if __name__ == "__main__":
+    # convert the index of projects: python -m tools.index_store <project_index path> <project> [<project> ...]
+    import sys
+    import time
+    code_info_path = sys.argv[1]
+    for project in sys.argv[2:]:
+        for index_path in convert_project_index(code_info_path, project):
+            start = time.perf_counter()
+            root = IndexStore(index_path).root()
+            open_time = time.perf_counter() - start
+            print(f"{index_path}: {os.path.getsize(index_path)/2**20:.2f} MB, {len(root)} entries, opened in {open_time*1000:.2f} ms")
@@ -33,6 +33,19 @@ def write_json(file, data):
     return
 
 
+def write_json_atomic(file, data):
+    '''
+    write a temporary file next to the file and replace it, readers never see a partial file
+    '''
+    temp_file = f"{file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, file)
+    return
+
+
 def write_text(file,text):
     with open(file, 'w', encoding="utf-8") as f:
         f.write(text)
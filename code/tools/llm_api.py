@@ -1,13 +1,78 @@
 import re
 import json
+import time
+import httpx
+import random
+import asyncio
 import logging
-from openai import  OpenAI, Omit, omit
+import threading
+import email.utils
+import concurrent.futures
+from datetime import datetime, timezone
+from openai import  OpenAI, AsyncOpenAI, Omit, omit
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
 from openai.types.chat.completion_create_params import ResponseFormat
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 
+from tools.llm_cache import ResponseCache, request_key, get_response_cache
 from settings import LLMSettings as ST
 
-class LLMCaller:
+class ResponseParser:
+    '''
+    extract code / json objects from LLM responses, and look up responses in the response cache
+    '''
+    logger: logging.Logger
+    cache: ResponseCache|None = None
+
+    def _cache_lookup(self, prompt:str, rps_format:dict|Omit=omit, attempt:int=0):
+        # -> (key, cached response), key is None if the cache is disabled
+        if self.cache is None: return None, None
+        messages = self.base_message + [{"role": "user", "content": prompt}]
+        key = request_key(self.model, self.temperature, rps_format, messages, attempt)
+        return key, self.cache.get(key)
+
+    def _cache_store(self, key:str|None, response:str):
+        if key is not None: self.cache.put(key, response)
+        return
+
+    def _filter_code(self, output:str) -> str:
+        # extract java code from output
+        java_pattern = r"```(?:[jJ]ava)?\n+([\s\S]*?)\n```"
+        code = ""
+        matches = re.findall(java_pattern, output, re.DOTALL)
+        if len(matches) == 0:
+            # if no code found, fix incomplete code
+            incomplete_pattern = r"```(?:[jJ]ava)?\n+([\s\S]*?)$"
+            icp_matches = re.findall(incomplete_pattern, output, re.DOTALL)
+            if len(icp_matches) > 0:
+                icp_code:str = icp_matches[0]
+                # remove last @Test function
+                last_test_pos = icp_code.rfind("@Test")
+                code = icp_code[:last_test_pos] if last_test_pos != -1 else icp_code
+                # check if code has unmatched braces
+                open_braces = code.count('{')
+                close_braces = code.count('}')
+                if open_braces > close_braces:
+                    code = code + "}" * (open_braces - close_braces)
+        else:
+            # select the longest one in matches
+            code = max(matches, key=len)
+        return code
+
+    # split json object from response
+    def _handle_json_response(self, response):
+        # self.logger.debug(f"Response: {response}")
+        json_str = re.sub(r' //.*', '', response)
+        json_pattern = r"```(?:[jJ]son)?\n+([\s\S]*?)\n```"
+        matches = re.findall(json_pattern, json_str, re.DOTALL)
+        if len(matches)>0:
+            json_str = max(matches, key=len)
+        obj = json.loads(json_str)
+        self.logger.debug(f"Json object: {obj}")
+        return obj
+
+
+class LLMCaller(ResponseParser):
     account_num = 0
     cur_account_num = 0
     accounts = []
@@ -22,6 +87,7 @@ class LLMCaller:
         account = self.accounts[self.cur_account_num]
         self.temperature = ST.TEMPERATURE
         self.gpt = OpenAI(api_key=account["api_key"],base_url=account["base_url"])
+        self.cache = get_response_cache(ST)
         if sysprompt is not None:
             self.base_message.append({"role": "system", "content": sysprompt})
         self.logger = logging.getLogger(__name__)
@@ -55,65 +121,265 @@ class LLMCaller:
             self.change_account()
             raise ValueError("Empty response from API")
         
-    def _filter_code(self, output:str) -> str:
-        # extract java code from output
-        java_pattern = r"```(?:[jJ]ava)?\n+([\s\S]*?)\n```"
-        code = ""
-        matches = re.findall(java_pattern, output, re.DOTALL)
-        if len(matches) == 0:
-            # if no code found, fix incomplete code
-            incomplete_pattern = r"```(?:[jJ]ava)?\n+([\s\S]*?)$"
-            icp_matches = re.findall(incomplete_pattern, output, re.DOTALL)
-            if len(icp_matches) > 0:
-                icp_code:str = icp_matches[0]
-                # remove last @Test function
-                last_test_pos = icp_code.rfind("@Test")
-                code = icp_code[:last_test_pos] if last_test_pos != -1 else icp_code
-                # check if code has unmatched braces
-                open_braces = code.count('{')
-                close_braces = code.count('}')
-                if open_braces > close_braces:
-                    code = code + "}" * (open_braces - close_braces)
-        else:
-            # select the longest one in matches
-            code = max(matches, key=len)
-        return code
-    
-    # get response surrounded by ```java````
-    def get_response_code(self, prompt:str) -> list:
+    # get response surrounded by ```java````, attempt: index of a retry of the same prompt (cached separately)
+    def get_response_code(self, prompt:str, attempt:int=0) -> list:
         try:
-            response = self._generation(prompt)
+            key, response = self._cache_lookup(prompt, attempt=attempt)
+            if response is None:
+                response = self._generation(prompt)
+                self._cache_store(key, response)
             code = self._filter_code(response)
             return [code, response]
         except Exception as e:
             self.logger.error(f"Error occured while get code from llm api: {e}")
             return ["",""]
 
-    # split json object from response
-    def _handle_json_response(self, response):
-        # self.logger.debug(f"Response: {response}")
-        json_str = re.sub(r' //.*', '', response)
-        json_pattern = r"```(?:[jJ]son)?\n+([\s\S]*?)\n```"
-        matches = re.findall(json_pattern, json_str, re.DOTALL)
-        if len(matches)>0:
-            json_str = max(matches, key=len)
-        obj = json.loads(json_str)
-        self.logger.debug(f"Json object: {obj}")
-        return obj
-    
     # get response in json format
-    def get_response_json(self, prompt:str):
+    def get_response_json(self, prompt:str, attempt:int=0):
         json_data = None
         response = ""
         try:
             response_format = { 'type': 'json_object' }
-            response = self._generation(prompt, response_format) 
-            json_data = self._handle_json_response(response)    
+            key, response = self._cache_lookup(prompt, response_format, attempt)
+            if response is None:
+                response = self._generation(prompt, response_format)
+                json_data = self._handle_json_response(response)
+                # responses which are not valid json are not cached
+                self._cache_store(key, response)
+            else:
+                json_data = self._handle_json_response(response)
         except Exception as e:
             self.logger.error(f"Error occured while get json object from llm api: {e}")
         return [json_data, response]
 
 
+class TokenBucket:
+    '''
+    rate limiter refilled with `per_minute` units per minute, at most `per_minute` units are available
+    '''
+    def __init__(self, per_minute:float|None):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount:float) -> float:
+        '''
+        seconds until `amount` units are available, requests larger than the capacity wait for a full bucket
+        '''
+        if self.capacity is None: return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount: return 0.0
+        return (amount - self.tokens) * 60 / self.capacity
+
+    def consume(self, amount:float):
+        # may go below zero when the actual usage is larger than estimated
+        if self.capacity is None: return
+        self._refill()
+        self.tokens -= amount
+
+
+def retry_after_seconds(value:str|None) -> float|None:
+    '''
+    seconds of a Retry-After header, given as seconds or as an HTTP date; None if missing or invalid
+    '''
+    if not value: return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None: date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class AccountState:
+    '''
+    an account in API_ACCOUNTS, optional keys "rpm" / "tpm": requests / tokens per minute
+    '''
+    def __init__(self, account:dict, http_client:httpx.AsyncClient):
+        self.base_url = account["base_url"]
+        self.client = AsyncOpenAI(api_key=account["api_key"], base_url=account["base_url"] or None, http_client=http_client)
+        self.requests = TokenBucket(account.get("rpm"))
+        self.tokens = TokenBucket(account.get("tpm"))
+        self.cooldown_until = 0.0
+
+    def wait_time(self, estimated_tokens:int) -> float:
+        cooldown = max(0.0, self.cooldown_until - time.monotonic())
+        return max(cooldown, self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+
+
+class AsyncLLMCaller(ResponseParser):
+    '''
+    asyncio based LLM caller: all accounts share one pooled HTTP client (keep-alive),
+    requests are limited by the rpm/tpm of the accounts and fail over to other accounts,
+    at most `max_connections` requests are sent at the same time, the others wait on the event loop
+    '''
+    accounts: list[AccountState]
+    http_client: httpx.AsyncClient
+
+    def __init__(self, sysprompt = None, max_connections:int = 64) -> None:
+        self.model = ST.MODEL
+        self.temperature = ST.TEMPERATURE
+        self.completion_tokens = getattr(ST, "ESTIMATED_COMPLETION_TOKENS", 1024)
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(600.0, connect=10.0))
+        self.accounts = [AccountState(account, self.http_client) for account in ST.API_ACCOUNTS]
+        self.slots = asyncio.Semaphore(max_connections)
+        self.cache = get_response_cache(ST)
+        self.next_account = 0
+        self.base_message = []
+        if sysprompt is not None:
+            self.base_message.append({"role": "system", "content": sysprompt})
+        self.logger = logging.getLogger(__name__)
+        self.logger.info(f"async LLM API initialized, model name: {self.model}, {len(self.accounts)} accounts.")
+
+    async def _acquire_account(self, estimated_tokens:int) -> AccountState:
+        while True:
+            # round robin over the accounts which can serve the request first
+            count = len(self.accounts)
+            order = [self.accounts[(self.next_account + i) % count] for i in range(count)]
+            account = min(order, key=lambda acc: acc.wait_time(estimated_tokens))
+            wait = account.wait_time(estimated_tokens)
+            if wait <= 0:
+                account.requests.consume(1)
+                account.tokens.consume(estimated_tokens)
+                self.next_account = (self.accounts.index(account) + 1) % count
+                return account
+            await asyncio.sleep(wait)
+
+    def _fail_over(self, account:AccountState, seconds:float):
+        account.cooldown_until = time.monotonic() + seconds
+        if len(self.accounts) > 1:
+            self.logger.info(f"account {self.accounts.index(account)} cooling down for {seconds:.1f}s, fail over to other accounts")
+        return
+
+    @retry(wait=wait_random_exponential(min=1, max=30), stop=stop_after_attempt(3))
+    async def _generation(self, prompt:str, rps_format:dict|Omit=omit) -> str:
+        messages = self.base_message.copy()
+        messages.append({"role": "user", "content": prompt})
+        estimated_tokens = len(prompt) // 4 + self.completion_tokens
+        async with self.slots:
+            account = await self._acquire_account(estimated_tokens)
+            try:
+                response = await account.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    response_format = rps_format,  # pyright: ignore[reportArgumentType]
+                    temperature=self.temperature,
+                )
+            except RateLimitError as e:
+                retry_after = retry_after_seconds(e.response.headers.get("retry-after"))
+                self._fail_over(account, retry_after if retry_after is not None else 20.0 + random.random() * 10)
+                raise
+            except (APIConnectionError, APITimeoutError, InternalServerError):
+                self._fail_over(account, 5.0)
+                raise
+        if response.usage is not None:
+            account.tokens.consume(response.usage.total_tokens - estimated_tokens)
+        if response.choices[0].message.content:
+            return response.choices[0].message.content
+        else:
+            self._fail_over(account, 5.0)
+            raise ValueError("Empty response from API")
+
+    async def get_response_code(self, prompt:str, attempt:int=0) -> list:
+        try:
+            key, response = self._cache_lookup(prompt, attempt=attempt)
+            if response is None:
+                response = await self._generation(prompt)
+                self._cache_store(key, response)
+            code = self._filter_code(response)
+            return [code, response]
+        except Exception as e:
+            self.logger.error(f"Error occured while get code from llm api: {e}")
+            return ["",""]
+
+    async def get_response_json(self, prompt:str, attempt:int=0):
+        json_data = None
+        response = ""
+        try:
+            response_format = { 'type': 'json_object' }
+            key, response = self._cache_lookup(prompt, response_format, attempt)
+            if response is None:
+                response = await self._generation(prompt, response_format)
+                json_data = self._handle_json_response(response)
+                self._cache_store(key, response)
+            else:
+                json_data = self._handle_json_response(response)
+        except Exception as e:
+            self.logger.error(f"Error occured while get json object from llm api: {e}")
+        return [json_data, response]
+
+    async def close(self):
+        await self.http_client.aclose()
+
+
+class SharedLLMCaller:
+    '''
+    one AsyncLLMCaller on a background event loop: coroutines of the LLM stages are submitted to the loop
+    (see procedure.generate_code.submit_stage), so requests in flight are bounded by the connections and
+    the rate limits of the accounts; the synchronous methods block the calling thread for one request
+    '''
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="llm-event-loop", daemon=True)
+        self.thread.start()
+        max_connections = getattr(ST, "MAX_CONNECTIONS", 64)
+        self.caller = self._run(self._create_caller(max_connections))
+
+    async def _create_caller(self, max_connections):
+        return AsyncLLMCaller(max_connections=max_connections)
+
+    def submit(self, coroutine) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def _run(self, coroutine):
+        return self.submit(coroutine).result()
+
+    def get_response_code(self, prompt:str, attempt:int=0) -> list:
+        return self._run(self.caller.get_response_code(prompt, attempt))
+
+    def get_response_json(self, prompt:str, attempt:int=0):
+        return self._run(self.caller.get_response_json(prompt, attempt))
+
+
+def get_shared_llm_caller() -> SharedLLMCaller|None:
+    '''
+    the shared async caller if LLMSettings.ASYNC_CLIENT, otherwise None
+    '''
+    if getattr(ST, "ASYNC_CLIENT", False):
+        return SharedLLMCaller.get()
+    return None
+
+
+def get_llm_caller() -> LLMCaller|SharedLLMCaller:
+    '''
+    LLM caller for a worker: the shared async caller if LLMSettings.ASYNC_CLIENT, otherwise a new LLMCaller
+    '''
+    shared_caller = get_shared_llm_caller()
+    return shared_caller if shared_caller is not None else LLMCaller()
+
+
 # test
 if __name__ == '__main__':
     import sys
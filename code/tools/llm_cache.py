@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+'''
+Persistent cache of LLM responses, keyed by the sha256 of the request:
+    model, temperature, response_format, messages (and the attempt of retried requests)
+entries are evicted in least-recently-used order when the cache grows over max_bytes.
+'''
+
+
+def request_key(model:str, temperature:float, response_format, messages:list, attempt:int=0) -> str:
+    '''
+    attempt: index of a retry of the same request, retries are cached as different samples
+    '''
+    request = {
+        "model": model,
+        "temperature": temperature,
+        "response_format": response_format if isinstance(response_format, dict) else None,
+        "messages": messages,
+    }
+    if attempt > 0: request["attempt"] = attempt
+    text = json.dumps(request, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    '''
+    SQLite store shared by the worker threads of a process
+    '''
+    path: str
+    max_bytes: int
+    hits: int
+    misses: int
+
+    def __init__(self, path:str, max_bytes:int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder): os.makedirs(folder)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.logger = logging.getLogger(__name__)
+
+    def get(self, key:str) -> str|None:
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return row[0]
+
+    def put(self, key:str, response:str):
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is not None: self.total_bytes -= old[0]
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, response, size, time.time()))
+            self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+        return
+
+    def _evict(self):
+        # drop least recently used entries until the cache fits in 90% of max_bytes
+        target = self.max_bytes * 0.9
+        removed = 0
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if self.total_bytes <= target: break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.total_bytes -= size
+            removed += 1
+        self.logger.debug(f"evicted {removed} cached responses, {self.total_bytes} bytes left")
+        return
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": self.total_bytes}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+        return
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(settings) -> ResponseCache|None:
+    '''
+    process-wide cache of LLMSettings, None if RESPONSE_CACHE is disabled;
+    RESPONSE_CACHE = None enables the cache only for deterministic sampling (TEMPERATURE 0)
+    '''
+    enabled = getattr(settings, "RESPONSE_CACHE", None)
+    if enabled is None: enabled = getattr(settings, "TEMPERATURE", 0) == 0
+    if not enabled: return None
+    path = getattr(settings, "CACHE_PATH", "../evaluation/llm_cache.sqlite")
+    with _caches_lock:
+        if path not in _caches:
+            max_bytes = int(getattr(settings, "CACHE_MAX_MB", 1024) * 1024 * 1024)
+            _caches[path] = ResponseCache(path, max_bytes)
+    return _caches[path]
@@ -0,0 +1,150 @@
+import os
+import glob
+import queue
+import shutil
+import logging
+import contextlib
+
+import tools.io_utils as io_utils
+
+'''
+Sandboxes of a project for verifying test classes concurrently.
+A sandbox is a folder with the layout of the project:
+    {project}/target/utgen-sandbox/<index>/
+        dependencies.txt, libs/, src/main -> shared with the project (symlink, or hard-linked copy)
+        target/classes/                   -> hard-linked copy of the project classes
+        src/test/, target/test-classes/   -> private, emptied before each task
+Results of the tasks are staged in {project}/target/utgen-sandbox/results/<test class>/
+and merged back into the project in dataset order.
+'''
+SANDBOX_FOLDER = "target/utgen-sandbox"
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _share_dir(source_dir, target_dir):
+    if not os.path.exists(source_dir): return
+    try:
+        os.symlink(os.path.abspath(source_dir), target_dir, target_is_directory=True)
+    except OSError:
+        # symlinks need extra privileges on windows
+        shutil.copytree(source_dir, target_dir, copy_function=_link_or_copy, dirs_exist_ok=True)
+    return
+
+
+class ProjectSandbox:
+    index: int
+    project_path: str
+    root: str
+
+    def __init__(self, project_path:str, index:int):
+        self.index = index
+        self.project_path = project_path
+        self.root = f"{project_path}/{SANDBOX_FOLDER}/{index}"
+
+    def prepare(self):
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
+        os.makedirs(f"{self.root}/src")
+        shutil.copytree(f"{self.project_path}/target/classes", f"{self.root}/target/classes", copy_function=_link_or_copy)
+        _share_dir(f"{self.project_path}/libs", f"{self.root}/libs")
+        _share_dir(f"{self.project_path}/src/main", f"{self.root}/src/main")
+        io_utils.copy_file(f"{self.project_path}/dependencies.txt", f"{self.root}/dependencies.txt")
+        self.reset()
+        return
+
+    def reset(self):
+        for folder in ["src/test", "target/test-classes"]:
+            path = f"{self.root}/{folder}"
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.makedirs(path)
+        return
+
+
+class SandboxManager:
+    '''
+    a pool of sandboxes, each worker acquires one sandbox per task
+    '''
+    project_path: str
+    sandboxes: list[ProjectSandbox]
+    result_path: str
+
+    def __init__(self, project_path:str, size:int):
+        self.project_path = project_path
+        self.sandboxes = [ProjectSandbox(project_path, i) for i in range(size)]
+        self.result_path = f"{project_path}/{SANDBOX_FOLDER}/results"
+        self.available = queue.Queue()
+        self.prepared = False
+        self.logger = logging.getLogger(__name__)
+
+    def prepare(self):
+        if os.path.exists(self.result_path):
+            shutil.rmtree(self.result_path)
+        for sandbox in self.sandboxes:
+            sandbox.prepare()
+            self.available.put(sandbox)
+        self.prepared = True
+        return
+
+    def acquire(self) -> ProjectSandbox:
+        sandbox = self.available.get()
+        sandbox.reset()
+        return sandbox
+
+    def release(self, sandbox:ProjectSandbox):
+        self.available.put(sandbox)
+        return
+
+    @contextlib.contextmanager
+    def sandbox(self):
+        sandbox = self.acquire()
+        try:
+            yield sandbox
+        finally:
+            self.release(sandbox)
+
+    def _class_files(self, root, test_class):
+        class_file = f"{root}/target/test-classes/{test_class.replace('.', '/')}"
+        return glob.glob(glob.escape(class_file) + ".class") + glob.glob(glob.escape(class_file) + "$*.class")
+
+    def collect(self, sandbox:ProjectSandbox, test_path:str, test_class:str):
+        '''
+        stage the test source and the compiled classes of a task before the sandbox is reused
+        '''
+        stage = f"{self.result_path}/{test_class}"
+        if os.path.exists(stage):
+            shutil.rmtree(stage)
+        source = f"{sandbox.root}/{test_path}"
+        if os.path.exists(source):
+            io_utils.copy_file(source, f"{stage}/{test_path}")
+        for class_file in self._class_files(sandbox.root, test_class):
+            relative = os.path.relpath(class_file, sandbox.root)
+            io_utils.copy_file(class_file, f"{stage}/{relative}")
+        return
+
+    def merge(self, test_infos:list):
+        '''
+        copy staged results to the project, in the order of test_infos
+        '''
+        for test_info in test_infos:
+            stage = f"{self.result_path}/{test_info['test-class']}"
+            if not os.path.exists(stage): continue
+            source = f"{stage}/{test_info['test-path']}"
+            if os.path.exists(source):
+                io_utils.copy_file(source, f"{self.project_path}/{test_info['test-path']}")
+            for class_file in self._class_files(stage, test_info["test-class"]):
+                relative = os.path.relpath(class_file, stage)
+                io_utils.copy_file(class_file, f"{self.project_path}/{relative}")
+        self.logger.info(f"merged sandbox results of {len(test_infos)} test classes into {self.project_path}")
+        return
+
+    def cleanup(self):
+        shutil.rmtree(f"{self.project_path}/{SANDBOX_FOLDER}", ignore_errors=True)
+        return
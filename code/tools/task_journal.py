@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+
+import tools.io_utils as io_utils
+from settings import LLMSettings as ST
+
+'''
+Append-only journal of the generation stages of a project, one json line per finished attempt:
+    {"id": <focal method id>, "stage": "gencode", "status": "done"|"failed",
+     "inputs": {<path or @stage>: <digest>}, "outputs": {<path>: <digest>}, "time": ...}
+inputs are the files read by the stage, the output digests of the stages it depends on and
+the digest of the generation settings ("@settings", see `generation_settings`),
+outputs of done stages are checkpointed in <journal>/objects/<digest>, so a later stage can
+be re-run on the outputs of its dependencies after downstream stages have changed the files.
+A stage is up to date if its last record is done and its inputs did not change.
+A stage that wrote its outputs but missed some responses returns a `PartialResult`: it is recorded
+as failed, so a resumed run retries it, and the task goes on with the partial outputs.
+'''
+STAGES = ["framework", "cases", "gencode", "verify"]
+
+
+def stage_dependencies(case_then_code:bool) -> dict[str, list[str]]:
+    if case_then_code:
+        return {"framework": [], "cases": [], "gencode": ["framework", "cases"], "verify": ["gencode"]}
+    # test cases are inserted into the framework directly
+    return {"framework": [], "cases": ["framework"], "verify": ["cases"]}
+
+
+def stage_files(stage:str, test_info:dict, project_prompt:str, project_response:str, gen_folder:str, prompt_list:list):
+    '''
+    (input files, output files) of a stage of a focal method
+    '''
+    tid = test_info["id"]
+    test_class = f"{gen_folder}/{test_info['test-class'].split('.')[-1]}.java"
+    if stage == "framework":
+        return [f"{project_prompt}/{tid}/init_prompt.md"], [test_class]
+    if stage == "cases":
+        prompts = [f"{project_prompt}/{tid}/{name}_prompt.md" for name in prompt_list if name != "gencode"]
+        if "gencode" in prompt_list:
+            return prompts, [f"{project_response}/{tid}/cases.json"]
+        return prompts, [test_class]
+    if stage == "gencode":
+        return [f"{project_prompt}/{tid}/gencode_prompt.md"], [test_class]
+    return [], [test_class]
+
+
+def generation_settings(task_setting) -> dict:
+    '''
+    settings which change the responses of the stages, a stage is run again when they change
+    '''
+    return {
+        "model": ST.MODEL,
+        "temperature": ST.TEMPERATURE,
+        "prompt_list": list(task_setting.PROMPT_LIST),
+        "case_then_code": task_setting.CASE_THEN_CODE,
+        "sim_top_k": getattr(task_setting, "SIM_TOP_K", None),
+        "fix_tries": getattr(task_setting, "FIX_TRIES", None),
+    }
+
+
+def file_digest(path:str) -> str|None:
+    if not os.path.exists(path): return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _outputs_digest(outputs:dict) -> str:
+    return hashlib.sha256(json.dumps(outputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class PartialResult:
+    value: object
+    reason: str
+
+    def __init__(self, value, reason:str):
+        self.value = value
+        self.reason = reason
+
+
+def result_value(result):
+    # the result of a stage run without a journal
+    return result.value if isinstance(result, PartialResult) else result
+
+
+class TaskJournal:
+    folder: str
+    dependencies: dict[str, list[str]]
+    resume: bool
+    records: dict[tuple[str, str], dict]
+
+    def __init__(self, folder:str, dependencies:dict[str, list[str]], resume:bool=True, settings:dict|None=None):
+        '''
+        settings: generation settings, part of the inputs of every stage
+        '''
+        self.folder = folder
+        self.settings_digest = _outputs_digest(settings or {})
+        self.path = f"{folder}/journal.jsonl"
+        self.object_path = f"{folder}/objects"
+        self.dependencies = dependencies
+        self.resume = resume
+        self.records = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        if not os.path.exists(self.object_path): os.makedirs(self.object_path)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path): return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of an interrupted run may be incomplete
+                    continue
+                self.records[(record["id"], record["stage"])] = record
+        return
+
+    def _upstream_stages(self, stage:str) -> list[str]:
+        # dependencies of a stage, transitively, in stage order
+        upstream = set()
+        queue = list(self.dependencies.get(stage, []))
+        while len(queue) > 0:
+            dep = queue.pop()
+            if dep in upstream: continue
+            upstream.add(dep)
+            queue.extend(self.dependencies.get(dep, []))
+        return [s for s in STAGES if s in upstream]
+
+    def inputs_of(self, task_id:str, stage:str, input_files:list[str]) -> dict:
+        inputs = {path: file_digest(path) for path in input_files}
+        inputs["@settings"] = self.settings_digest
+        for dep in self.dependencies.get(stage, []):
+            record = self.records.get((task_id, dep))
+            done = record is not None and record["status"] == "done"
+            inputs[f"@{dep}"] = _outputs_digest(record["outputs"]) if done else None
+        return inputs
+
+    def up_to_date(self, task_id:str, stage:str, inputs:dict) -> bool:
+        record = self.records.get((task_id, stage))
+        if record is None or record["status"] != "done": return False
+        if None in inputs.values(): return False
+        return record["inputs"] == inputs and all(
+            os.path.exists(f"{self.object_path}/{digest}") for digest in record["outputs"].values())
+
+    def restore(self, task_id:str, stages:list[str]):
+        '''
+        write the checkpointed outputs of done stages back, later stages overwrite earlier ones
+        '''
+        for stage in stages:
+            record = self.records.get((task_id, stage))
+            if record is None or record["status"] != "done": continue
+            for path, digest in record["outputs"].items():
+                if file_digest(path) == digest: continue
+                io_utils.copy_file(f"{self.object_path}/{digest}", path)
+        return
+
+    def record(self, task_id:str, stage:str, status:str, inputs:dict, output_files:list[str]):
+        outputs = {}
+        if status == "done":
+            for path in output_files:
+                digest = file_digest(path)
+                if digest is None: continue
+                outputs[path] = digest
+                checkpoint = f"{self.object_path}/{digest}"
+                if not os.path.exists(checkpoint): io_utils.copy_file(path, checkpoint)
+        record = {"id": task_id, "stage": stage, "status": status, "inputs": inputs, "outputs": outputs, "time": time.time()}
+        with self.lock:
+            self.records[(task_id, stage)] = record
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return
+
+    def _begin(self, task_id:str, stage:str, input_files:list[str]) -> tuple[bool, dict]:
+        # -> (up to date, inputs), the outputs of the stage or its dependencies are restored
+        inputs = self.inputs_of(task_id, stage, input_files)
+        if self.resume and self.up_to_date(task_id, stage, inputs):
+            # a re-run upstream stage may have overwritten the outputs with its own
+            self.restore(task_id, [stage])
+            self.logger.debug(f"stage {stage} of {task_id} is up to date, skipped")
+            return True, inputs
+        if self.resume:
+            self.restore(task_id, self._upstream_stages(stage))
+        return False, inputs
+
+    def _status(self, task_id:str, stage:str, result) -> tuple[str, object]:
+        # -> (status, value) of the result of a stage
+        if isinstance(result, PartialResult):
+            self.logger.warning(f"stage {stage} of {task_id} is incomplete: {result.reason}")
+            return "failed", result.value
+        return "done", result
+
+    def run(self, task_id:str, stage:str, input_files:list[str], output_files:list[str], func, *args, **kwargs):
+        '''
+        run func(*args, **kwargs) as a stage of a task unless it is up to date -> (skipped, result)
+        '''
+        skipped, inputs = self._begin(task_id, stage, input_files)
+        if skipped: return True, None
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record(task_id, stage, "failed", inputs, output_files)
+            raise
+        status, result = self._status(task_id, stage, result)
+        self.record(task_id, stage, status, inputs, output_files)
+        return False, result
+
+    async def arun(self, task_id:str, stage:str, input_files:list[str], output_files:list[str], func, *args, **kwargs):
+        '''
+        `run` for a coroutine function, the journal files are read & written in a thread
+        '''
+        skipped, inputs = await asyncio.to_thread(self._begin, task_id, stage, input_files)
+        if skipped: return True, None
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            await asyncio.to_thread(self.record, task_id, stage, "failed", inputs, output_files)
+            raise
+        status, result = self._status(task_id, stage, result)
+        await asyncio.to_thread(self.record, task_id, stage, status, inputs, output_files)
+        return False, result
+
+
+def open_journal(file_structure, task_setting, pj_name:str) -> TaskJournal:
+    folder = getattr(file_structure, "JOURNAL_PATH", "../evaluation/<project>/journal").replace("<project>", pj_name)
+    dependencies = stage_dependencies(task_setting.CASE_THEN_CODE)
+    return TaskJournal(folder, dependencies, getattr(task_setting, "RESUME", False), generation_settings(task_setting))